@@ -0,0 +1,198 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from src.db_manager import DBManager
+from src.interpreter import RuntimeEngine
+from src.loader import load_script
+from src.trace import MemorySink, Tracer
+from tests.mocks import MockLLMService, TestAdapter
+
+# One conversation per JSONL line:
+#   {"id": "topup-1", "script": "customer_server.bot", "bot": "custBot",
+#    "inputs": ["13900139000", "充值", "100", "没有了"],
+#    "intents": {"随便聊聊": "人工服务"},
+#    "expect": {"outputs": ["充值成功"], "not_outputs": ["余额不足"],
+#               "states": ["TopUpFlow", "AskContinue"], "final": "Exit"}}
+# `bot` defaults to the script's first bot; `intents` overrides the mock LLM
+# for exact inputs. `outputs` and `states` must appear in that order.
+
+_worker = {}
+
+
+class BatchLLM(MockLLMService):
+    def __init__(self, overrides=None):
+        super().__init__()
+        self.overrides = overrides or {}
+
+    def detect_intent(self, user_input, candidates):
+        intent = self.overrides.get(user_input)
+        if intent is not None: return intent if intent in candidates else "UNKNOWN"
+        return super().detect_intent(user_input, candidates)
+
+
+def load_fixture(path):
+    # The fixture (a SQLite file or a .sql script) is read into memory once
+    # per worker; every conversation gets its own copy of it.
+    master = sqlite3.connect(':memory:', check_same_thread=False)
+    if path.endswith('.sql'):
+        with open(path, 'r', encoding='utf-8') as f:
+            master.executescript(f.read())
+    else:
+        src = sqlite3.connect(path)
+        try:
+            src.backup(master)
+        finally:
+            src.close()
+    return master
+
+
+def _init_worker(scripts_dir, fixture, quiet):
+    if quiet: sys.stdout = open(os.devnull, 'w')
+    _worker['scripts_dir'] = scripts_dir
+    _worker['fixture'] = load_fixture(fixture) if fixture else None
+    _worker['programs'] = {}
+
+
+def _compiled(script):
+    # Flows are compiled once per worker and script.
+    compiled = _worker['programs'].get(script)
+    if compiled is None:
+        compiled = _worker['programs'][script] = load_script(os.path.join(_worker['scripts_dir'], script))
+    return compiled
+
+
+def _fresh_db():
+    if _worker['fixture'] is None: return None
+    db = DBManager(':memory:')
+    _worker['fixture'].backup(db.conn)
+    return db
+
+
+def _in_order(expected, seen, match):
+    # The first expected item not found, in order, in `seen`; None if all are.
+    it = iter(seen)
+    for item in expected:
+        if not any(match(item, s) for s in it): return item
+    return None
+
+
+def check(expect, outputs, states, final):
+    failures = []
+    missing = _in_order(expect.get('outputs', ()), outputs, lambda want, text: want in text)
+    if missing is not None: failures.append(f"missing output {missing!r}")
+    for unwanted in expect.get('not_outputs', ()):
+        if any(unwanted in text for text in outputs): failures.append(f"unexpected output {unwanted!r}")
+    missing = _in_order(expect.get('states', ()), states, lambda want, state: want == state)
+    if missing is not None: failures.append(f"state {missing!r} not visited")
+    if 'final' in expect and expect['final'] != final:
+        failures.append(f"ended in {final!r}, expected {expect['final']!r}")
+    return failures
+
+
+def run_conversation(conv):
+    started = time.perf_counter()
+    result = {"id": conv.get("id"), "ok": False}
+    try:
+        flows, programs = _compiled(conv["script"])
+        bot = conv.get("bot") or next(iter(flows))
+        sink = MemorySink()
+        db = _fresh_db()
+        engine = RuntimeEngine(flows, db_manager=db, io_adapter=TestAdapter([]), programs=programs,
+                               tracer=Tracer(sink))
+        engine.set_llm_service(BatchLLM(conv.get("intents")))
+        gen = engine.session(bot)
+        inputs = list(conv.get("inputs", ()))
+        try:
+            next(gen)
+            while True:
+                gen.send(inputs.pop(0) if inputs else "EXIT")
+        except StopIteration:
+            pass
+        finally:
+            gen.close()
+            if db: db.close()
+        events = sink.trace["events"]
+        outputs = [e[1] for e in events if e[0] == 'o']
+        states = [e[1] for e in events if e[0] == 's']
+        result["final"] = sink.trace["final"]
+        result["failures"] = check(conv.get("expect", {}), outputs, states, result["final"])
+        result["ok"] = not result["failures"]
+        if inputs: result["unused_inputs"] = len(inputs)
+    except Exception as e:
+        result["failures"] = [f"{type(e).__name__}: {e}"]
+    result["ms"] = round((time.perf_counter() - started) * 1000, 3)
+    return result
+
+
+def load_conversations(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for n, line in enumerate(f, 1):
+            if not line.strip(): continue
+            conv = json.loads(line)
+            conv.setdefault("id", n)
+            yield conv
+
+
+def run_batch(path, scripts_dir, fixture=None, jobs=None, chunksize=64, on_result=None, quiet=True):
+    total = passed = 0
+    failed = []
+    started = time.perf_counter()
+    with multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(scripts_dir, fixture, quiet)) as pool:
+        for result in pool.imap_unordered(run_conversation, load_conversations(path), chunksize):
+            total += 1
+            if result["ok"]:
+                passed += 1
+            else:
+                failed.append(result["id"])
+            if on_result: on_result(result)
+    elapsed = time.perf_counter() - started
+    return {
+        "conversations": total,
+        "passed": passed,
+        "failed": total - passed,
+        "failed_ids": failed[:100],
+        "elapsed_s": round(elapsed, 3),
+        "conversations_per_s": round(total / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run scripted conversations from a JSONL file on a process pool.")
+    parser.add_argument('conversations', help="JSONL file, one conversation per line")
+    parser.add_argument('--scripts-dir', default=os.path.join(PROJECT_ROOT, 'examples'))
+    parser.add_argument('--db', help="fixture database (SQLite file or .sql script), copied per conversation")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--chunksize', type=int, default=64)
+    parser.add_argument('-o', '--output', help="stream per-conversation results here as JSONL (default: stdout)")
+    parser.add_argument('--failures-only', action='store_true', help="only stream failed conversations")
+    parser.add_argument('-v', '--verbose', action='store_true', help="keep the engine's console output")
+    args = parser.parse_args(argv)
+
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+
+    def emit(result):
+        if args.failures_only and result["ok"]: return
+        out.write(json.dumps(result, ensure_ascii=False) + '\n')
+        out.flush()
+
+    try:
+        summary = run_batch(args.conversations, args.scripts_dir, args.db, args.jobs, args.chunksize, emit,
+                            quiet=not args.verbose)
+    finally:
+        if args.output: out.close()
+    print(json.dumps({"summary": summary}, ensure_ascii=False), file=sys.stderr)
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,59 @@
+import argparse
+import json
+import os
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from src.db_manager import DBManager
+from src.index_advisor import advise, create_indexes, format_report
+from src.loader import load_script
+
+
+def run(scripts, db_path, create=False):
+    reports = {}
+    db = DBManager(db_path)
+    try:
+        for path in scripts:
+            flows, _ = load_script(path)
+            reports[os.path.basename(path)] = report = advise(db, flows)
+            if create: create_indexes(db, report)
+    finally:
+        db.close()
+    return reports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="EXPLAIN every SQL statement of the bot scripts against a database and report the tables "
+                    "they read in full, with the indexes that would avoid it.")
+    parser.add_argument('scripts', nargs='*', help="bot scripts (default: examples/*.bot)")
+    parser.add_argument('--db', default='bot_data.db', help="SQLite database the bots run against")
+    parser.add_argument('--create', action='store_true',
+                        help="create the proposed indexes the planner would use (locks each table while it builds)")
+    parser.add_argument('--json', help="also write the reports to this file")
+    parser.add_argument('-v', '--verbose', action='store_true', help="list every statement with its query plan")
+    args = parser.parse_args(argv)
+
+    scripts = args.scripts or sorted(os.path.join(PROJECT_ROOT, 'examples', f)
+                                     for f in os.listdir(os.path.join(PROJECT_ROOT, 'examples')) if f.endswith('.bot'))
+    reports = run(scripts, args.db, args.create)
+    for name, report in reports.items():
+        print(f"== {name} ({args.db})")
+        for line in format_report(report, args.verbose):
+            print(line)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, indent=2, ensure_ascii=False)
+    # Non-zero while some statement still scans a table or cannot be planned.
+    created = {i["name"] for r in reports.values() for i in r["indexes"] if i["created"]}
+    pending = any(r["errors"] or any(s["scans"] and s["index"] not in created for s in r["statements"])
+                  for r in reports.values())
+    return 1 if pending else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
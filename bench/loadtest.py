@@ -0,0 +1,364 @@
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from http.cookiejar import CookieJar
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from src.db_manager import DBManager, get_pool
+from src.interpreter import RuntimeEngine
+from src.loader import load_script
+from src.sessions import SessionManager
+from src.web import WebAdapter
+from tests.mocks import MockLLMService
+
+# Scripted user turns per example bot; {phone} is one of the seeded users.
+# Some turns hit DSL keywords, others ("流量") fall through to the LLM.
+CONVERSATIONS = {
+    'customer_server.bot': ["{phone}", "查话费", "还有", "流量", "还有", "充值", "50", "没有了"],
+    'profile_manager.bot': ["{phone}", "4512", "修改邮箱", "load@example.com", "退出"],
+}
+SEEDED_USERS = 1000
+TURN_TIMEOUT = 30
+
+
+class SlowLLM(MockLLMService):
+    def __init__(self, latency=0.0):
+        super().__init__()
+        self.latency = latency
+
+    def detect_intent(self, user_input, candidates):
+        if self.latency: time.sleep(self.latency)
+        return super().detect_intent(user_input, candidates)
+
+
+class SlowDB(DBManager):
+    # Adds a fixed delay to every statement, like a remote database would.
+    def __init__(self, db_path, latency=0.0, pool=None):
+        super().__init__(db_path, pool=pool)
+        self.latency = latency
+
+    def fetch_row(self, sql, params=None):
+        if self.latency: time.sleep(self.latency)
+        return super().fetch_row(sql, params)
+
+    def execute(self, sql, params=None):
+        if self.latency: time.sleep(self.latency)
+        return super().execute(sql, params)
+
+
+def phone_for(i):
+    return f"138{i % SEEDED_USERS:08d}"
+
+
+def seed_database(path, users=SEEDED_USERS):
+    db = DBManager(path)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            phone TEXT PRIMARY KEY,
+            name TEXT,
+            balance REAL,
+            data_left REAL,
+            package_name TEXT,
+            broadband_status INT,
+            id_card TEXT,
+            email TEXT,
+            address TEXT,
+            city TEXT
+        )
+    """)
+    with db.transaction():
+        for i in range(users):
+            db.execute("INSERT OR REPLACE INTO users VALUES (?,?,?,?,?,?,?,?,?,?)",
+                       (phone_for(i), f"用户{i}", 1000.0, 50.0, "5G畅享套餐", 0, "4512", f"u{i}@example.com",
+                        "北京市海淀区", "北京"))
+    db.close()
+
+
+def percentile(ordered, p):
+    if not ordered: return 0.0
+    return ordered[max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered))) - 1))]
+
+
+def rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Sampler(threading.Thread):
+    def __init__(self, interval=0.05):
+        super().__init__(name='loadtest-sampler', daemon=True)
+        self.interval = interval
+        self.peak_threads = threading.active_count()
+        self.peak_rss = rss_bytes()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+            self.peak_rss = max(self.peak_rss, rss_bytes())
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _turn_over(msgs):
+    # None while the bot is still talking, else whether the session ended.
+    ended = None
+    for m in msgs:
+        if m.get("action") == "wait_input":
+            ended = False
+        elif m.get("content") == "Session Ended" or m.get("action") == "reload":
+            return True
+    return ended
+
+
+def wait_turn(fetch):
+    deadline = time.monotonic() + TURN_TIMEOUT
+    while time.monotonic() < deadline:
+        ended = _turn_over(fetch())
+        if ended is not None: return ended
+    raise TimeoutError("bot did not answer in time")
+
+
+class InProcessTarget:
+    # Drives RuntimeEngine directly, with the coroutine SessionManager or the
+    # legacy thread-per-chat runtime.
+    def __init__(self, script_path, db_path, llm_latency, db_latency, runtime='coroutine', workers=8):
+        self.flows, self.programs = load_script(script_path)
+        self.bot = next(iter(self.flows))
+        self.db = SlowDB(db_path, db_latency, pool=get_pool(db_path))
+        self.llm = SlowLLM(llm_latency)
+        self.manager = SessionManager(max_workers=workers) if runtime == 'coroutine' else None
+
+    def engine(self, adapter):
+        engine = RuntimeEngine(self.flows, db_manager=self.db, io_adapter=adapter, programs=self.programs)
+        engine.set_llm_service(self.llm)
+        return engine
+
+    def converse(self, uid, inputs, record):
+        adapter = WebAdapter()
+        fetch = lambda: adapter.wait_messages(1)
+        started = time.perf_counter()
+        if self.manager:
+            self.manager.start(uid, self.engine(adapter), self.bot)
+        else:
+            threading.Thread(target=self.engine(adapter).run, args=(self.bot,), daemon=True).start()
+        try:
+            ended = wait_turn(fetch)
+            record(time.perf_counter() - started)
+            for text in inputs:
+                if ended: break
+                started = time.perf_counter()
+                if self.manager:
+                    self.manager.deliver(uid, text)
+                else:
+                    adapter.push_user_input(text)
+                ended = wait_turn(fetch)
+                record(time.perf_counter() - started)
+        finally:
+            if self.manager:
+                self.manager.stop(uid)
+            elif not ended:
+                adapter.push_user_input("EXIT")
+
+    def close(self):
+        if self.manager: self.manager.shutdown()
+
+
+class LiveClient:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+
+    def post(self, path, payload):
+        req = urllib.request.Request(self.base_url + path, data=json.dumps(payload).encode(),
+                                     headers={'Content-Type': 'application/json'})
+        with self.opener.open(req, timeout=TURN_TIMEOUT) as resp:
+            return json.loads(resp.read())
+
+    def get(self, path):
+        with self.opener.open(self.base_url + path, timeout=TURN_TIMEOUT) as resp:
+            return json.loads(resp.read())
+
+
+class FlaskClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def post(self, path, payload):
+        return self.client.post(path, json=payload).get_json()
+
+    def get(self, path):
+        return self.client.get(path).get_json()
+
+
+class HttpTarget:
+    # Drives /start_chat, /send and /poll, either of a running server
+    # (`base_url`) or of main.app in this process with mock LLM/DB latency.
+    def __init__(self, script_path, db_path, llm_latency, db_latency, base_url=None):
+        self.base_url = base_url
+        if base_url: return
+        import main
+        # Session stores and scripts go through the benchmark's paths, not
+        # ones relative to the working directory.
+        main.DB_PATH = db_path
+        main.SCRIPTS_DIR = os.path.dirname(os.path.abspath(script_path))
+        llm = SlowLLM(llm_latency)
+        main.get_llm_service = lambda: llm
+        main.get_db = lambda: SlowDB(db_path, db_latency, pool=get_pool(db_path))
+        main.load_dsl(os.path.basename(script_path))
+        self.app = main.app
+
+    def converse(self, uid, inputs, record):
+        client = LiveClient(self.base_url) if self.base_url else FlaskClient(self.app)
+        fetch = lambda: client.get('/poll?wait=5')
+        started = time.perf_counter()
+        client.post('/start_chat', {})
+        try:
+            ended = wait_turn(fetch)
+            record(time.perf_counter() - started)
+            for text in inputs:
+                if ended: break
+                started = time.perf_counter()
+                client.post('/send', {'message': text})
+                ended = wait_turn(fetch)
+                record(time.perf_counter() - started)
+        finally:
+            client.post('/reset', {})
+
+    def close(self):
+        pass
+
+
+def run_load(target, inputs, conversations, concurrency):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    counter = itertools.count()
+
+    def record(seconds):
+        with lock: latencies.append(seconds)
+
+    def client():
+        while True:
+            i = next(counter)
+            if i >= conversations: return
+            try:
+                target.converse(f"load-{i}", [t.format(phone=phone_for(i)) for t in inputs], record)
+            except Exception as e:
+                with lock: errors.append(f"{type(e).__name__}: {e}")
+
+    baseline_threads = threading.active_count()
+    sampler = Sampler()
+    sampler.start()
+    started = time.perf_counter()
+    clients = [threading.Thread(target=client, name=f'loadtest-client-{n}') for n in range(concurrency)]
+    for t in clients: t.start()
+    for t in clients: t.join()
+    elapsed = time.perf_counter() - started
+    sampler.stop()
+
+    ordered = sorted(latencies)
+    return {
+        "conversations": conversations,
+        "concurrency": concurrency,
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "turns": len(ordered),
+        "elapsed_s": round(elapsed, 3),
+        "turns_per_s": round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        "conversations_per_s": round((conversations - len(errors)) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(ordered, 50) * 1000, 2),
+            "p95": round(percentile(ordered, 95) * 1000, 2),
+            "p99": round(percentile(ordered, 99) * 1000, 2),
+            "max": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+        },
+        "threads": {"baseline": baseline_threads, "peak": sampler.peak_threads, "clients": concurrency},
+        "peak_rss_mb": round(sampler.peak_rss / 2 ** 20, 1),
+    }
+
+
+def print_report(report):
+    lat = report["latency_ms"]
+    print(f"conversations  {report['conversations']} ({report['concurrency']} concurrent), "
+          f"{report['errors']} errors")
+    print(f"turns          {report['turns']} in {report['elapsed_s']}s")
+    print(f"throughput     {report['turns_per_s']} turns/s, {report['conversations_per_s']} conversations/s")
+    print(f"turn latency   p50 {lat['p50']}ms  p95 {lat['p95']}ms  p99 {lat['p99']}ms  max {lat['max']}ms")
+    print(f"threads        peak {report['threads']['peak']} (baseline {report['threads']['baseline']}, "
+          f"{report['threads']['clients']} load clients)")
+    print(f"memory         peak RSS {report['peak_rss_mb']} MB")
+    for sample in report["error_samples"]:
+        print(f"error          {sample}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive concurrent scripted conversations against a bot.")
+    parser.add_argument('--script', default=os.path.join(PROJECT_ROOT, 'examples', 'customer_server.bot'))
+    parser.add_argument('--mode', choices=('inprocess', 'http'), default='inprocess')
+    parser.add_argument('--runtime', choices=('coroutine', 'thread'), default='coroutine',
+                        help="in-process runtime to drive")
+    parser.add_argument('--url', help="base URL of a running server (http mode); default: main.app in-process")
+    parser.add_argument('-n', '--conversations', type=int, default=200)
+    parser.add_argument('-c', '--concurrency', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=8, help="SessionManager workers (coroutine runtime)")
+    parser.add_argument('--inputs', help="'|'-separated user turns; default depends on the script")
+    parser.add_argument('--llm-latency', type=float, default=0.0, help="mock LLM delay per call, ms")
+    parser.add_argument('--db-latency', type=float, default=0.0, help="delay per SQL statement, ms")
+    parser.add_argument('--db', help="SQLite file to seed and use; default: a temporary file")
+    parser.add_argument('--json', help="also write the report to this file")
+    parser.add_argument('-v', '--verbose', action='store_true', help="keep the engine's console output")
+    args = parser.parse_args(argv)
+
+    inputs = args.inputs.split('|') if args.inputs else CONVERSATIONS.get(os.path.basename(args.script))
+    if not inputs:
+        parser.error(f"no default conversation for {args.script}; pass --inputs")
+
+    tmp = None
+    db_path = args.db
+    if db_path is None:
+        tmp = tempfile.TemporaryDirectory()
+        db_path = os.path.join(tmp.name, 'load.db')
+    seed_database(db_path)
+
+    if args.mode == 'http':
+        target = HttpTarget(args.script, db_path, args.llm_latency / 1000, args.db_latency / 1000, args.url)
+    else:
+        target = InProcessTarget(args.script, db_path, args.llm_latency / 1000, args.db_latency / 1000,
+                                 args.runtime, args.workers)
+    try:
+        with contextlib.ExitStack() as stack:
+            if not args.verbose:
+                stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, 'w'))))
+            report = run_load(target, inputs, args.conversations, args.concurrency)
+    finally:
+        target.close()
+        if tmp: tmp.cleanup()
+    report.update(mode=args.mode, runtime=args.runtime, script=os.path.basename(args.script),
+                  llm_latency_ms=args.llm_latency, db_latency_ms=args.db_latency)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,302 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from lark import Lark
+from src.compiler import compile_flow, compile_flows
+from src.db_manager import DBManager
+from src.interpreter import Context, RuntimeEngine
+from src.transformer import BotInterpreter
+from src.loader import GRAMMAR_FILE
+from src.web import WebAdapter
+from tests.mocks import MockLLMService, TestAdapter
+
+SCRIPT_FILE = os.path.join(PROJECT_ROOT, 'examples', 'customer_server.bot')
+PHONE = "13800138000"
+# One pass over most of customer_server.bot: keyword hits, an LLM fallback
+# ("流量"), a fused read, a write batch and a top-up.
+CONVERSATION = [PHONE, "查话费", "还有", "流量", "还有", "买流量", "还有", "充值", "50", "没有了"]
+DEFAULT_THRESHOLD = 0.10
+
+BENCHMARKS = {}
+
+
+def benchmark(name, number):
+    # `number` calls are timed per round; setup runs once, outside the timer.
+    def register(setup):
+        BENCHMARKS[name] = (setup, number)
+        return setup
+    return register
+
+
+def _read(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+class StubDB:
+    # Answers every statement at once, so only the engine's own cost is timed.
+    ROW = (1,) * 16
+
+    def fetch_row(self, sql, params=None):
+        return self.ROW
+
+    def execute(self, sql, params=None):
+        return 1
+
+    @contextmanager
+    def transaction(self):
+        yield self
+
+
+def seed_memory_db():
+    db = DBManager(':memory:')
+    db.execute("CREATE TABLE users (phone TEXT PRIMARY KEY, name TEXT, balance REAL, data_left REAL, "
+               "package_name TEXT, broadband_status INT)")
+    db.execute("INSERT INTO users VALUES (?,?,?,?,?,?)", (PHONE, "测试", 1200.5, 50.0, "5G畅享套餐", 0))
+    return db
+
+
+def _flows():
+    interpreter = BotInterpreter()
+    interpreter.transform(Lark(_read(GRAMMAR_FILE), parser='lalr').parse(_read(SCRIPT_FILE)))
+    return interpreter.flows
+
+
+@benchmark('grammar_load', number=3)
+def bench_grammar_load():
+    # Uncached: what a cold worker pays without .dsl_cache.
+    return lambda: Lark(_read(GRAMMAR_FILE), parser='lalr'), 'parser'
+
+
+@benchmark('parse', number=50)
+def bench_parse():
+    parser = Lark(_read(GRAMMAR_FILE), parser='lalr')
+    script = _read(SCRIPT_FILE)
+    return lambda: parser.parse(script), 'parse'
+
+
+@benchmark('transform', number=100)
+def bench_transform():
+    tree = Lark(_read(GRAMMAR_FILE), parser='lalr').parse(_read(SCRIPT_FILE))
+    return lambda: BotInterpreter().transform(tree), 'transform'
+
+
+@benchmark('compile', number=200)
+def bench_compile():
+    flows = _flows()
+    return lambda: compile_flows(flows), 'compile'
+
+
+def _count_steps(engine, bot, inputs):
+    # Instructions executed by one conversation, counted through the handler table.
+    counter = [0]
+    real = engine._handlers
+
+    def counted(handler):
+        def wrapper(instr, context):
+            counter[0] += 1
+            return handler(instr, context)
+        return wrapper
+
+    engine._handlers = tuple(counted(h) if h else h for h in real)
+    try:
+        engine.run(bot, mock_inputs=list(inputs))
+    finally:
+        engine._handlers = real
+    return counter[0]
+
+
+@benchmark('engine_steps', number=200)
+def bench_engine_steps():
+    flows = _flows()
+    programs = compile_flows(flows)
+    bot = next(iter(flows))
+    engine = RuntimeEngine(flows, db_manager=StubDB(), io_adapter=TestAdapter([]), programs=programs)
+    engine.set_llm_service(MockLLMService())
+    steps = _count_steps(engine, bot, CONVERSATION)
+
+    def run():
+        engine.io.bot_outputs.clear()
+        engine.run(bot, mock_inputs=list(CONVERSATION))
+    # Reported per instruction, so the figure reads as steps/s.
+    return run, 'step', steps
+
+
+@benchmark('format_string_1k_vars', number=20000)
+def bench_format_string():
+    ctx = Context()
+    for i in range(1000):
+        ctx.set_var(f"$var{i}", f"value-{i}")
+    text = "尊贵的 $var1 用户 $var500，余额 $var999 元，流量 $var42 GB，套餐 $missing。"
+    return lambda: ctx.format_string(text), 'format'
+
+
+def _sql_bench(db):
+    engine = RuntimeEngine({}, db_manager=db, io_adapter=TestAdapter([]))
+    program = compile_flow('b', {'Start': [{'type': 'sql', 'query': "SELECT balance FROM users WHERE phone = $phone",
+                                            'result': '$bal'}]})
+    stmt = program.states[0][0]
+    ctx = Context(layout=program.slots)
+    ctx.set_var('$phone', PHONE)
+    return lambda: engine._execute_sql(stmt, ctx), 'statement'
+
+
+@benchmark('execute_sql_stub', number=50000)
+def bench_execute_sql_stub():
+    return _sql_bench(StubDB())
+
+
+@benchmark('execute_sql_sqlite', number=20000)
+def bench_execute_sql_sqlite():
+    return _sql_bench(seed_memory_db())
+
+
+@benchmark('web_adapter_roundtrip', number=2000)
+def bench_web_adapter():
+    # One user message through the input queue to a bot thread and its reply
+    # back through the output queue, as /send + /poll would see it.
+    adapter = WebAdapter()
+
+    def echo():
+        while True:
+            adapter.send(adapter.receive())
+
+    threading.Thread(target=echo, name='microbench-echo', daemon=True).start()
+    adapter.wait_messages(1)
+
+    def roundtrip():
+        adapter.push_user_input("ping")
+        got = 0
+        while got < 2:
+            got += len(adapter.wait_messages(1))
+    return roundtrip, 'roundtrip'
+
+
+def measure(name, rounds=5, scale=1.0):
+    setup, number = BENCHMARKS[name]
+    fn, unit, *rest = setup()
+    per_call = rest[0] if rest else 1
+    number = max(1, int(number * scale))
+    times = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - started) / (number * per_call))
+    times.sort()
+    best = times[0]
+    return {
+        "unit": unit,
+        "rounds": rounds,
+        "number": number,
+        "best_us": round(best * 1e6, 3),
+        "median_us": round(times[len(times) // 2] * 1e6, 3),
+        "ops_per_s": round(1 / best, 1) if best else 0.0,
+    }
+
+
+def run(names=None, rounds=5, scale=1.0, quiet=False):
+    results = {}
+    for name in names or BENCHMARKS:
+        if name not in BENCHMARKS:
+            raise KeyError(f"Unknown benchmark: {name}")
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            results[name] = measure(name, rounds, scale)
+        if not quiet:
+            r = results[name]
+            print(f"{name:24} {r['best_us']:>12.3f} us/{r['unit']:10} {r['ops_per_s']:>14,.1f} /s")
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "benchmarks": results,
+    }
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    # A benchmark regresses when its best time grew by more than `threshold`
+    # (0.10 = 10%). Benchmarks present in only one report are skipped.
+    rows = []
+    for name, cur in current["benchmarks"].items():
+        base = baseline["benchmarks"].get(name)
+        if not base or not base["best_us"]: continue
+        change = cur["best_us"] / base["best_us"] - 1
+        status = "REGRESSION" if change > threshold else "faster" if change < -threshold else "ok"
+        rows.append({"name": name, "baseline_us": base["best_us"], "current_us": cur["best_us"],
+                     "change": round(change, 4), "status": status})
+    return rows
+
+
+def print_comparison(rows, threshold):
+    print(f"{'benchmark':24} {'baseline us':>12} {'current us':>12} {'change':>8}  (threshold {threshold:.0%})")
+    for row in rows:
+        print(f"{row['name']:24} {row['baseline_us']:>12.3f} {row['current_us']:>12.3f} "
+              f"{row['change']:>+8.1%}  {row['status']}")
+
+
+def _load(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save(path, report):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the DSL toolchain and interpreter hot paths.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run_p = sub.add_parser('run', help="run benchmarks and optionally save them as JSON")
+    run_p.add_argument('names', nargs='*', help=f"benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+    run_p.add_argument('-o', '--output', help="write results to this JSON file")
+    run_p.add_argument('--rounds', type=int, default=5)
+    run_p.add_argument('--scale', type=float, default=1.0, help="multiply every benchmark's iteration count")
+    run_p.add_argument('--baseline', help="compare against this results file when done")
+    run_p.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+
+    cmp_p = sub.add_parser('compare', help="flag regressions between two results files")
+    cmp_p.add_argument('baseline')
+    cmp_p.add_argument('current')
+    cmp_p.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                       help="allowed slowdown as a fraction (default 0.10)")
+
+    sub.add_parser('list', help="list benchmark names")
+    args = parser.parse_args(argv)
+
+    if args.command == 'list':
+        for name in BENCHMARKS: print(name)
+        return 0
+
+    if args.command == 'run':
+        current = run(args.names, args.rounds, args.scale)
+        if args.output: _save(args.output, current)
+        if not args.baseline: return 0
+        baseline = _load(args.baseline)
+    else:
+        baseline, current = _load(args.baseline), _load(args.current)
+
+    rows = compare(baseline, current, args.threshold)
+    print_comparison(rows, args.threshold)
+    regressions = [r["name"] for r in rows if r["status"] == "REGRESSION"]
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from bench.loadtest import percentile
+from src.loader import load_script
+from src.trace import load_traces, replay
+
+DEFAULT_THRESHOLD = 0.20
+
+_scripts = {}
+
+
+def _init_worker(script_path, baseline_path, quiet):
+    # Each worker compiles the flows once; the engine's console output goes
+    # nowhere unless asked for.
+    if quiet: sys.stdout = open(os.devnull, 'w')
+    _scripts['new'] = load_script(script_path)
+    if baseline_path: _scripts['baseline'] = load_script(baseline_path)
+
+
+def _replay_one(item):
+    index, trace = item
+    flows, programs = _scripts['new']
+    result = replay(flows, programs, trace)
+    result["index"] = index
+    result["bot"] = trace["bot"]
+    if 'baseline' in _scripts:
+        flows, programs = _scripts['baseline']
+        result["baseline_turns"] = replay(flows, programs, trace)["turns"]
+    return result
+
+
+def _latency(turns):
+    ordered = sorted(turns)
+    return {
+        "p50": round(percentile(ordered, 50) * 1e6, 1),
+        "p95": round(percentile(ordered, 95) * 1e6, 1),
+        "p99": round(percentile(ordered, 99) * 1e6, 1),
+    }
+
+
+def run_replay(traces_path, script_path, baseline_path=None, jobs=None, chunksize=64, threshold=DEFAULT_THRESHOLD,
+               quiet=True, max_divergences=20):
+    traces = enumerate(load_traces(traces_path))
+    turns, baseline_turns, divergences = [], [], []
+    total = ok = misses = 0
+    started = time.perf_counter()
+    with multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(script_path, baseline_path, quiet)) as pool:
+        for result in pool.imap_unordered(_replay_one, traces, chunksize):
+            total += 1
+            misses += result["misses"]
+            turns.extend(result["turns"])
+            baseline_turns.extend(result.get("baseline_turns", ()))
+            if result["ok"]:
+                ok += 1
+            elif len(divergences) < max_divergences:
+                divergences.append({k: result[k] for k in ("index", "bot", "divergence", "final")})
+    elapsed = time.perf_counter() - started
+
+    report = {
+        "traces": total,
+        "matched": ok,
+        "diverged": total - ok,
+        "unserved_effects": misses,
+        "elapsed_s": round(elapsed, 3),
+        "traces_per_s": round(total / elapsed, 1) if elapsed else 0.0,
+        "turn_latency_us": _latency(turns),
+        "divergences": divergences,
+    }
+    if baseline_path:
+        report["baseline_turn_latency_us"] = base = _latency(baseline_turns)
+        new = report["turn_latency_us"]
+        report["latency_change"] = {p: round(new[p] / base[p] - 1, 4) if base[p] else 0.0 for p in base}
+        report["latency_regression"] = any(c > threshold for c in report["latency_change"].values())
+    return report
+
+
+def print_report(report):
+    print(f"traces         {report['traces']} replayed in {report['elapsed_s']}s "
+          f"({report['traces_per_s']} traces/s)")
+    print(f"behaviour      {report['matched']} matched, {report['diverged']} diverged, "
+          f"{report['unserved_effects']} effects not in the traces")
+    lat = report["turn_latency_us"]
+    print(f"turn latency   p50 {lat['p50']}us  p95 {lat['p95']}us  p99 {lat['p99']}us")
+    if "baseline_turn_latency_us" in report:
+        base = report["baseline_turn_latency_us"]
+        change = report["latency_change"]
+        print(f"baseline       p50 {base['p50']}us  p95 {base['p95']}us  p99 {base['p99']}us  "
+              f"(change p50 {change['p50']:+.1%}, p95 {change['p95']:+.1%}, p99 {change['p99']:+.1%})")
+    for d in report["divergences"]:
+        div = d["divergence"]
+        where = f"event {div['index']}: expected {div['expected']}, got {div['got']}" if div else \
+            f"ended in {d['final']}"
+        print(f"diverged       trace #{d['index']} ({d['bot']}) at {where}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Replay recorded conversations (DSLBOT_TRACE_FILE) against a bot script, with every "
+                    "LLM, SQL and call result served from the traces.")
+    parser.add_argument('traces', help="JSONL trace file")
+    parser.add_argument('--script', required=True, help="the .bot script to check")
+    parser.add_argument('--baseline', help="replay the same traces against this script and compare latency")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--chunksize', type=int, default=64)
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed turn latency growth against --baseline, as a fraction")
+    parser.add_argument('--json', help="also write the report to this file")
+    parser.add_argument('-v', '--verbose', action='store_true', help="keep the engine's console output")
+    args = parser.parse_args(argv)
+
+    report = run_replay(args.traces, args.script, args.baseline, args.jobs, args.chunksize, args.threshold,
+                        quiet=not args.verbose)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return 1 if report["diverged"] or report.get("latency_regression") else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
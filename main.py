@@ -2,25 +2,93 @@ import threading
 import uuid
 import os
 import glob
-from flask import Flask, render_template, request, jsonify, session
-from lark import Lark
-from src.interpreter import BotInterpreter, RuntimeEngine
+import sys
+from src.interpreter import RuntimeEngine
+from src.loader import load_script, script_version
 from src.web import WebAdapter
-from src.llm_client import LLMService
-from src.db_manager import DBManager
-
-app = Flask(__name__)
-app.secret_key = "dsl_key"
+from src.llm_client import LazyLLMService
+from src.db_manager import DBManager, QueryCache
+from src.sessions import SessionManager, SessionStore, SharedSessionManager
+from src.session_backend import get_backend
+from src.intent_cache import CachedIntentService
+from src.metrics import Metrics
+from src.trace import TraceWriter, Tracer
 
 active_sessions = {}
+MAX_POLL_WAIT = 30
 DB_PATH = 'bot_data.db'
 SCRIPTS_DIR = 'examples'
 current_flows = {}
+current_programs = {}
 current_script_name = ""
+current_script_version = None
+# 'coroutine' parks idle chats as generators driven by a small worker pool;
+# 'thread' keeps the original one-thread-per-chat runtime; 'shared' keeps
+# every chat in the session backend (DSLBOT_SESSION_BACKEND, SQLite by
+# default) so several worker processes can serve the same users.
+RUNTIME_MODE = os.getenv('DSLBOT_RUNTIME', 'coroutine')
+SESSION_TTL = float(os.getenv('DSLBOT_SESSION_TTL', '1800'))
+# Comma-separated bot names whose SELECTs go through the shared read cache,
+# or '*' for every bot. Writes from every bot invalidate it, but it is only
+# safe while this process is the sole writer.
+SQL_CACHE_BOTS = {b.strip() for b in os.getenv('DSLBOT_SQL_CACHE', '').split(',') if b.strip()}
+sql_cache = QueryCache(maxsize=int(os.getenv('DSLBOT_SQL_CACHE_SIZE', '4096')))
+INTENT_CACHE_SIZE = int(os.getenv('DSLBOT_INTENT_CACHE_SIZE', '10000'))
+INTENT_CACHE_TTL = float(os.getenv('DSLBOT_INTENT_CACHE_TTL', '86400'))
+PREFETCH_CALLS = os.getenv('DSLBOT_PREFETCH_CALLS', '0') == '1'
+# Per-opcode/state/SQL/intent timing. /metrics always serves the gauges;
+# the histograms only fill while this is on.
+METRICS_HOOKS = os.getenv('DSLBOT_METRICS', '0') == '1'
+metrics = Metrics()
+# Appends one JSON line per session (see src/trace.py) for bench/replay.py.
+TRACE_FILE = os.getenv('DSLBOT_TRACE_FILE')
+trace_writer = TraceWriter(TRACE_FILE) if TRACE_FILE else None
+shared_llm = None
+llm_lock = threading.Lock()
+# What loading a script does about bot SQL that reads whole tables: 'off'
+# skips the check, 'report' prints the indexes that would fix it, 'create'
+# also creates them (holding the write lock while each one builds). Off by
+# default since it plans against DB_PATH on every load; bench/indexes.py
+# prints the same report on demand.
+INDEX_ADVISOR = os.getenv('DSLBOT_INDEX_ADVISOR', 'off')
+# Import-to-first-request budget checked by `main.py --profile-startup`.
+STARTUP_BUDGET_MS = float(os.getenv('DSLBOT_STARTUP_BUDGET_MS', '300'))
+
+
+def new_tracer():
+    return Tracer(trace_writer, script=current_script_name) if trace_writer else None
 
 
 def get_db():
-    return DBManager(DB_PATH)
+    return DBManager.shared(DB_PATH)
+
+
+def caches_reads(bot_name):
+    return '*' in SQL_CACHE_BOTS or bot_name in SQL_CACHE_BOTS
+
+
+def get_llm_service():
+    global shared_llm
+    with llm_lock:
+        if shared_llm is None:
+            from src.llm_client import LLMService
+            service = LLMService()
+            if INTENT_CACHE_SIZE > 0:
+                service = CachedIntentService(service, maxsize=INTENT_CACHE_SIZE, ttl=INTENT_CACHE_TTL, db_path=DB_PATH)
+            shared_llm = service
+        return shared_llm
+
+
+# Engines hold this stand-in; the SDK and the shared service are only built
+# when some session first falls back to the LLM.
+llm = LazyLLMService(lambda: get_llm_service())
+session_manager = None
+shared_sessions = None
+script_pending = True
+script_lock = threading.Lock()
+_app = None
+app_lock = threading.Lock()
+
 
 def get_available_scripts():
     files = glob.glob(os.path.join(SCRIPTS_DIR, "*.bot"))
@@ -28,42 +96,96 @@ def get_available_scripts():
 
 
 def load_dsl(filename):
-    global current_flows, current_script_name
-    grammar_file = 'src/dsl_parser/grammar.lark'
+    global current_flows, current_programs, current_script_name, current_script_version
     script_path = os.path.join(SCRIPTS_DIR, filename)
 
     if not os.path.exists(script_path):
         raise FileNotFoundError(f"Script {filename} not found")
 
-    with open(grammar_file, 'r', encoding='utf-8') as f: grammar = f.read()
-    with open(script_path, 'r', encoding='utf-8') as f: script = f.read()
-
-    parser = Lark(grammar, parser='lalr')
-    interpreter = BotInterpreter()
-    ast = parser.parse(script)
-    interpreter.transform(ast)
-
-    current_flows = interpreter.flows
+    current_flows, current_programs = load_script(script_path)
     current_script_name = filename
+    current_script_version = script_version(script_path)
+    if INDEX_ADVISOR != 'off':
+        check_indexes(filename, current_flows)
     return current_flows
 
 
-try:
-    scripts = get_available_scripts()
-    if scripts:
-        load_dsl(scripts[0])
-    else:
-        print("Warning: No .bot scripts found in examples/")
-except Exception as e:
-    print(f"Startup Error: {e}")
-
-
-def run_bot_thread(adapter, flows, bot_name):
+def check_indexes(filename, flows):
+    # EXPLAIN QUERY PLAN over the script's SQL; see bench/indexes.py for the full report.
+    from src.index_advisor import advise, create_indexes
     db = get_db()
-    engine = RuntimeEngine(flows, db_manager=db, io_adapter=adapter)
+    try:
+        report = advise(db, flows)
+        if INDEX_ADVISOR == 'create': create_indexes(db, report)
+    except Exception as e:
+        print(f"[Index Advisor] {filename}: {e}")
+        return None
+    finally:
+        db.close()
+    for index in report["indexes"]:
+        action = "created" if index["created"] else "suggest" if index["verified"] else "planner ignores"
+        print(f"[Index Advisor] {filename}: {index['statements']} statement(s) scan {index['table']}; "
+              f"{action}: {index['ddl']}")
+    unhandled = sum(1 for s in report["statements"] if s["scans"] and not s["index"])
+    if unhandled:
+        print(f"[Index Advisor] {filename}: {unhandled} statement(s) scan a table with no index to propose")
+    if report["errors"]:
+        print(f"[Index Advisor] {filename}: {report['errors']} statement(s) could not be planned "
+              f"against {DB_PATH}")
+    return report
+
+
+def sync_script():
+    # Another worker process may have switched scripts, or reloaded the
+    # current one after an edit. A script that fails to load here is logged
+    # and the current one kept, rather than failing every request.
+    backend = shared_sessions.backend
+    name = backend.get_setting('script')
+    version = backend.get_setting('script_version')
+    if name and (name != current_script_name or (version and version != current_script_version)):
+        try:
+            load_dsl(name)
+        except Exception as e:
+            print(f"[Script Error] {name}: {e}")
+
+
+def ensure_script():
+    # The first script is loaded by the first request (from .dsl_cache when
+    # warm), not at import, unless load_dsl() was already called.
+    global script_pending
+    if not script_pending: return
+    with script_lock:
+        if not script_pending: return
+        if not current_script_name:
+            try:
+                scripts = get_available_scripts()
+                if scripts:
+                    load_dsl(scripts[0])
+                else:
+                    print("Warning: No .bot scripts found in examples/")
+            except Exception as e:
+                print(f"Startup Error: {e}")
+        script_pending = False
+        if RUNTIME_MODE == 'shared' and current_script_name:
+            publish_script()
+
+
+def publish_script():
+    # Records the script this worker runs for the others. A worker restarted
+    # after an edit publishes the new version, so the rest reload it.
+    backend = shared_sessions.backend
+    if backend.get_setting('script', current_script_name) != current_script_name: return
+    backend.set_setting('script', current_script_name)
+    backend.set_setting('script_version', current_script_version)
+
+
+def run_bot_thread(adapter, flows, programs, bot_name):
+    db = get_db()
+    engine = RuntimeEngine(flows, db_manager=db, io_adapter=adapter, programs=programs,
+                           sql_cache=sql_cache, cache_reads=caches_reads(bot_name), prefetch_calls=PREFETCH_CALLS,
+                           metrics=metrics if METRICS_HOOKS else None, tracer=new_tracer())
 
     try:
-        llm = LLMService()
         engine.set_llm_service(llm)
         engine.run(bot_name)
     except Exception as e:
@@ -73,86 +195,376 @@ def run_bot_thread(adapter, flows, bot_name):
         db.close()
 
 
-@app.route('/')
-def index():
-    return render_template('index.html')
-
+def new_engine(adapter, bot_name):
+    engine = RuntimeEngine(current_flows, db_manager=get_db(), io_adapter=adapter, programs=current_programs,
+                           sql_cache=sql_cache, cache_reads=caches_reads(bot_name), prefetch_calls=PREFETCH_CALLS,
+                           metrics=metrics if METRICS_HOOKS else None, tracer=new_tracer())
+    engine.set_llm_service(llm)
+    return engine
 
-@app.route('/api/scripts', methods=['GET'])
-def list_scripts():
-    return jsonify({
-        "scripts": get_available_scripts(),
-        "current": current_script_name
-    })
 
-
-@app.route('/api/switch_script', methods=['POST'])
-def switch_script():
-    filename = request.json.get('filename')
+def start_bot_session(uid, adapter, bot_name):
     try:
-        load_dsl(filename)
-        active_sessions.clear()
-        session.clear()
-        return jsonify({"status": "ok", "current": filename})
+        engine = new_engine(adapter, bot_name)
     except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
-
-
-@app.route('/start_chat', methods=['POST'])
-def start_chat():
-    if 'user_id' not in session:
-        session['user_id'] = str(uuid.uuid4())
-
-    uid = session['user_id']
+        print(f"Error: {e}")
+        adapter.send(f"System Error: {e}")
+        return
+    session_manager.start(uid, engine, bot_name, script=current_script_name, version=current_script_version)
 
-    if uid in active_sessions:
-        del active_sessions[uid]
 
+def resume_bot_session(uid):
     adapter = WebAdapter()
+    try:
+        resumed = session_manager.resume(uid, lambda bot_name: new_engine(adapter, bot_name), current_script_name,
+                                         current_script_version)
+    except Exception as e:
+        print(f"Error: {e}")
+        return False
+    if resumed is None: return False
     active_sessions[uid] = adapter
-
-    bot_names = list(current_flows.keys())
-    if not bot_names:
-        return jsonify({"error": "No bot defined in script"}), 400
-
-    target_bot = bot_names[0]
-
-    t = threading.Thread(target=run_bot_thread, args=(adapter, current_flows, target_bot))
-    t.daemon = True
-    t.start()
-
-    return jsonify({"status": "ok", "bot_name": target_bot})
+    return True
 
 
-@app.route('/send', methods=['POST'])
-def send_msg():
-    uid = session.get('user_id')
-    if not uid or uid not in active_sessions:
-        return jsonify({"error": "Session expired"}), 400
-    msg = request.json.get('message')
-    active_sessions[uid].push_user_input(msg)
-    return jsonify({"status": "ok"})
+def shared_engine(adapter, bot_name, script, version):
+    if (script, version) != (current_script_name, current_script_version):
+        sync_script()
+        if (script, version) != (current_script_name, current_script_version): return None
+    return new_engine(adapter, bot_name)
 
 
-@app.route('/poll')
-def poll_msg():
-    uid = session.get('user_id')
-    if uid and uid not in active_sessions:
-        return jsonify([{"type": "system", "action": "reload"}])
-    if not uid or uid not in active_sessions:
-        return jsonify([])
-    msgs = active_sessions[uid].get_pending_messages()
-    return jsonify(msgs)
-
-
-@app.route('/reset', methods=['POST'])
-def reset():
-    uid = session.get('user_id')
-    if uid in active_sessions:
-        del active_sessions[uid]
-    session.clear()
-    return jsonify({"status": "ok"})
+def end_session(uid):
+    adapter = active_sessions.pop(uid, None)
+    if adapter: adapter.close()
+    if RUNTIME_MODE == 'shared':
+        shared_sessions.stop(uid)
+    elif RUNTIME_MODE == 'thread':
+        # Unblocks the bot thread waiting in receive() so it can finish.
+        if adapter: adapter.push_user_input("EXIT")
+    else:
+        session_manager.stop(uid)
+
+
+def init_runtime():
+    # Session stores and reapers; started once, by create_app().
+    global session_manager, shared_sessions
+    if session_manager is not None: return
+    workers = int(os.getenv('DSLBOT_WORKERS', '8'))
+    session_manager = SessionManager(max_workers=workers, store=SessionStore(DB_PATH))
+    # At most a minute between sweeps, but never a busy loop (DSLBOT_SESSION_TTL=0).
+    interval = max(1.0, min(60.0, SESSION_TTL))
+    if RUNTIME_MODE == 'shared':
+        shared_sessions = SharedSessionManager(get_backend(db_path=os.getenv('DSLBOT_SESSION_DB', DB_PATH)),
+                                               shared_engine, max_workers=workers)
+        shared_sessions.start_reaper(SESSION_TTL, interval=interval)
+    elif RUNTIME_MODE != 'thread':
+        session_manager.start_reaper(SESSION_TTL, interval=interval,
+                                     on_evict=lambda uid: active_sessions.pop(uid, None))
+
+
+def active_session_count():
+    if RUNTIME_MODE == 'shared':
+        return shared_sessions.backend.counts()[0]
+    return len(active_sessions) if RUNTIME_MODE == 'thread' else len(session_manager)
+
+
+def pending_inputs():
+    if RUNTIME_MODE == 'shared':
+        return shared_sessions.backend.counts()[1]
+    if RUNTIME_MODE == 'thread':
+        return sum(a.input_queue.qsize() for a in list(active_sessions.values()))
+    return session_manager.pending_inputs()
+
+
+def pending_outputs():
+    if RUNTIME_MODE == 'shared':
+        return shared_sessions.backend.counts()[2]
+    return sum(a.output_queue.qsize() for a in list(active_sessions.values()))
+
+
+def worker_queue_depth():
+    if RUNTIME_MODE == 'thread': return None
+    return (shared_sessions if RUNTIME_MODE == 'shared' else session_manager).queue_depth()
+
+
+def intent_cache_hit_rate():
+    return shared_llm.stats()["hit_rate"] if isinstance(shared_llm, CachedIntentService) else None
+
+
+metrics.gauge('dslbot_active_sessions', "Conversations currently held by this deployment.", active_session_count)
+metrics.gauge('dslbot_pending_inputs', "User inputs queued and not yet consumed by a bot.", pending_inputs)
+metrics.gauge('dslbot_pending_outputs', "Bot messages queued and not yet polled.", pending_outputs)
+metrics.gauge('dslbot_worker_queue_depth', "Session steps waiting for a free worker.", worker_queue_depth)
+metrics.gauge('dslbot_intent_cache_hit_ratio', "Share of detect_intent calls answered by the intent cache.",
+              intent_cache_hit_rate)
+metrics.gauge('dslbot_sql_cache_hit_ratio', "Share of cached SELECTs answered by the SQL read cache.",
+              lambda: sql_cache.stats()["hit_rate"])
+
+
+def register_routes(app):
+    from flask import Response, render_template, request, jsonify, session
+
+    @app.before_request
+    def load_scripts():
+        ensure_script()
+        if RUNTIME_MODE == 'shared':
+            sync_script()
+
+    @app.route('/')
+    def index():
+        return render_template('index.html')
+
+    @app.route('/api/scripts', methods=['GET'])
+    def list_scripts():
+        return jsonify({
+            "scripts": get_available_scripts(),
+            "current": current_script_name
+        })
+
+    @app.route('/api/sql_cache', methods=['GET'])
+    def sql_cache_stats():
+        return jsonify({"bots": sorted(SQL_CACHE_BOTS), **sql_cache.stats()})
+
+    @app.route('/api/intent_cache', methods=['GET'])
+    def intent_cache_stats():
+        if not isinstance(shared_llm, CachedIntentService):
+            return jsonify({"enabled": False})
+        return jsonify({"enabled": True, **shared_llm.stats()})
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics_endpoint():
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    @app.route('/api/switch_script', methods=['POST'])
+    def switch_script():
+        filename = request.json.get('filename')
+        try:
+            load_dsl(filename)
+            # Rows cached for the old script are dropped with it.
+            sql_cache.invalidate()
+            if RUNTIME_MODE == 'shared':
+                shared_sessions.backend.set_setting('script', filename)
+                shared_sessions.backend.set_setting('script_version', current_script_version)
+                shared_sessions.stop_all()
+            for uid in list(active_sessions):
+                end_session(uid)
+            session_manager.stop_all()
+            session.clear()
+            return jsonify({"status": "ok", "current": filename})
+        except Exception as e:
+            return jsonify({"status": "error", "message": str(e)}), 500
+
+    @app.route('/start_chat', methods=['POST'])
+    def start_chat():
+        if 'user_id' not in session:
+            session['user_id'] = str(uuid.uuid4())
+
+        uid = session['user_id']
+
+        end_session(uid)
+
+        bot_names = list(current_flows.keys())
+        if not bot_names:
+            return jsonify({"error": "No bot defined in script"}), 400
+
+        target_bot = bot_names[0]
+
+        if RUNTIME_MODE == 'shared':
+            shared_sessions.start(uid, target_bot, current_script_name, version=current_script_version)
+            return jsonify({"status": "ok", "bot_name": target_bot})
+
+        adapter = WebAdapter()
+        active_sessions[uid] = adapter
+
+        if RUNTIME_MODE == 'thread':
+            t = threading.Thread(target=run_bot_thread, args=(adapter, current_flows, current_programs, target_bot))
+            t.daemon = True
+            t.start()
+        else:
+            start_bot_session(uid, adapter, target_bot)
+
+        return jsonify({"status": "ok", "bot_name": target_bot})
+
+    @app.route('/send', methods=['POST'])
+    def send_msg():
+        uid = session.get('user_id')
+        msg = request.json.get('message')
+        if RUNTIME_MODE == 'thread':
+            if not uid or uid not in active_sessions:
+                return jsonify({"error": "Session expired"}), 400
+            active_sessions[uid].push_user_input(msg)
+            return jsonify({"status": "ok"})
+
+        if not uid:
+            return jsonify({"error": "Session expired"}), 400
+        if RUNTIME_MODE == 'shared':
+            if not shared_sessions.deliver(uid, msg):
+                return jsonify({"error": "Session expired"}), 400
+            return jsonify({"status": "ok"})
+        if not session_manager.deliver(uid, msg):
+            if not (resume_bot_session(uid) and session_manager.deliver(uid, msg)):
+                return jsonify({"error": "Session expired"}), 400
+        return jsonify({"status": "ok"})
+
+    @app.route('/poll')
+    def poll_msg():
+        uid = session.get('user_id')
+        wait = min(request.args.get('wait', 0, type=float), MAX_POLL_WAIT)
+        if RUNTIME_MODE == 'shared':
+            if not uid: return jsonify([])
+            msgs = shared_sessions.messages(uid, wait)
+            return jsonify([{"type": "system", "action": "reload"}] if msgs is None else msgs)
+        if uid and uid not in active_sessions:
+            if RUNTIME_MODE != 'thread' and session_manager.store.exists(uid):
+                # Parked on disk by the reaper; the next /send brings it back.
+                return jsonify([{"type": "system", "action": "suspended"}])
+            return jsonify([{"type": "system", "action": "reload"}])
+        if not uid or uid not in active_sessions:
+            return jsonify([])
+        # ?wait=N turns this into a long-poll: block until the bot sends something
+        # or N seconds pass.
+        adapter = active_sessions[uid]
+        msgs = adapter.wait_messages(wait) if wait > 0 else adapter.get_pending_messages()
+        return jsonify(msgs)
+
+    @app.route('/reset', methods=['POST'])
+    def reset():
+        uid = session.get('user_id')
+        if uid: end_session(uid)
+        session.clear()
+        return jsonify({"status": "ok"})
+
+
+def create_app():
+    # Flask is imported here so that tools importing this module for its
+    # helpers (bench/loadtest.py, --profile-startup) only pay for it when
+    # they ask for the app.
+    from flask import Flask
+    app = Flask(__name__)
+    app.secret_key = "dsl_key"
+    init_runtime()
+    register_routes(app)
+    return app
+
+
+def get_app():
+    global _app
+    with app_lock:
+        if _app is None:
+            _app = create_app()
+        return _app
+
+
+def __getattr__(name):
+    # `main.app` (flask --app main, bench/loadtest.py) builds the app on first use.
+    if name == 'app':
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+PROFILE_CHILD = """
+import json, sys, time
+def loaded(): return sorted(m for m in ('flask', 'lark', 'zai') if m in sys.modules)
+phases = []
+started = time.perf_counter()
+import main
+phases.append(('import main', time.perf_counter() - started, loaded()))
+started = time.perf_counter()
+main.create_app()
+phases.append(('create_app', time.perf_counter() - started, loaded()))
+started = time.perf_counter()
+main.ensure_script()
+phases.append(('first script', time.perf_counter() - started, loaded()))
+started = time.perf_counter()
+import zai
+phases.append(('llm sdk (lazy)', time.perf_counter() - started, loaded()))
+print(json.dumps({'phases': phases, 'script': main.current_script_name}))
+"""
+
+
+def _import_self_times(stderr):
+    # `python -X importtime` lines: "import time: self [us] | cumulative | name".
+    totals = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'): continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[0].strip().isdigit(): continue
+        package = parts[2].strip().split('.')[0]
+        totals[package] = totals.get(package, 0) + int(parts[0])
+    return totals
+
+
+def profile_startup(budget_ms=STARTUP_BUDGET_MS, top=12):
+    # Cold-starts a fresh interpreter under -X importtime and reports how long
+    # each phase of getting to the first request takes. The budget covers
+    # everything but the LLM SDK, which sessions load on first use.
+    import json
+    import subprocess
+    here = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROFILE_CHILD], cwd=here,
+                          capture_output=True, text=True, encoding='utf-8')
+    if proc.returncode != 0:
+        print(proc.stderr[-2000:], file=sys.stderr)
+        return None
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    phases = [{"phase": name, "ms": round(seconds * 1000, 1), "loaded": mods}
+              for name, seconds, mods in result["phases"]]
+    boot_ms = round(sum(p["ms"] for p in phases if p["phase"] != 'llm sdk (lazy)'), 1)
+    imports = sorted(_import_self_times(proc.stderr).items(), key=lambda kv: -kv[1])[:top]
+    return {
+        "script": result["script"],
+        "phases": phases,
+        "boot_ms": boot_ms,
+        "budget_ms": budget_ms,
+        "over_budget": boot_ms > budget_ms,
+        "imports_ms": {name: round(us / 1000, 1) for name, us in imports},
+    }
+
+
+def print_profile(report):
+    print(f"{'phase':16} {'ms':>8}  heavy modules loaded so far")
+    for p in report["phases"]:
+        print(f"{p['phase']:16} {p['ms']:>8.1f}  {', '.join(p['loaded']) or '-'}")
+    status = "OVER BUDGET" if report["over_budget"] else "ok"
+    print(f"{'boot total':16} {report['boot_ms']:>8.1f}  (budget {report['budget_ms']:.0f} ms: {status})")
+    print("top imports by self time:")
+    for name, ms in report["imports_ms"].items():
+        print(f"  {name:24} {ms:>8.1f} ms")
+
+
+def precompile():
+    # Fills .dsl_cache for every script so workers start without Lark.
+    for name in get_available_scripts():
+        load_script(os.path.join(SCRIPTS_DIR, name))
+        print(f"compiled {name}")
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="DSLbot web server.")
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--precompile', action='store_true', help="compile every script into .dsl_cache and exit")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="report cold-start time per phase and import, and exit non-zero over budget")
+    parser.add_argument('--budget-ms', type=float, default=STARTUP_BUDGET_MS)
+    parser.add_argument('--json', action='store_true', help="print the startup profile as JSON")
+    args = parser.parse_args(argv)
+
+    if args.precompile:
+        precompile()
+        return 0
+    if args.profile_startup:
+        report = profile_startup(args.budget_ms)
+        if report is None: return 2
+        if args.json:
+            import json
+            print(json.dumps(report, indent=2, ensure_ascii=False))
+        else:
+            print_profile(report)
+        return 1 if report["over_budget"] else 0
+    get_app().run(debug=True, port=args.port)
+    return 0
 
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    sys.exit(main())
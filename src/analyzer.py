@@ -0,0 +1,155 @@
+from src.compiler import EXIT_TARGET
+
+ERROR = 'error'
+WARNING = 'warning'
+
+
+class Issue:
+    __slots__ = ('level', 'bot', 'state', 'message')
+
+    def __init__(self, level, bot, state, message):
+        self.level = level
+        self.bot = bot
+        self.state = state
+        self.message = message
+
+    def __str__(self):
+        where = f"{self.bot}.{self.state}" if self.state else self.bot
+        return f"{self.level}: {where}: {self.message}"
+
+    def __repr__(self):
+        return f"Issue({self})"
+
+
+class FlowError(ValueError):
+    def __init__(self, issues):
+        self.issues = issues
+        super().__init__("Invalid script:\n" + "\n".join(str(i) for i in issues))
+
+
+def _transfer(action):
+    # (target or None, always transfers?) for a process action.
+    if action is None: return None, False
+    if action['type'] == 'goto':
+        return (None if action['target'] == EXIT_TARGET else action['target']), True
+    return None, action['type'] == 'exit'
+
+
+def state_edges(cmds):
+    # [(target, yields_first)] for every way control leaves the state.
+    # `yields_first` is true when a `listen` always runs before the jump.
+    # A state that can run off its end re-runs itself.
+    edges = []
+    listened = False
+    for cmd in cmds:
+        if not isinstance(cmd, dict): continue
+        ctype = cmd['type']
+        if ctype == 'listen':
+            listened = True
+        elif ctype == 'goto':
+            if cmd['target'] != EXIT_TARGET: edges.append((cmd['target'], listened))
+            return edges
+        elif ctype == 'exit':
+            return edges
+        elif ctype == 'if':
+            if cmd['target'] != EXIT_TARGET: edges.append((cmd['target'], listened))
+        elif ctype == 'process':
+            always = cmd['default'] is not None
+            for action in list(cmd['cases'].values()) + [cmd['default']]:
+                target, transfers = _transfer(action)
+                if target is not None: edges.append((target, listened))
+                always = always and transfers
+            if always: return edges
+    edges.append((None, listened))
+    return edges
+
+
+def _loops(graph):
+    # Strongly connected components of `graph` that contain a cycle
+    # (Tarjan, iterative).
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    loops = []
+    counter = 0
+    for root in graph:
+        if root in index: continue
+        work = [(root, iter(graph[root]))]
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in index:
+                    index[child] = low[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(graph[child])))
+                    break
+                if child in on_stack:
+                    low[node] = min(low[node], index[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node: break
+                    if len(component) > 1 or node in graph[node]:
+                        loops.append(component[::-1])
+    return loops
+
+
+def analyze_flow(bot, flow):
+    issues = []
+    edges = {}
+    for state, cmds in flow.items():
+        edges[state] = []
+        for target, yields in state_edges(cmds):
+            if target is None:
+                target = state
+            elif target not in flow:
+                issues.append(Issue(ERROR, bot, state, f"goto undefined state '{target}'"))
+                continue
+            edges[state].append((target, yields))
+
+    if 'Start' not in flow:
+        issues.append(Issue(ERROR, bot, None, "no Start state"))
+    else:
+        seen = {'Start'}
+        todo = ['Start']
+        while todo:
+            for target, _ in edges[todo.pop()]:
+                if target not in seen:
+                    seen.add(target)
+                    todo.append(target)
+        for state in flow:
+            if state not in seen:
+                issues.append(Issue(WARNING, bot, state, "unreachable from Start"))
+
+    eager = {state: [t for t, yields in out if not yields] for state, out in edges.items()}
+    for loop in _loops(eager):
+        path = " -> ".join(loop + [loop[0]])
+        issues.append(Issue(ERROR, bot, loop[0], f"loop without listen: {path}"))
+    return issues
+
+
+def analyze(flows):
+    return [issue for bot, flow in flows.items() for issue in analyze_flow(bot, flow)]
+
+
+def verify(flows):
+    # Raises FlowError on any error; returns the warnings.
+    issues = analyze(flows)
+    errors = [i for i in issues if i.level == ERROR]
+    if errors: raise FlowError(errors)
+    return issues
@@ -0,0 +1,385 @@
+import re
+from src.matcher import KeywordMatcher
+
+EXIT = -1
+SUSPEND = -2
+# `goto Exit` ends the session like `exit` does, even if a state has that name.
+EXIT_TARGET = 'Exit'
+
+OPCODES = range(12)
+(OP_SAY, OP_LISTEN, OP_SQL, OP_SET, OP_CALL, OP_IF, OP_PROCESS, OP_GOTO, OP_EXIT, OP_SQL_ROW, OP_SQL_BATCH,
+ OP_CALL_GROUP) = OPCODES
+OP_NAMES = ('say', 'listen', 'sql', 'set', 'call', 'if', 'process', 'goto', 'exit', 'sql_row', 'sql_batch',
+            'call_group')
+
+
+class _Unset(str):
+    # Value of a variable slot never assigned: reads as "" everywhere, but a
+    # template keeps the `$name` placeholder for it.
+    def __repr__(self):
+        return 'UNSET'
+
+    def __reduce__(self):
+        return 'UNSET'
+
+
+UNSET = _Unset()
+
+VAR_PATTERN = re.compile(r"(\$[a-zA-Z0-9_]+)")
+# Single plain column selects: the only reads the fusion pass will merge.
+SIMPLE_SELECT = re.compile(r"^\s*SELECT\s+([A-Za-z_][\w.]*)\s+FROM\s+(.+?)\s*;?\s*$", re.IGNORECASE | re.DOTALL)
+
+
+class Template:
+    __slots__ = ('text', 'parts', 'slots')
+
+    def __init__(self, text):
+        # Even indices hold literal text, odd indices hold variable names.
+        self.text = text
+        self.parts = tuple(VAR_PATTERN.split(text))
+        self.slots = tuple(range(1, len(self.parts), 2))
+
+    def render(self, variables):
+        if not self.slots: return self.text
+        out = list(self.parts)
+        for i in self.slots:
+            val = variables.get(out[i], UNSET)
+            if val is not UNSET: out[i] = str(val)
+        return ''.join(out)
+
+    def render_values(self, values, refs):
+        # `refs` holds the variable slot of each placeholder, in order.
+        if not self.slots: return self.text
+        out = list(self.parts)
+        for i, ref in zip(self.slots, refs):
+            val = values[ref]
+            if val is not UNSET: out[i] = str(val)
+        return ''.join(out)
+
+
+READ_TABLES = re.compile(r"\b(?:FROM|JOIN)\s+([A-Za-z_][\w.]*)", re.IGNORECASE)
+WRITE_TABLE = re.compile(r"^\s*(?:UPDATE(?:\s+OR\s+\w+)?|INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|DELETE\s+FROM)"
+                         r"\s+([A-Za-z_][\w.]*)", re.IGNORECASE)
+
+
+def compile_sql(query):
+    # Returns (parameterized sql, ordered $var names, is_read).
+    return VAR_PATTERN.sub("?", query), VAR_PATTERN.findall(query), query.strip().upper().startswith("SELECT")
+
+
+def sql_tables(sql, read):
+    # Tables a statement reads from or writes to. An empty set for a write
+    # means the target is unknown (DDL and the like).
+    if read:
+        return frozenset(t.lower() for t in READ_TABLES.findall(sql))
+    m = WRITE_TABLE.match(sql)
+    return frozenset([m.group(1).lower()]) if m else frozenset()
+
+
+class VarRef:
+    __slots__ = ('slot', 'name')
+
+    def __init__(self, slot, name=None):
+        self.slot = slot
+        self.name = name
+
+
+class Say:
+    __slots__ = ('content', 'template', 'refs')
+    op = OP_SAY
+
+    def __init__(self, content, template=None, refs=()):
+        self.content = content
+        self.template = template if template is not None else Template(content)
+        self.refs = refs
+
+
+class Listen:
+    __slots__ = ('var',)
+    op = OP_LISTEN
+
+    def __init__(self, var):
+        self.var = var
+
+
+class Sql:
+    __slots__ = ('query', 'sql', 'params', 'read', 'result', 'tables')
+    op = OP_SQL
+
+    # `params` and `result` are variable slots (see Compiler.slot).
+    def __init__(self, query, result, sql, params, read):
+        self.query = query
+        self.sql = sql
+        self.params = tuple(params)
+        self.read = read
+        self.result = result
+        self.tables = sql_tables(sql, read)
+
+
+class SqlRow:
+    # Several single-column reads of the same row, fetched with one query.
+    __slots__ = ('sql', 'params', 'results', 'tables')
+    op = OP_SQL_ROW
+
+    def __init__(self, sql, params, results, tables):
+        self.sql = sql
+        self.params = params
+        self.results = results
+        self.tables = tables
+
+
+class SqlBatch:
+    # Consecutive writes of one state, committed in a single transaction.
+    __slots__ = ('statements',)
+    op = OP_SQL_BATCH
+
+    def __init__(self, statements):
+        self.statements = statements
+
+
+class Set:
+    __slots__ = ('var', 'value')
+    op = OP_SET
+
+    def __init__(self, var, value):
+        self.var = var
+        self.value = value
+
+
+class Call:
+    __slots__ = ('func', 'args', 'result')
+    op = OP_CALL
+
+    def __init__(self, func, args, result):
+        self.func = func
+        self.args = args
+        self.result = result
+
+
+class CallGroup:
+    # Consecutive calls of one state whose arguments don't read each other's
+    # results; the engine may run them concurrently.
+    __slots__ = ('calls',)
+    op = OP_CALL_GROUP
+
+    def __init__(self, calls):
+        self.calls = calls
+
+
+class If:
+    __slots__ = ('left', 'test', 'right', 'target')
+    op = OP_IF
+
+    def __init__(self, left, test, right, target):
+        self.left = left
+        self.test = test
+        self.right = right
+        self.target = target
+
+
+class Process:
+    __slots__ = ('cases', 'candidates', 'default', 'matcher')
+    op = OP_PROCESS
+
+    def __init__(self, cases, default, matcher=None):
+        self.cases = cases
+        self.candidates = list(cases.keys())
+        self.default = default
+        self.matcher = matcher
+
+
+class Goto:
+    __slots__ = ('target',)
+    op = OP_GOTO
+
+    def __init__(self, target):
+        self.target = target
+
+
+class Exit:
+    __slots__ = ()
+    op = OP_EXIT
+
+
+class Program:
+    __slots__ = ('name', 'names', 'index', 'states', 'entry', 'verified', 'slots', 'variables')
+
+    def __init__(self, name, names, states, verified=False, slots=None):
+        self.name = name
+        # Variable name -> index into Context.values, shared by every session.
+        self.slots = slots if slots is not None else {}
+        self.variables = tuple(self.slots)
+        # Set once src.analyzer has proven every loop passes a `listen`.
+        self.verified = verified
+        self.names = names
+        self.index = {n: i for i, n in enumerate(names)}
+        self.states = states
+        self.entry = self.index.get('Start', EXIT)
+
+
+def _eq(l, r):
+    return str(l) == str(r)
+
+
+def _ne(l, r):
+    return str(l) != str(r)
+
+
+def _gt(l, r):
+    try:
+        return float(l) > float(r)
+    except:
+        return False
+
+
+def _lt(l, r):
+    try:
+        return float(l) < float(r)
+    except:
+        return False
+
+
+def _never(l, r):
+    return False
+
+
+COMPARATORS = {'==': _eq, '!=': _ne, '>': _gt, '<': _lt}
+
+
+def _select_parts(instr):
+    if not (isinstance(instr, Sql) and instr.read and instr.result is not None): return None
+    m = SIMPLE_SELECT.match(instr.sql)
+    if not m: return None
+    return m.group(1), ' '.join(m.group(2).split())
+
+
+def _fuse_reads(run):
+    source = _select_parts(run[0])[1]
+    columns = ', '.join(_select_parts(i)[0] for i in run)
+    return SqlRow(f"SELECT {columns} FROM {source}", run[0].params, tuple(i.result for i in run), run[0].tables)
+
+
+def fuse_sql(cmds):
+    # Merges runs of same-row SELECTs into one SqlRow and runs of writes into
+    # one SqlBatch. A run stops before a statement whose parameters read a
+    # result assigned earlier in the run.
+    out = []
+    i = 0
+    while i < len(cmds):
+        instr = cmds[i]
+        parts = _select_parts(instr)
+        j = i + 1
+        if parts is not None:
+            assigned = {instr.result}
+            while j < len(cmds):
+                nxt = _select_parts(cmds[j])
+                if nxt is None or nxt[1] != parts[1] or cmds[j].params != instr.params: break
+                if assigned.intersection(cmds[j].params): break
+                assigned.add(cmds[j].result)
+                j += 1
+            out.append(_fuse_reads(cmds[i:j]) if j - i > 1 else instr)
+        elif isinstance(instr, Sql) and not instr.read:
+            assigned = {instr.result}
+            while j < len(cmds):
+                nxt = cmds[j]
+                if not isinstance(nxt, Sql) or nxt.read or assigned.intersection(nxt.params): break
+                assigned.add(nxt.result)
+                j += 1
+            out.append(SqlBatch(tuple(cmds[i:j])) if j - i > 1 else instr)
+        else:
+            out.append(instr)
+        i = j
+    return tuple(out)
+
+
+def group_calls(cmds):
+    # Collects runs of independent Call instructions into one CallGroup. A run
+    # stops before a call that reads, or assigns again, an earlier result.
+    out = []
+    i = 0
+    while i < len(cmds):
+        instr = cmds[i]
+        j = i + 1
+        if isinstance(instr, Call):
+            assigned = {instr.result}
+            while j < len(cmds) and isinstance(cmds[j], Call):
+                reads = {a.slot for a in cmds[j].args if isinstance(a, VarRef)}
+                if cmds[j].result in assigned or assigned.intersection(reads): break
+                assigned.add(cmds[j].result)
+                j += 1
+        out.append(CallGroup(tuple(cmds[i:j])) if j - i > 1 else instr)
+        i = j
+    return tuple(out)
+
+
+class Compiler:
+    def __init__(self, name, flow, optimize=True):
+        self.name = name
+        self.flow = flow
+        self.optimize = optimize
+        self.index = {n: i for i, n in enumerate(flow)}
+        self.slots = {}
+
+    def slot(self, name):
+        # Every `$var` of the bot gets a fixed index in order of first use.
+        if name is None: return None
+        slot = self.slots.get(name)
+        if slot is None:
+            slot = self.slots[name] = len(self.slots)
+        return slot
+
+    def target(self, name):
+        # Undefined targets end the session, same as an unknown state did before.
+        if name == EXIT_TARGET: return EXIT
+        return self.index.get(name, EXIT)
+
+    def value(self, val):
+        if isinstance(val, dict) and val.get('type') == 'var_ref':
+            return VarRef(self.slot(val['name']), val['name'])
+        return val
+
+    def instruction(self, cmd):
+        ctype = cmd['type']
+        if ctype == 'say':
+            template = cmd.get('template') or Template(cmd['content'])
+            return Say(cmd['content'], template, tuple(self.slot(template.parts[i]) for i in template.slots))
+        elif ctype == 'listen':
+            return Listen(self.slot(cmd.get('var')))
+        elif ctype == 'sql':
+            sql, params, read = cmd.get('sql'), cmd.get('params'), cmd.get('read')
+            if sql is None: sql, params, read = compile_sql(cmd['query'])
+            return Sql(cmd['query'], self.slot(cmd['result']), sql, [self.slot(p) for p in params], read)
+        elif ctype == 'set':
+            return Set(self.slot(cmd['var']), self.value(cmd['value']))
+        elif ctype == 'call':
+            return Call(cmd['func'], [self.value(a) for a in cmd['args']], self.slot(cmd['result']))
+        elif ctype == 'if':
+            test = COMPARATORS.get(cmd['op'], _never)
+            return If(self.value(cmd['left']), test, self.value(cmd['right']), self.target(cmd['target']))
+        elif ctype == 'process':
+            cases = {intent: self.instruction(action) for intent, action in cmd['cases'].items()}
+            default = self.instruction(cmd['default']) if cmd['default'] else None
+            matcher = None
+            if cmd.get('keywords') or cmd.get('patterns'):
+                matcher = KeywordMatcher(cmd.get('keywords'), cmd.get('patterns'))
+            return Process(cases, default, matcher)
+        elif ctype == 'goto':
+            return Goto(self.target(cmd['target']))
+        elif ctype == 'exit':
+            return Exit()
+        raise ValueError(f"Unknown instruction type: {ctype}")
+
+    def compile(self):
+        names = list(self.flow.keys())
+        states = [tuple(self.instruction(cmd) for cmd in self.flow[n] if isinstance(cmd, dict)) for n in names]
+        if self.optimize:
+            states = [group_calls(fuse_sql(cmds)) for cmds in states]
+        return Program(self.name, names, states, slots=self.slots)
+
+
+def compile_flow(name, flow, optimize=True):
+    return Compiler(name, flow, optimize).compile()
+
+
+def compile_flows(flows, optimize=True):
+    return {name: compile_flow(name, flow, optimize) for name, flow in flows.items()}
@@ -1,35 +1,246 @@
+import queue
 import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE_SIZE = 256
+POOL_SIZE = 8
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}",
+)
+
+
+def connect(db_path):
+    # Autocommit connection: each statement is its own transaction unless
+    # wrapped in DBManager.transaction(). sqlite3 keeps an LRU of prepared
+    # statements per connection, so long-lived connections reuse them.
+    conn = sqlite3.connect(db_path, check_same_thread=False, timeout=BUSY_TIMEOUT_MS / 1000,
+                           isolation_level=None, cached_statements=STATEMENT_CACHE_SIZE)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    def __init__(self, db_path, size=POOL_SIZE):
+        self.db_path = db_path
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def acquire(self):
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return connect(self.db_path)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn):
+        if conn.in_transaction: conn.rollback()
+        self._idle.put(conn)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path, size=POOL_SIZE):
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = _pools[db_path] = ConnectionPool(db_path, size)
+        return pool
+
 
 class DBManager:
-    def __init__(self, db_path='bot_data.db'):
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
-        self.cursor = self.conn.cursor()
+    def __init__(self, db_path='bot_data.db', pool=None):
+        self.db_path = db_path
+        self.pool = pool
+        self.conn = None if pool else connect(db_path)
+        self._lock = threading.RLock()
+        self._local = threading.local()
+
+    @classmethod
+    def shared(cls, db_path='bot_data.db'):
+        return cls(db_path, pool=get_pool(db_path))
+
+    @contextmanager
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+        elif self.pool is not None:
+            with self.pool.connection() as conn:
+                yield conn
+        else:
+            with self._lock:
+                yield self.conn
+
+    def _run(self, sql, params, fetch):
+        # Hot path: one cursor call on whichever connection this thread may use.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self.pool is None:
+                with self._lock:
+                    cur = self.conn.execute(sql, params)
+                    return cur.fetchone() if fetch else cur.rowcount
+            conn = self.pool.acquire()
+            try:
+                cur = conn.execute(sql, params)
+                return cur.fetchone() if fetch else cur.rowcount
+            finally:
+                self.pool.release(conn)
+        cur = conn.execute(sql, params)
+        return cur.fetchone() if fetch else cur.rowcount
+
+    @contextmanager
+    def transaction(self):
+        # Statements issued by this thread inside the block share one
+        # connection and commit together; any exception rolls them back.
+        if getattr(self._local, 'conn', None) is not None:
+            yield self
+            return
+        with self._connection() as conn:
+            self._local.conn = conn
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    yield self
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                conn.execute("COMMIT")
+            finally:
+                self._local.conn = None
+
+    def in_transaction(self):
+        return getattr(self._local, 'conn', None) is not None
 
     def execute(self, sql, params=None):
         try:
-            if params:
-                self.cursor.execute(sql, params)
-            else:
-                self.cursor.execute(sql)
-            self.conn.commit()
-            return self.cursor.rowcount
+            return self._run(sql, params or (), False)
         except Exception as e:
+            # Inside a transaction the caller must see the failure to roll back.
+            if self.in_transaction(): raise
             print(f"[DB Error] {e}")
             return -1
 
     def fetch_one(self, sql, params=None):
+        row = self.fetch_row(sql, params)
+        return row[0] if row else None
+
+    def fetch_row(self, sql, params=None):
         try:
-            if params:
-                self.cursor.execute(sql, params)
-            else:
-                self.cursor.execute(sql)
-            result = self.cursor.fetchone()
-            if result:
-                return result[0]
-            return None
+            return self._run(sql, params or (), True)
         except Exception as e:
+            if self.in_transaction(): raise
             print(f"[DB Error] {e}")
             return None
 
+    def fetch_all(self, sql, params=None):
+        # Unlike fetch_row(), errors propagate: this is for tooling, not bots.
+        with self._connection() as conn:
+            return conn.execute(sql, params or ()).fetchall()
+
     def close(self):
-        self.conn.close()
\ No newline at end of file
+        if self.conn is not None:
+            self.conn.close()
+
+
+class QueryCache:
+    # Bounded LRU of SELECT rows keyed by (parameterized sql, params). Entries
+    # are dropped when the engine writes to a table they read. Writes made
+    # outside the engines sharing this cache are not seen.
+    MISS = object()
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self._rows = OrderedDict()
+        self._by_table = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.generation = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._rows.get(key)
+            if entry is None:
+                self.misses += 1
+                return self.MISS
+            self._rows.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, row, tables, generation=None):
+        # `generation` is the value read before querying the DB; a write in
+        # between makes the row possibly stale, so it is not stored.
+        with self._lock:
+            if generation is not None and generation != self.generation: return
+            if key in self._rows:
+                self._rows.move_to_end(key)
+            self._rows[key] = (row, tables)
+            for table in tables:
+                self._by_table.setdefault(table, set()).add(key)
+            while len(self._rows) > self.maxsize:
+                old_key, (_, old_tables) = self._rows.popitem(last=False)
+                self._forget(old_key, old_tables)
+
+    def invalidate(self, tables=None):
+        # No tables means "unknown target": drop everything.
+        with self._lock:
+            self.invalidations += 1
+            self.generation += 1
+            if not tables:
+                self._rows.clear()
+                self._by_table.clear()
+                return
+            for table in tables:
+                for key in self._by_table.pop(table, ()):
+                    entry = self._rows.pop(key, None)
+                    if entry: self._forget(key, entry[1])
+
+    def _forget(self, key, tables):
+        for table in tables:
+            keys = self._by_table.get(table)
+            if keys:
+                keys.discard(key)
+                if not keys: del self._by_table[table]
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._rows),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
@@ -0,0 +1,88 @@
+import asyncio
+import inspect
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+CALL_ERROR = "error"
+CALL_TIMEOUT = "timeout"
+CALL_WORKERS = int(os.getenv('DSLBOT_CALL_WORKERS', '16'))
+
+_loop = None
+_executor = None
+_lock = threading.Lock()
+
+
+def event_loop():
+    # One background loop runs the coroutines of every async function.
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='call-loop', daemon=True).start()
+        return _loop
+
+
+def executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=CALL_WORKERS, thread_name_prefix='call')
+        return _executor
+
+
+class ExternalFunction:
+    # A function registered for `call`. Plain functions run inline on the
+    # session thread unless `threaded` or a `timeout` moves them to the shared
+    # executor; coroutine functions always run on the shared event loop.
+    # `max_concurrency` caps how many calls of this function run at once.
+    __slots__ = ('name', 'func', 'timeout', 'is_async', 'threaded', 'limit', 'async_limit')
+
+    def __init__(self, name, func, timeout=None, max_concurrency=None, threaded=False):
+        self.name = name
+        self.func = func
+        self.timeout = timeout
+        self.is_async = inspect.iscoroutinefunction(func)
+        self.threaded = threaded or timeout is not None
+        self.limit = threading.BoundedSemaphore(max_concurrency) if max_concurrency and not self.is_async else None
+        self.async_limit = asyncio.Semaphore(max_concurrency) if max_concurrency and self.is_async else None
+
+    def __call__(self, *args):
+        return self.call(args)
+
+    def call(self, args):
+        # Result of the call, or CALL_ERROR / CALL_TIMEOUT; never raises.
+        if self.is_async or self.threaded:
+            return self.wait(self.start(args))
+        try:
+            return self._run(args)
+        except Exception as e:
+            print(f"[Call Error] {self.name}: {e}")
+            return CALL_ERROR
+
+    def start(self, args):
+        if self.is_async:
+            return asyncio.run_coroutine_threadsafe(self._run_async(args), event_loop())
+        return executor().submit(self._run, args)
+
+    def wait(self, future):
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            # A running thread can't be stopped; its result is just dropped.
+            future.cancel()
+            print(f"[Call Timeout] {self.name} after {self.timeout}s")
+            return CALL_TIMEOUT
+        except Exception as e:
+            print(f"[Call Error] {self.name}: {e}")
+            return CALL_ERROR
+
+    def _run(self, args):
+        if self.limit is None: return self.func(*args)
+        with self.limit:
+            return self.func(*args)
+
+    async def _run_async(self, args):
+        if self.async_limit is None: return await self.func(*args)
+        async with self.async_limit:
+            return await self.func(*args)
@@ -0,0 +1,164 @@
+import re
+import sqlite3
+from src.compiler import sql_tables
+from src.db_manager import DBManager
+
+# EXPLAIN QUERY PLAN detail of a full read ("SCAN TABLE t" before SQLite 3.36).
+SCAN = re.compile(r"^SCAN (?:TABLE )?([A-Za-z_][\w.]*)")
+WHERE = re.compile(r"\bWHERE\b(.*?)(?:\bGROUP\s+BY\b|\bORDER\s+BY\b|\bLIMIT\b|$)", re.IGNORECASE | re.DOTALL)
+VALUE = r"(?:\?|'[^']*'|-?\d+(?:\.\d+)?)"
+EQUALITY = re.compile(rf"([A-Za-z_][\w.]*)\s*(?:==?|\bIS\b)\s*{VALUE}", re.IGNORECASE)
+RANGE = re.compile(rf"([A-Za-z_][\w.]*)\s*(?:<(?!>)=?|>=?|\bBETWEEN\b)\s*{VALUE}", re.IGNORECASE)
+DISJUNCTION = re.compile(r"\bOR\b", re.IGNORECASE)
+
+
+def collect_statements(flows):
+    # The distinct `sql` commands of every bot, in script order, with the
+    # states that run them.
+    statements = {}
+    for bot, flow in flows.items():
+        for state, cmds in flow.items():
+            for cmd in cmds:
+                if not isinstance(cmd, dict) or cmd['type'] != 'sql': continue
+                entry = statements.get(cmd['sql'])
+                if entry is None:
+                    entry = statements[cmd['sql']] = {"sql": cmd['sql'], "params": len(cmd['params']),
+                                                      "read": cmd['read'], "used_by": []}
+                where = f"{bot}.{state}"
+                if where not in entry["used_by"]: entry["used_by"].append(where)
+    return list(statements.values())
+
+
+def query_plan(db, sql, params=0):
+    # The planner's detail lines; parameters are bound to NULL, nothing runs.
+    return [row[3] for row in db.fetch_all(f"EXPLAIN QUERY PLAN {sql}", (None,) * params)]
+
+
+def scanned_tables(plan, tables):
+    found = []
+    for detail in plan:
+        m = SCAN.match(detail)
+        if m and m.group(1).lower() in tables and m.group(1).lower() not in found:
+            found.append(m.group(1).lower())
+    return found
+
+
+def index_columns(sql):
+    # Columns an index needs to serve the WHERE clause: equality tests first,
+    # then at most one range test. Empty when the clause has an OR.
+    m = WHERE.search(sql)
+    if not m or DISJUNCTION.search(m.group(1)): return ()
+    columns = []
+    for col in EQUALITY.findall(m.group(1)):
+        col = col.split('.')[-1].lower()
+        if col not in columns: columns.append(col)
+    for col in RANGE.findall(m.group(1)):
+        col = col.split('.')[-1].lower()
+        if col not in columns:
+            columns.append(col)
+            break
+    return tuple(columns)
+
+
+def index_ddl(name, table, columns):
+    return f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+
+
+def schema_copy(db, table):
+    # An empty in-memory copy of `table` and its indexes, so a proposed index
+    # can be tried without building it over the real rows.
+    copy = DBManager(':memory:')
+    rows = db.fetch_all("SELECT sql FROM sqlite_master WHERE lower(tbl_name) = ? AND type IN ('table', 'index') "
+                        "AND sql IS NOT NULL ORDER BY type DESC", (table,))
+    for (ddl,) in rows:
+        copy.conn.execute(ddl)
+    return copy
+
+
+def _try_index(db, index, statements):
+    # True if the planner stops scanning the table once the index exists.
+    copy = schema_copy(db, index["table"])
+    try:
+        copy.conn.execute(index["ddl"])
+        return all(index["table"] not in scanned_tables(query_plan(copy, s["sql"], s["params"]), {index["table"]})
+                   for s in statements)
+    except sqlite3.Error:
+        return False
+    finally:
+        copy.close()
+
+
+def advise(db, flows):
+    # Plans every statement of `flows` against `db`. For each single-table
+    # statement that reads its table in full, proposes the index its WHERE
+    # clause needs; a proposal is `verified` when the planner picks it up.
+    statements = collect_statements(flows)
+    indexes = {}
+    for st in statements:
+        st.update(plan=[], scans=[], index=None, error=None)
+        tables = sql_tables(st["sql"], st["read"])
+        try:
+            st["plan"] = query_plan(db, st["sql"], st["params"])
+        except sqlite3.Error as e:
+            st["error"] = str(e)
+            continue
+        st["scans"] = scanned_tables(st["plan"], tables)
+        if len(tables) != 1 or not st["scans"]: continue
+        columns = index_columns(st["sql"])
+        if not columns: continue
+        table = st["scans"][0]
+        name = f"idx_{table}_{'_'.join(columns)}"
+        if name not in indexes:
+            indexes[name] = {"name": name, "table": table, "columns": list(columns),
+                             "ddl": index_ddl(name, table, columns), "statements": 0, "verified": False,
+                             "created": False}
+        indexes[name]["statements"] += 1
+        st["index"] = name
+    for index in indexes.values():
+        index["verified"] = _try_index(db, index, [s for s in statements if s["index"] == index["name"]])
+    return {
+        "statements": statements,
+        "scans": sum(1 for s in statements if s["scans"]),
+        "errors": sum(1 for s in statements if s["error"]),
+        "indexes": list(indexes.values()),
+    }
+
+
+def create_indexes(db, report):
+    # Creates the verified indexes of an advise() report. This builds each
+    # index over the live table and holds the write lock while it does.
+    created = []
+    for index in report["indexes"]:
+        if not index["verified"]: continue
+        try:
+            # In a transaction so a failure raises instead of being logged.
+            with db.transaction():
+                db.execute(index["ddl"])
+        except sqlite3.Error as e:
+            print(f"[Index Advisor] {index['name']}: {e}")
+            continue
+        index["created"] = True
+        created.append(index["name"])
+    return created
+
+
+def format_report(report, verbose=False):
+    lines = []
+    for st in report["statements"]:
+        if st["error"]:
+            lines.append(f"error   {st['sql']}  ({st['error']})")
+        elif st["scans"]:
+            fix = f"  -> {st['index']}" if st["index"] else "  (no index proposed)"
+            lines.append(f"SCAN    {', '.join(st['scans'])}: {st['sql']}{fix}")
+        elif verbose:
+            lines.append(f"ok      {st['sql']}")
+        if verbose or st["error"] or st["scans"]:
+            lines.append(f"        used by {', '.join(st['used_by'])}")
+            if verbose:
+                lines.extend(f"        plan: {detail}" for detail in st["plan"])
+    for index in report["indexes"]:
+        status = "created" if index["created"] else "verified" if index["verified"] else "not used by the planner"
+        lines.append(f"index   {index['ddl']};  -- {index['statements']} statement(s), {status}")
+    lines.append(f"{len(report['statements'])} statement(s), {report['scans']} full scan(s), "
+                 f"{report['errors']} error(s), {len(report['indexes'])} index(es) proposed")
+    return lines
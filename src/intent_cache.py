@@ -0,0 +1,98 @@
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from src.db_manager import connect
+
+EDGE_PUNCTUATION = "。．.!！?？,，、~～…"
+SPACES = re.compile(r"\s+")
+
+
+def normalize_input(text):
+    return SPACES.sub(" ", str(text)).strip().strip(EDGE_PUNCTUATION).strip().lower()
+
+
+class CachedIntentService:
+    # Memoizes detect_intent() of another service by (normalized input,
+    # candidate set), with LRU size and TTL eviction. With `db_path` the
+    # entries are written through to SQLite and reloaded on startup.
+    def __init__(self, service, maxsize=10000, ttl=86400, db_path=None):
+        self.service = service
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.conn = None
+        if db_path:
+            self.conn = connect(db_path)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS intent_cache (
+                    user_input TEXT,
+                    candidates TEXT,
+                    intent TEXT,
+                    expires REAL,
+                    PRIMARY KEY (user_input, candidates)
+                )
+            """)
+            self._load()
+
+    def _load(self):
+        now = time.time()
+        with self._lock:
+            self.conn.execute("DELETE FROM intent_cache WHERE expires <= ?", (now,))
+            rows = self.conn.execute(
+                "SELECT user_input, candidates, intent, expires FROM intent_cache ORDER BY expires DESC LIMIT ?",
+                (self.maxsize,)).fetchall()
+            for user_input, candidates, intent, expires in reversed(rows):
+                self._entries[(user_input, tuple(json.loads(candidates)))] = (intent, expires)
+
+    def detect_intent(self, user_input, candidates):
+        key = (normalize_input(user_input), tuple(sorted(candidates)))
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[key]
+            self.misses += 1
+
+        intent = self.service.detect_intent(user_input, candidates)
+        expires = now + self.ttl
+        with self._lock:
+            self._entries[key] = (intent, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            if self.conn is not None:
+                try:
+                    self.conn.execute("INSERT OR REPLACE INTO intent_cache VALUES (?,?,?,?)",
+                                      (key[0], json.dumps(key[1], ensure_ascii=False), intent, expires))
+                except Exception as e:
+                    print(f"[Intent Cache Error] {e}")
+        return intent
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self.conn is not None:
+                self.conn.execute("DELETE FROM intent_cache")
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
@@ -1,6 +1,27 @@
+import os
+import sqlite3
 import sys
-import re
-from lark import Transformer
+from collections import deque
+from contextlib import nullcontext
+from time import perf_counter
+from src.functions import ExternalFunction
+from src.compiler import (
+    EXIT, SUSPEND, OPCODES, OP_SAY, OP_LISTEN, OP_SQL, OP_SET, OP_CALL, OP_IF, OP_PROCESS, OP_GOTO, OP_EXIT,
+    OP_SQL_ROW, OP_SQL_BATCH, OP_CALL_GROUP,
+    UNSET, Template, VarRef, compile_flow,
+)
+
+# Inputs kept per session; `process` only reads the last one.
+HISTORY_DEPTH = int(os.getenv('DSLBOT_HISTORY_DEPTH', '4'))
+
+
+def __getattr__(name):
+    # BotInterpreter moved to src.transformer so that running compiled flows
+    # does not import Lark.
+    if name == 'BotInterpreter':
+        from src.transformer import BotInterpreter
+        return BotInterpreter
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class ConsoleAdapter:
@@ -10,228 +31,354 @@ class ConsoleAdapter:
 
 
 class Context:
-    def __init__(self, initial_state='Start'):
+    # Variables live in `values`, at the slots the compiler gave each `$var`
+    # of the bot (`layout`, shared by all its sessions). Names outside the
+    # layout, e.g. set before the context is bound to a program, go to `extra`.
+    # `started` is false until a session first runs the context.
+    __slots__ = ('state', 'pc', 'layout', 'values', 'extra', 'history', 'started')
+
+    def __init__(self, initial_state='Start', layout=None, history_depth=None):
         self.state = initial_state
-        self.variables = {}
-        self.history = []
+        self.pc = 0
+        self.layout = layout if layout is not None else {}
+        self.values = [UNSET] * len(self.layout)
+        self.extra = None
+        self.history = deque(maxlen=history_depth or HISTORY_DEPTH)
+        self.started = False
+
+    def bind(self, layout):
+        # Re-slots the variables for `layout`; a no-op if already bound to it.
+        if layout is self.layout: return
+        variables = self.variables
+        self.layout = layout
+        self.values = [UNSET] * len(layout)
+        self.extra = None
+        for name, value in variables.items():
+            self.set_var(name, value)
 
     def set_var(self, name, value):
-        self.variables[name] = value
+        slot = self.layout.get(name)
+        if slot is not None:
+            self.values[slot] = value
+        elif self.extra is None:
+            self.extra = {name: value}
+        else:
+            self.extra[name] = value
 
     def get_var(self, name):
-        return self.variables.get(name, "")
+        slot = self.layout.get(name)
+        if slot is not None: return self.values[slot]
+        return self.extra.get(name, "") if self.extra else ""
+
+    def get(self, name, default=None):
+        # Like dict.get() over the variables that are set; Template.render uses it.
+        slot = self.layout.get(name)
+        if slot is not None:
+            val = self.values[slot]
+            return default if val is UNSET else val
+        return self.extra.get(name, default) if self.extra else default
+
+    @property
+    def variables(self):
+        found = {name: self.values[slot] for name, slot in self.layout.items() if self.values[slot] is not UNSET}
+        if self.extra: found.update(self.extra)
+        return found
 
     def format_string(self, text):
-        for key, val in self.variables.items():
-            text = text.replace(key, str(val))
-        return text
-
-
-class BotInterpreter(Transformer):
-    def __init__(self):
-        super().__init__()
-        self.flows = {}
-
-    def bot_def(self, items):
-        self.flows[str(items[0])] = {k: v for k, v in items[1:]}
-        return str(items[0])
-
-    def state_def(self, items):
-        return (str(items[0]), list(items[1:]))
-
-    def instruction(self, items):
-        return items[0]
-
-    def say_cmd(self, items):
-        raw = items[0].value[1:-1] if hasattr(items[0], 'value') else str(items[0]).strip('"')
-        return {'type': 'say', 'content': raw}
-
-    def listen_cmd(self, items):
-        var = str(items[0]) if items else None
-        return {'type': 'listen', 'var': var}
-
-    def goto_cmd(self, items):
-        return {'type': 'goto', 'target': str(items[0])}
-
-    def exit_cmd(self, items):
-        return {'type': 'exit'}
-
-    def set_cmd(self, items):
-        return {'type': 'set', 'var': str(items[0]), 'value': items[1]}
-
-    def call_cmd(self, items):
-        func = str(items[0])
-        res = str(items[-1])
-        args = items[1:-1]
-        return {'type': 'call', 'func': func, 'args': args, 'result': res}
-
-    def if_cmd(self, items):
-        return {'type': 'if', 'left': items[0], 'op': str(items[1]), 'right': items[2], 'target': str(items[3])}
+        return Template(text).render(self)
 
-    def sql_cmd(self, items):
-        q = items[0].value[1:-1]
-        res = str(items[1]) if len(items) > 1 else None
-        return {'type': 'sql', 'query': q, 'result': res}
+    def to_dict(self):
+        return {'state': self.state, 'pc': self.pc, 'variables': self.variables, 'history': list(self.history),
+                'started': self.started}
 
-    def process_cmd(self, items):
-        cases = {}
-        default = None
-        for item in items:
-            if item['type'] == 'case':
-                cases[item['intent']] = item['action']
-            elif item['type'] == 'default':
-                default = item['action']
-        return {'type': 'process', 'cases': cases, 'default': default}
-
-    def case_rule(self, items):
-        return {'type': 'case', 'intent': str(items[0]).strip('"'), 'action': items[1]}
-
-    def default_rule(self, items):
-        return {'type': 'default', 'action': items[0]}
-
-    def action(self, items):
-        return items[0]
-
-    def value(self, items):
-        token = items[0]
-        if token.type == 'STRING':
-            return token.value[1:-1]
-        elif token.type == 'INT':
-            return int(token.value)
-        elif token.type == 'VAR_NAME':
-            return {'type': 'var_ref', 'name': token.value}
-        return token.value
+    @classmethod
+    def from_dict(cls, data, layout=None):
+        ctx = cls(data['state'], layout)
+        ctx.pc = data.get('pc', 0)
+        for name, value in data.get('variables', {}).items():
+            ctx.set_var(name, value)
+        ctx.history.extend(data.get('history', []))
+        # Records written before this field existed were all mid-session.
+        ctx.started = data.get('started', True)
+        return ctx
 
 
 class RuntimeEngine:
-    def __init__(self, flows, db_manager=None, io_adapter=None):
+    def __init__(self, flows, db_manager=None, io_adapter=None, programs=None, sql_cache=None,
+                 prefetch_calls=False, metrics=None, tracer=None, cache_reads=True):
         self.flows = flows
+        # src.metrics.Metrics, or None to run without timing hooks.
+        self.metrics = metrics
+        # src.trace.Tracer, or None to run without recording.
+        self.tracer = tracer
+        self.prefetch_calls = prefetch_calls
+        self.programs = programs if programs is not None else {}
+        # Writes always invalidate `sql_cache`; reads only go through it with
+        # `cache_reads`, so bots left out of the read cache still keep it fresh.
+        self.sql_cache = sql_cache
+        self.read_cache = sql_cache if cache_reads else None
         self.llm_service = None
         self.external_functions = {}
-        self.db = db_manager
+        self.db = metrics.timed_db(db_manager) if metrics and db_manager else db_manager
         self.io = io_adapter if io_adapter else ConsoleAdapter()
+        if tracer:
+            if self.db: self.db = tracer.wrap_db(self.db)
+            self.io = tracer.wrap_io(self.io)
+        handlers = [None] * len(OPCODES)
+        handlers[OP_SAY] = self._op_say
+        handlers[OP_LISTEN] = self._op_listen
+        handlers[OP_SQL] = self._op_sql
+        handlers[OP_SET] = self._op_set
+        handlers[OP_CALL] = self._op_call
+        handlers[OP_IF] = self._op_if
+        handlers[OP_PROCESS] = self._op_process
+        handlers[OP_GOTO] = self._op_goto
+        handlers[OP_EXIT] = self._op_exit
+        handlers[OP_SQL_ROW] = self._op_sql_row
+        handlers[OP_SQL_BATCH] = self._op_sql_batch
+        handlers[OP_CALL_GROUP] = self._op_call_group
+        self._handlers = tuple(handlers)
 
     def set_llm_service(self, service):
+        if self.metrics and service: service = self.metrics.timed_intents(service)
+        if self.tracer and service: service = self.tracer.wrap_llm(service)
         self.llm_service = service
 
-    def register_function(self, name, func):
-        self.external_functions[name] = func
+    def register_function(self, name, func, timeout=None, max_concurrency=None, threaded=False):
+        func = ExternalFunction(name, func, timeout, max_concurrency, threaded)
+        self.external_functions[name] = self.tracer.wrap_function(func) if self.tracer else func
+
+    def _program(self, bot_name):
+        program = self.programs.get(bot_name)
+        if program is None and bot_name in self.flows:
+            program = self.programs[bot_name] = compile_flow(bot_name, self.flows[bot_name])
+        return program
 
     def _resolve_value(self, val, context):
-        if isinstance(val, dict) and val.get('type') == 'var_ref':
-            return context.get_var(val['name'])
+        # Unset variables read as "" everywhere but in `say` templates.
+        if isinstance(val, VarRef):
+            val = context.values[val.slot]
+            return "" if val is UNSET else val
         return val
 
-    def _execute_sql(self, query, context):
+    def _db_fetch_row(self, sql, params):
+        # Managers without fetch_row() only expose the first column.
+        fetch_row = getattr(self.db, 'fetch_row', None)
+        if fetch_row is not None: return fetch_row(sql, params)
+        val = self.db.fetch_one(sql, params)
+        return None if val is None else (val,)
+
+    def _fetch_row(self, sql, params, tables):
+        cache = self.read_cache
+        if cache is None:
+            row = self._db_fetch_row(sql, params)
+        else:
+            key = (sql, params)
+            row = cache.get(key)
+            if row is cache.MISS:
+                generation = cache.generation
+                row = self._db_fetch_row(sql, params)
+                if row is not None: cache.put(key, row, tables, generation)
+        # Recorded here rather than in TracingDB so cache hits are traced too.
+        if self.tracer is not None: self.tracer.query(sql, params, list(row) if row is not None else None)
+        return row
+
+    def _execute_sql(self, stmt, context):
         if not self.db: return 0
-        pattern = r"(\$[a-zA-Z0-9_]+)"
-        matches = re.findall(pattern, query)
-        params = [context.get_var(var) for var in matches]
-        safe_query = re.sub(pattern, "?", query)
+        values = context.values
+        params = tuple([values[slot] for slot in stmt.params])
         try:
-            if safe_query.strip().upper().startswith("SELECT"):
-                res = self.db.fetch_one(safe_query, tuple(params))
-                return res if res is not None else 0
+            if stmt.read:
+                row = self._fetch_row(stmt.sql, params, stmt.tables)
+                return row[0] if row and row[0] is not None else 0
             else:
-                return self.db.execute(safe_query, tuple(params))
-        except:
+                try:
+                    return self.db.execute(stmt.sql, params)
+                finally:
+                    if self.sql_cache is not None: self.sql_cache.invalidate(stmt.tables)
+        except sqlite3.Error:
+            # Only database errors read as 0; a manager missing a method raises.
             return 0
 
-    def _execute_instruction(self, cmd, context, mock_inputs=None):
-        if not isinstance(cmd, dict): return False, None
-        ctype = cmd['type']
-
-        if ctype == 'say':
-            text = context.format_string(cmd['content'])
-            self.io.send(text)
-            return False, None
-
-        elif ctype == 'listen':
-            val = mock_inputs.pop(0) if mock_inputs else self.io.receive()
-            if val == "EXIT":
-                return True, 'Exit'
-            context.history.append(val)
-            if cmd.get('var'): context.set_var(cmd['var'], val)
-            return False, None
-
-        elif ctype == 'sql':
-            res = self._execute_sql(cmd['query'], context)
-            if cmd['result']: context.set_var(cmd['result'], res)
-            return False, None
-
-        elif ctype == 'set':
-            val = self._resolve_value(cmd['value'], context)
-            context.set_var(cmd['var'], val)
-            return False, None
-
-        elif ctype == 'call':
-            if cmd['func'] in self.external_functions:
-                args = [self._resolve_value(a, context) for a in cmd['args']]
-                try:
-                    res = self.external_functions[cmd['func']](*args)
-                    context.set_var(cmd['result'], res)
-                except:
-                    context.set_var(cmd['result'], "error")
-            return False, None
-
-        elif ctype == 'if':
-            l, r = self._resolve_value(cmd['left'], context), self._resolve_value(cmd['right'], context)
-            op = cmd['op']
-            met = False
-            sl, sr = str(l), str(r)
-            if op == '==':
-                met = (sl == sr)
-            elif op == '!=':
-                met = (sl != sr)
+    # Opcode handlers return None to fall through to the next instruction,
+    # or the index of the state to jump to (EXIT ends the session).
+    def _op_say(self, instr, context):
+        self.io.send(instr.template.render_values(context.values, instr.refs))
+
+    def _op_listen(self, instr, context):
+        return SUSPEND
+
+    def _accept_input(self, instr, context, val):
+        if self.tracer is not None: self.tracer.input(val)
+        if val == "EXIT":
+            return EXIT
+        context.history.append(val)
+        if instr.var is not None: context.values[instr.var] = val
+
+    def _op_sql(self, instr, context):
+        res = self._execute_sql(instr, context)
+        if instr.result is not None: context.values[instr.result] = res
+
+    def _op_sql_row(self, instr, context):
+        row = None
+        if self.db:
+            values = context.values
+            params = tuple([values[slot] for slot in instr.params])
             try:
-                if op == '>':
-                    met = (float(l) > float(r))
-                elif op == '<':
-                    met = (float(l) < float(r))
-            except:
+                row = self._fetch_row(instr.sql, params, instr.tables)
+            except sqlite3.Error:
                 pass
-            if met: return True, cmd['target']
-            return False, None
-
-        elif ctype == 'process':
-            if not self.llm_service: return True, 'Exit'
-            last = context.history[-1] if context.history else ""
-            cands = list(cmd['cases'].keys())
-            intent = self.llm_service.detect_intent(last, cands)
-            match = cmd['cases'].get(intent, cmd['default'])
-            if match: return self._execute_instruction(match, context, mock_inputs)
-            return False, None
-
-        elif ctype == 'goto':
-            return True, cmd['target']
-        elif ctype == 'exit':
-            return True, 'Exit'
-        return False, None
-
-    def run(self, bot_name, mock_inputs=None):
-        if bot_name not in self.flows: return
-        flow = self.flows[bot_name]
-        ctx = Context()
-        print(f"--- Bot {bot_name} Started ---")
-
+        for i, slot in enumerate(instr.results):
+            val = row[i] if row else None
+            context.values[slot] = val if val is not None else 0
+
+    def _op_sql_batch(self, instr, context):
+        if not self.db:
+            results = [0] * len(instr.statements)
+        else:
+            results = []
+            # Managers without transaction() run the statements one by one.
+            transaction = getattr(self.db, 'transaction', nullcontext)
+            try:
+                with transaction():
+                    for stmt in instr.statements:
+                        params = tuple([context.values[slot] for slot in stmt.params])
+                        results.append(self.db.execute(stmt.sql, params))
+            except sqlite3.Error as e:
+                print(f"[DB Error] {e}")
+                results = [-1] * len(instr.statements)
+            if self.sql_cache is not None:
+                for stmt in instr.statements:
+                    self.sql_cache.invalidate(stmt.tables)
+        for stmt, res in zip(instr.statements, results):
+            if stmt.result is not None: context.values[stmt.result] = res
+
+    def _op_set(self, instr, context):
+        context.values[instr.var] = self._resolve_value(instr.value, context)
+
+    def _op_call(self, instr, context):
+        func = self.external_functions.get(instr.func)
+        if func is None: return
+        args = [self._resolve_value(a, context) for a in instr.args]
+        context.values[instr.result] = func.call(args)
+
+    def _op_call_group(self, instr, context):
+        if not self.prefetch_calls:
+            for call in instr.calls:
+                self._op_call(call, context)
+            return
+        # Start every call, then join them in order; none of them reads
+        # another's result, so the outcome matches sequential execution.
+        started = []
+        for call in instr.calls:
+            func = self.external_functions.get(call.func)
+            if func is None: continue
+            started.append((call, func, func.start([self._resolve_value(a, context) for a in call.args])))
+        for call, func, future in started:
+            context.values[call.result] = func.wait(future)
+
+    def _op_if(self, instr, context):
+        if instr.test(self._resolve_value(instr.left, context), self._resolve_value(instr.right, context)):
+            return instr.target
+
+    def _op_process(self, instr, context):
+        last = context.history[-1] if context.history else ""
+        # DSL-declared keywords/patterns decide when exactly one case matches;
+        # only a miss or a tie goes to the LLM.
+        intent = instr.matcher.match(last) if instr.matcher else None
+        if intent is None:
+            if not self.llm_service: return EXIT
+            try:
+                intent = self.llm_service.detect_intent(last, instr.candidates)
+            except Exception as e:
+                # Deadline or upstream failure: take the `default` branch.
+                print(f"[LLM Error] {e}")
+                intent = None
+        action = instr.cases.get(intent, instr.default)
+        if action is not None:
+            return self._handlers[action.op](action, context)
+
+    def _op_goto(self, instr, context):
+        return instr.target
+
+    def _op_exit(self, instr, context):
+        return EXIT
+
+    # Runs a bot as a generator that suspends at every `listen`; each yield
+    # waits for one input delivered with send(). While suspended, ctx.state
+    # and ctx.pc point at the pending listen, so a new generator over the
+    # same context resumes from there.
+    def session(self, bot_name, context=None, mock_inputs=None):
+        program = self._program(bot_name)
+        if program is None: return
+        metrics = self.metrics
+        handlers = self._handlers if metrics is None else metrics.instrument(self._handlers, bot_name)
+        states = program.states
+        names = program.names
+        if context is None:
+            ctx = Context(layout=program.slots)
+        else:
+            ctx = context
+            ctx.bind(program.slots)
+        if not ctx.started:
+            # Resumed sessions (a stored Context) are not announced again.
+            print(f"--- Bot {bot_name} Started ---")
+            ctx.started = True
+
+        # Programs from load_script() are verified loop-safe; only ad-hoc
+        # flows still need the step guard.
+        guarded = not program.verified
         max_steps = 1000
         steps = 0
 
-        while ctx.state != 'Exit':
-            if steps > max_steps:
-                print("Error: Max execution steps reached (Infinite Loop detected).")
-                break
-
-            if ctx.state not in flow: break
-            cmds = flow[ctx.state]
-            idx = 0
-            while idx < len(cmds):
-                brk, nxt = self._execute_instruction(cmds[idx], ctx, mock_inputs)
-                if brk:
-                    if nxt: ctx.state = nxt
-                    break
-                idx += 1
-            steps += 1
-
-        self.io.send("Session Ended")
-        print("--- Session Ended ---")
\ No newline at end of file
+        state = program.index.get(ctx.state, EXIT)
+        pc = ctx.pc
+        tracer = self.tracer
+        if tracer is not None: tracer.begin(bot_name, ctx)
+        try:
+            while state != EXIT:
+                if guarded:
+                    if steps > max_steps:
+                        print("Error: Max execution steps reached (Infinite Loop detected).")
+                        break
+                    steps += 1
+
+                ctx.state = names[state]
+                if tracer is not None: tracer.state(ctx.state)
+                cmds = states[state]
+                if metrics is not None:
+                    visit = metrics.state_histogram(bot_name, ctx.state)
+                    started = perf_counter()
+                while pc < len(cmds):
+                    instr = cmds[pc]
+                    nxt = handlers[instr.op](instr, ctx)
+                    if nxt == SUSPEND:
+                        ctx.pc = pc
+                        if metrics is not None: paused = perf_counter()
+                        val = mock_inputs.pop(0) if mock_inputs else (yield)
+                        # Time spent waiting for the user is not part of the visit.
+                        if metrics is not None: started += perf_counter() - paused
+                        nxt = self._accept_input(instr, ctx, val)
+                    if nxt is not None:
+                        state = nxt
+                        break
+                    pc += 1
+                if metrics is not None: visit.observe(perf_counter() - started)
+                pc = 0
+
+            ctx.pc = 0
+            if state == EXIT: ctx.state = 'Exit'
+            self.io.send("Session Ended")
+            print("--- Session Ended ---")
+        finally:
+            # Abandoned sessions (closed while waiting for input) are recorded too.
+            if tracer is not None: tracer.finish(ctx)
+
+    def run(self, bot_name, mock_inputs=None):
+        gen = self.session(bot_name, mock_inputs=mock_inputs)
+        try:
+            next(gen)
+            while True:
+                gen.send(self.io.receive())
+        except StopIteration:
+            pass
@@ -1,19 +1,73 @@
 import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
-from zai import ZhipuAiClient
 
 load_dotenv()
 
+LATENCY_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+UNKNOWN = "UNKNOWN"
+
+
+def max_tokens_for(candidates):
+    # Room for the longest answer (at worst ~2 tokens per CJK character)
+    # plus quotes and whitespace; anything longer is not a valid answer.
+    return 2 * max(len(c) for c in list(candidates) + [UNKNOWN]) + 8
+
+
+def early_intent(text, candidates):
+    # The only answer still consistent with a streamed prefix, or None
+    # while several remain (or none, as the full reply may yet contain one).
+    clean = text.replace('"', '').replace("'", "").lstrip()
+    if not clean: return None
+    live = [c for c in list(candidates) + [UNKNOWN] if c.startswith(clean) or clean.startswith(c)]
+    return live[0] if len(live) == 1 else None
+
+
+class IntentUnavailable(Exception):
+    pass
+
 
 class LLMService:
-    def __init__(self):
-        self.api_key = os.getenv("ZHIPU_API_KEY")
-        self.model_name = os.getenv("ZHIPU_MODEL_NAME", "glm-4-flash")
+    # One instance is shared by every session. At most `max_in_flight`
+    # requests are outstanding at once; each detect_intent() call gets
+    # `deadline` seconds in total, including the wait for a free slot.
+    # With `hedge`, a second request is sent once the first has been
+    # pending longer than the recent p95 latency and the first answer wins.
+    # With `stream`, the reply is read incrementally and abandoned as soon as
+    # its prefix identifies the answer (see early_intent()).
+    def __init__(self, api_key=None, model_name=None, base_url=None, deadline=None, max_in_flight=None,
+                 hedge=None, stream=None, max_attempts=2):
+        self.api_key = api_key or os.getenv("ZHIPU_API_KEY")
+        self.model_name = model_name or os.getenv("ZHIPU_MODEL_NAME", "glm-4-flash")
 
         if not self.api_key:
             raise ValueError("CRITICAL ERROR: ZHIPU_API_KEY not found in .env file!")
 
-        self.client = ZhipuAiClient(api_key=self.api_key)
+        self.deadline = deadline if deadline is not None else float(os.getenv("DSLBOT_LLM_DEADLINE", "8"))
+        self.max_in_flight = max_in_flight or int(os.getenv("DSLBOT_LLM_MAX_IN_FLIGHT", "16"))
+        self.hedge = hedge if hedge is not None else os.getenv("DSLBOT_LLM_HEDGE", "0") == "1"
+        self.stream = stream if stream is not None else os.getenv("DSLBOT_LLM_STREAM", "0") == "1"
+        self.max_attempts = max_attempts
+
+        # The SDK takes longer to import than the rest of the app together, so
+        # it is loaded with the first service rather than with this module.
+        from zai import ZhipuAiClient
+        # Retries are done here, inside the deadline, not by the SDK.
+        self.client = ZhipuAiClient(api_key=self.api_key, base_url=base_url or os.getenv("ZHIPU_BASE_URL") or None,
+                                    timeout=self.deadline, max_retries=0)
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='llm')
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedged = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.early_stops = 0
 
     def detect_intent(self, user_input, candidates):
         candidates_str = ", ".join([f'"{c}"' for c in candidates])
@@ -23,22 +77,137 @@ class LLMService:
             f"Output only the exact intent string. Return 'UNKNOWN' if no match."
         )
 
+        request = self._request_stream if self.stream else self._request
+        content = self._complete(request, system_content, candidates).strip()
+        clean_intent = content.replace('"', '').replace("'", "")
+
+        if clean_intent in candidates:
+            return clean_intent
+
+        for c in candidates:
+            if c in clean_intent:
+                return c
+
+        return UNKNOWN
+
+    def _request(self, content, candidates):
         response = self.client.chat.completions.create(
             model=self.model_name,
             messages=[
-                {"role": "user", "content": system_content}
+                {"role": "user", "content": content}
             ],
             temperature=0.01,
+            max_tokens=max_tokens_for(candidates),
         )
+        return response.choices[0].message.content
 
-        content = response.choices[0].message.content.strip()
-        clean_intent = content.replace('"', '').replace("'", "")
+    def _request_stream(self, content, candidates):
+        # Stops reading, and drops the connection, as soon as the prefix
+        # identifies a single candidate or UNKNOWN.
+        stream = self.client.chat.completions.create(
+            model=self.model_name,
+            messages=[
+                {"role": "user", "content": content}
+            ],
+            temperature=0.01,
+            max_tokens=max_tokens_for(candidates),
+            stream=True,
+        )
+        text = ""
+        try:
+            for chunk in stream:
+                if not chunk.choices: continue
+                text += chunk.choices[0].delta.content or ""
+                intent = early_intent(text, candidates)
+                if intent is not None:
+                    with self._lock: self.early_stops += 1
+                    return intent
+        finally:
+            stream.response.close()
+        return text
 
-        if clean_intent in candidates:
-            return clean_intent
+    def _complete(self, request, *args):
+        # Raises IntentUnavailable when no answer arrives before the deadline.
+        deadline = time.monotonic() + self.deadline
+        pending = set()
+        attempts = 0
+        hedge_at = None
+        error = None
+        try:
+            while True:
+                now = time.monotonic()
+                if now >= deadline: break
+                if not pending:
+                    if attempts >= self.max_attempts: break
+                    future = self._submit(request, args, deadline - now)
+                    if future is None: break
+                    attempts += 1
+                    pending.add(future)
+                    delay = self._hedge_delay()
+                    hedge_at = time.monotonic() + delay if delay is not None else None
+                until = deadline if hedge_at is None else min(deadline, hedge_at)
+                done, pending = wait(pending, timeout=max(0.0, until - time.monotonic()), return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None: return future.result() or ""
+                    error = future.exception()
+                if pending and hedge_at is not None and time.monotonic() >= hedge_at:
+                    hedge_at = None
+                    # Only hedge with a free slot; never queue behind real traffic.
+                    future = self._submit(request, args, 0) if attempts < self.max_attempts else None
+                    if future is not None:
+                        attempts += 1
+                        pending.add(future)
+                        with self._lock: self.hedged += 1
+        finally:
+            for future in pending:
+                future.cancel()
+        with self._lock:
+            if error is not None and not pending: self.errors += 1
+            else: self.timeouts += 1
+        raise IntentUnavailable(f"no answer within {self.deadline}s" + (f": {error}" if error else ""))
 
-        for c in candidates:
-            if c in clean_intent:
-                return c
+    def _submit(self, request, args, timeout):
+        if not self._slots.acquire(timeout=timeout): return None
+        started = time.monotonic()
+        try:
+            future = self._executor.submit(request, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._done(f, started))
+        with self._lock: self.requests += 1
+        return future
+
+    def _done(self, future, started):
+        # The slot is held until the HTTP call really ends, even if the caller
+        # already gave up on it, so the in-flight cap is honest.
+        self._slots.release()
+        if not future.cancelled() and future.exception() is None:
+            with self._lock: self._latencies.append(time.monotonic() - started)
+
+    def _hedge_delay(self):
+        if not self.hedge: return None
+        with self._lock:
+            if len(self._latencies) < HEDGE_MIN_SAMPLES: return None
+            ordered = sorted(self._latencies)
+        return ordered[int(len(ordered) * 0.95) - 1]
 
-        return "UNKNOWN"
\ No newline at end of file
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hedged": self.hedged,
+                "errors": self.errors,
+                "timeouts": self.timeouts,
+                "early_stops": self.early_stops,
+            }
+
+
+class LazyLLMService:
+    # Stands in for the shared service until the first detect_intent() call,
+    # so sessions that never reach an LLM fallback never load the SDK.
+    def __init__(self, factory):
+        self.factory = factory
+
+    def detect_intent(self, user_input, candidates):
+        return self.factory().detect_intent(user_input, candidates)
@@ -0,0 +1,109 @@
+import hashlib
+import os
+import pickle
+import threading
+from src.analyzer import verify
+from src.compiler import compile_flows
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+GRAMMAR_FILE = os.path.join(SRC_DIR, 'dsl_parser', 'grammar.lark')
+PROJECT_ROOT = os.path.dirname(SRC_DIR)
+CACHE_DIR = os.getenv('DSLBOT_CACHE_DIR', os.path.join(PROJECT_ROOT, '.dsl_cache'))
+
+# Changes to these modules alter the pickled flow/program layout, so their
+# source is part of every cache key.
+TOOLCHAIN_FILES = ('transformer.py', 'interpreter.py', 'compiler.py', 'matcher.py', 'analyzer.py')
+
+_lock = threading.Lock()
+_parser = None
+_grammar_digest = None
+_toolchain_digest = None
+# Script path -> (cache key, (flows, programs)) of the version loaded last.
+_loaded = {}
+
+
+def _read(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _toolchain():
+    global _toolchain_digest
+    if _toolchain_digest is None:
+        _toolchain_digest = _digest(''.join(_read(os.path.join(SRC_DIR, f)) for f in TOOLCHAIN_FILES))
+    return _toolchain_digest
+
+
+def grammar_digest():
+    global _grammar_digest
+    if _grammar_digest is None:
+        _grammar_digest = _digest(_read(GRAMMAR_FILE))
+    return _grammar_digest
+
+
+def get_parser():
+    # Lark is only imported when a script misses the flow cache.
+    global _parser
+    with _lock:
+        if _parser is None:
+            from lark import Lark
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            cache_file = os.path.join(CACHE_DIR, f'grammar-{grammar_digest()[:16]}.lark')
+            _parser = Lark(_read(GRAMMAR_FILE), parser='lalr', cache=cache_file)
+        return _parser
+
+
+def parse_script(script):
+    from src.transformer import BotInterpreter
+    interpreter = BotInterpreter()
+    interpreter.transform(get_parser().parse(script))
+    return interpreter.flows
+
+
+def script_version(script_path):
+    # Cache key of the version of `script_path` loaded last, or None. It
+    # changes with the script, the grammar and the toolchain.
+    memo = _loaded.get(os.path.abspath(script_path))
+    return memo[0] if memo else None
+
+
+def load_script(script_path, cache_dir=CACHE_DIR):
+    script = _read(script_path)
+    key = _digest(grammar_digest() + _toolchain() + _digest(script))
+    path = os.path.abspath(script_path)
+    memo = _loaded.get(path)
+    if memo is not None and memo[0] == key:
+        return memo[1]
+
+    cache_file = os.path.join(cache_dir, f'{key}.flows')
+    result = None
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file, 'rb') as f:
+                result = pickle.load(f)
+        except Exception as e:
+            print(f"[Loader] Ignoring unreadable cache {cache_file}: {e}")
+
+    if result is None:
+        flows = parse_script(script)
+        for warning in verify(flows):
+            print(f"[Loader] {script_path}: {warning}")
+        programs = compile_flows(flows)
+        for program in programs.values():
+            program.verified = True
+        result = (flows, programs)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = f'{cache_file}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, cache_file)
+        except OSError as e:
+            print(f"[Loader] Could not write cache {cache_file}: {e}")
+
+    _loaded[path] = (key, result)
+    return result
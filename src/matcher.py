@@ -0,0 +1,72 @@
+import re
+from collections import deque
+
+
+class KeywordMatcher:
+    # Resolves a `process` block locally from the keywords/patterns declared
+    # on its cases. All keywords share one Aho-Corasick automaton, so a scan
+    # is linear in the input no matter how many keywords there are.
+    def __init__(self, keywords=None, patterns=None):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        for intent, words in (keywords or {}).items():
+            for word in words:
+                if word: self._add(word.lower(), intent)
+        self._build()
+        self._patterns = [(re.compile(p, re.IGNORECASE), intent)
+                          for intent, ps in (patterns or {}).items() for p in ps]
+
+    def _add(self, word, intent):
+        node = 0
+        for ch in word:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            node = nxt
+        self._out[node] = self._out[node] + ((len(word), intent),)
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text):
+        # All (start, end, intent) hits of keywords and patterns in `text`.
+        hits = []
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for i, ch in enumerate(text.lower()):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for length, intent in out[node]:
+                hits.append((i + 1 - length, i + 1, intent))
+        for pattern, intent in self._patterns:
+            for m in pattern.finditer(text):
+                if m.end() > m.start(): hits.append((m.start(), m.end(), intent))
+        return hits
+
+    def match(self, text):
+        # The single intent left after dropping hits nested inside a longer
+        # hit ("流量" inside "买流量"), or None when nothing or several match.
+        hits = self.find(text)
+        if not hits: return None
+        intents = {hit[2] for hit in hits}
+        if len(intents) == 1: return intents.pop()
+        intents = set()
+        for start, end, intent in hits:
+            if not any(s <= start and end <= e and (e - s) > (end - start) for s, e, _ in hits):
+                intents.add(intent)
+        return intents.pop() if len(intents) == 1 else None
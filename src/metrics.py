@@ -0,0 +1,175 @@
+import threading
+from bisect import bisect_left
+from time import perf_counter
+from src.compiler import OP_NAMES
+
+# Upper bounds in seconds, from a cheap opcode (~50us) to a slow LLM call.
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+           5.0, 10.0)
+
+HELP = {
+    'dslbot_instruction_seconds': "Time spent in one instruction handler, by bot and opcode.",
+    'dslbot_state_seconds': "Time spent executing one visit of a state, excluding waits for input.",
+    'dslbot_sql_seconds': "Time spent in one SQL statement, by parameterized statement.",
+    'dslbot_intent_seconds': "Time spent in one detect_intent call, by outcome.",
+}
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'lock')
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        # Per-bucket (not cumulative) counts; the last slot is +Inf.
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        i = bisect_left(self.buckets, seconds)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += seconds
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.sum
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    return ','.join(f'{k}="{_escape(v)}"' for k, v in pairs)
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    # Registry of latency histograms keyed by (name, labels), plus gauges
+    # computed at scrape time. Engines built with `metrics=None` never touch
+    # it, so disabled hooks cost nothing per instruction.
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}
+        self._gauges = []
+        self._lock = threading.Lock()
+
+    def histogram(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        hist = self._histograms.get(key)
+        if hist is None:
+            with self._lock:
+                hist = self._histograms.get(key)
+                if hist is None:
+                    hist = self._histograms[key] = Histogram(self.buckets)
+        return hist
+
+    def gauge(self, name, help_text, fn):
+        # `fn()` returns the current value, or None to leave it out.
+        self._gauges.append((name, help_text, fn))
+
+    def instrument(self, handlers, bot_name):
+        # A copy of an engine's handler table that times every opcode.
+        def timed(handler, hist):
+            observe = hist.observe
+
+            def wrapper(instr, context):
+                started = perf_counter()
+                try:
+                    return handler(instr, context)
+                finally:
+                    observe(perf_counter() - started)
+            return wrapper
+
+        return tuple(timed(h, self.histogram('dslbot_instruction_seconds', bot=bot_name, op=OP_NAMES[op]))
+                     if h else h for op, h in enumerate(handlers))
+
+    def state_histogram(self, bot_name, state):
+        return self.histogram('dslbot_state_seconds', bot=bot_name, state=state)
+
+    def timed_db(self, db):
+        return TimedDB(db, self)
+
+    def timed_intents(self, service):
+        return TimedIntentService(service, self)
+
+    def render(self):
+        # Prometheus text exposition format, version 0.0.4.
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+        current = None
+        for (name, labels), hist in histograms:
+            if name != current:
+                current = name
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+            counts, total = hist.snapshot()
+            cumulative = 0
+            for bound, count in zip(list(self.buckets) + ['+Inf'], counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{_labels(labels + (("le", bound),))}}} {cumulative}')
+            suffix = f'{{{_labels(labels)}}}' if labels else ''
+            lines.append(f"{name}_sum{suffix} {_number(total)}")
+            lines.append(f"{name}_count{suffix} {cumulative}")
+        for name, help_text, fn in self._gauges:
+            try:
+                value = fn()
+            except Exception as e:
+                print(f"[Metrics Error] {name}: {e}")
+                continue
+            if value is None: continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+class TimedDB:
+    # Times fetch_row()/fetch_one()/execute() of a DBManager, whichever it
+    # has, so a manager without fetch_row() still looks like one to the
+    # engine; everything else passes through.
+    TIMED = ('fetch_row', 'fetch_one', 'execute')
+
+    def __init__(self, db, metrics):
+        self.db = db
+        self.metrics = metrics
+        for name in self.TIMED:
+            method = getattr(db, name, None)
+            if method is not None: setattr(self, name, self._timed(method))
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+    def _timed(self, method):
+        def timed(sql, params=None):
+            started = perf_counter()
+            try:
+                return method(sql, params)
+            finally:
+                self.metrics.histogram('dslbot_sql_seconds', statement=sql).observe(perf_counter() - started)
+        return timed
+
+
+class TimedIntentService:
+    def __init__(self, service, metrics):
+        self.service = service
+        self.ok = metrics.histogram('dslbot_intent_seconds', outcome='ok')
+        self.error = metrics.histogram('dslbot_intent_seconds', outcome='error')
+
+    def __getattr__(self, name):
+        return getattr(self.service, name)
+
+    def detect_intent(self, user_input, candidates):
+        started = perf_counter()
+        try:
+            intent = self.service.detect_intent(user_input, candidates)
+        except Exception:
+            self.error.observe(perf_counter() - started)
+            raise
+        self.ok.observe(perf_counter() - started)
+        return intent
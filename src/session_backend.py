@@ -0,0 +1,192 @@
+import json
+import os
+import threading
+import time
+from src.db_manager import connect
+from src.interpreter import Context
+
+
+class SQLiteSessionBackend:
+    # Conversation state shared by every web worker process: the serialized
+    # Context of each chat, its pending user inputs (inbox) and the bot
+    # messages not yet polled (outbox). A lease on the chat row makes sure
+    # only one worker at a time advances a conversation.
+    def __init__(self, db_path='bot_data.db'):
+        self.conn = connect(db_path)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS chat_sessions (
+                    uid TEXT PRIMARY KEY,
+                    script TEXT,
+                    bot TEXT,
+                    context TEXT,
+                    finished INTEGER DEFAULT 0,
+                    owner TEXT,
+                    lease_until REAL DEFAULT 0,
+                    updated REAL,
+                    version TEXT
+                );
+                CREATE TABLE IF NOT EXISTS chat_inbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    uid TEXT,
+                    text TEXT
+                );
+                CREATE INDEX IF NOT EXISTS chat_inbox_uid ON chat_inbox (uid, id);
+                CREATE TABLE IF NOT EXISTS chat_outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    uid TEXT,
+                    message TEXT
+                );
+                CREATE INDEX IF NOT EXISTS chat_outbox_uid ON chat_outbox (uid, id);
+                CREATE TABLE IF NOT EXISTS app_settings (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+            """)
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(chat_sessions)")]
+            if 'version' not in columns:
+                self.conn.execute("ALTER TABLE chat_sessions ADD COLUMN version TEXT")
+
+    def _write(self, statements):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, params in statements:
+                    self.conn.execute(sql, params)
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def create(self, uid, script, bot_name, context, version=None):
+        # Replaces whatever the uid had before, queues and all.
+        uid = str(uid)
+        self._write([
+            ("DELETE FROM chat_inbox WHERE uid = ?", (uid,)),
+            ("DELETE FROM chat_outbox WHERE uid = ?", (uid,)),
+            ("INSERT OR REPLACE INTO chat_sessions (uid, script, bot, context, finished, owner, lease_until, updated, "
+             "version) VALUES (?,?,?,?,0,NULL,0,?,?)", (uid, script, bot_name, self._dump(context), time.time(), version)),
+        ])
+
+    def load(self, uid):
+        # (script, bot_name, Context, finished, version) or None.
+        with self.lock:
+            row = self.conn.execute("SELECT script, bot, context, finished, version FROM chat_sessions WHERE uid = ?",
+                                    (str(uid),)).fetchone()
+        if row is None: return None
+        return row[0], row[1], Context.from_dict(json.loads(row[2])), bool(row[3]), row[4]
+
+    def exists(self, uid):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM chat_sessions WHERE uid = ?", (str(uid),)).fetchone() is not None
+
+    def commit_step(self, uid, context, finished, messages):
+        # Stores the advanced Context and its output in one transaction.
+        uid = str(uid)
+        statements = [("UPDATE chat_sessions SET context = ?, finished = ?, updated = ? WHERE uid = ?",
+                       (self._dump(context), int(finished), time.time(), uid))]
+        statements += [("INSERT INTO chat_outbox (uid, message) VALUES (?, ?)",
+                        (uid, json.dumps(m, ensure_ascii=False))) for m in messages]
+        self._write(statements)
+
+    def delete(self, uid):
+        uid = str(uid)
+        self._write([("DELETE FROM chat_sessions WHERE uid = ?", (uid,)),
+                     ("DELETE FROM chat_inbox WHERE uid = ?", (uid,)),
+                     ("DELETE FROM chat_outbox WHERE uid = ?", (uid,))])
+
+    def clear(self):
+        self._write([("DELETE FROM chat_sessions", ()), ("DELETE FROM chat_inbox", ()),
+                     ("DELETE FROM chat_outbox", ())])
+
+    def purge(self, ttl):
+        # Drops conversations untouched for `ttl` seconds; returns how many.
+        cutoff = time.time() - ttl
+        with self.lock:
+            uids = [r[0] for r in self.conn.execute("SELECT uid FROM chat_sessions WHERE updated < ? AND lease_until < ?",
+                                                    (cutoff, time.time())).fetchall()]
+        for uid in uids:
+            self.delete(uid)
+        return len(uids)
+
+    def push_input(self, uid, text):
+        # `None` is the start marker queued by a new conversation.
+        with self.lock:
+            self.conn.execute("INSERT INTO chat_inbox (uid, text) VALUES (?, ?)", (str(uid), text))
+
+    def pop_input(self, uid):
+        # (True, text) for the oldest queued input, or (False, None).
+        with self.lock:
+            row = self.conn.execute(
+                "DELETE FROM chat_inbox WHERE id = (SELECT MIN(id) FROM chat_inbox WHERE uid = ?) RETURNING text",
+                (str(uid),)).fetchone()
+        return (True, row[0]) if row else (False, None)
+
+    def has_input(self, uid):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM chat_inbox WHERE uid = ? LIMIT 1", (str(uid),)).fetchone() is not None
+
+    def orphaned_input(self, uid):
+        # Inputs are queued but no worker holds a live lease on the chat.
+        with self.lock:
+            return self.conn.execute(
+                "SELECT 1 FROM chat_sessions WHERE uid = ? AND (owner IS NULL OR lease_until < ?) "
+                "AND EXISTS (SELECT 1 FROM chat_inbox WHERE uid = chat_sessions.uid)",
+                (str(uid), time.time())).fetchone() is not None
+
+    def pop_outputs(self, uid):
+        with self.lock:
+            rows = self.conn.execute("DELETE FROM chat_outbox WHERE uid = ? RETURNING id, message",
+                                     (str(uid),)).fetchall()
+        return [json.loads(message) for _, message in sorted(rows)]
+
+    def claim(self, uid, owner, lease):
+        # Takes the chat for `lease` seconds unless another owner holds it.
+        now = time.time()
+        with self.lock:
+            cur = self.conn.execute(
+                "UPDATE chat_sessions SET owner = ?, lease_until = ? "
+                "WHERE uid = ? AND (owner IS NULL OR owner = ? OR lease_until < ?)",
+                (owner, now + lease, str(uid), owner, now))
+            return cur.rowcount == 1
+
+    def release(self, uid, owner):
+        with self.lock:
+            self.conn.execute("UPDATE chat_sessions SET owner = NULL, lease_until = 0 WHERE uid = ? AND owner = ?",
+                              (str(uid), owner))
+
+    def counts(self):
+        # Unfinished conversations and queued inputs/outputs across all chats.
+        with self.lock:
+            return self.conn.execute(
+                "SELECT (SELECT COUNT(*) FROM chat_sessions WHERE finished = 0), "
+                "(SELECT COUNT(*) FROM chat_inbox), (SELECT COUNT(*) FROM chat_outbox)").fetchone()
+
+    def get_setting(self, key, default=None):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM app_settings WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_setting(self, key, value):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO app_settings VALUES (?, ?)", (key, value))
+
+    def close(self):
+        self.conn.close()
+
+    @staticmethod
+    def _dump(context):
+        return json.dumps(context.to_dict(), ensure_ascii=False, default=str)
+
+
+BACKENDS = {
+    'sqlite': SQLiteSessionBackend,
+}
+
+
+def get_backend(name=None, **kwargs):
+    name = name or os.getenv('DSLBOT_SESSION_BACKEND', 'sqlite')
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown session backend: {name}")
+    return BACKENDS[name](**kwargs)
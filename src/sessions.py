@@ -0,0 +1,413 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from src.interpreter import Context
+from src.db_manager import connect
+from src.web import BufferAdapter
+
+_START = object()
+
+
+class WorkerPool(ThreadPoolExecutor):
+    # Thread pool that counts tasks submitted and not yet started.
+    def __init__(self, max_workers, thread_name_prefix=''):
+        super().__init__(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self.queued = 0
+        self._queued_lock = threading.Lock()
+
+    def submit(self, fn, /, *args, **kwargs):
+        def run():
+            with self._queued_lock:
+                self.queued -= 1
+            return fn(*args, **kwargs)
+
+        with self._queued_lock:
+            self.queued += 1
+        try:
+            return super().submit(run)
+        except BaseException:
+            with self._queued_lock:
+                self.queued -= 1
+            raise
+
+
+class Session:
+    __slots__ = ('uid', 'engine', 'bot_name', 'script', 'version', 'context', 'gen', 'inbox', 'lock', 'running',
+                 'suspended', 'resumed', 'last_active')
+
+    def __init__(self, uid, engine, bot_name, context=None, script=None, version=None):
+        self.uid = uid
+        self.engine = engine
+        self.bot_name = bot_name
+        self.script = script
+        # Content hash of the script (src.loader.script_version); a parked
+        # state/pc is only valid for the compiled program it came from.
+        self.version = version
+        self.context = context if context is not None else Context()
+        self.gen = engine.session(bot_name, self.context)
+        self.inbox = deque([_START])
+        self.lock = threading.Lock()
+        self.running = False
+        self.suspended = False
+        # Rehydrated from the store: its first step only re-parks it at the
+        # listen it was evicted from.
+        self.resumed = False
+        self.last_active = time.monotonic()
+
+    @property
+    def adapter(self):
+        return self.engine.io
+
+
+class SessionStore:
+    # Parked conversations evicted from memory, keyed by session uid.
+    def __init__(self, db_path='bot_data.db'):
+        self.conn = connect(db_path)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS suspended_sessions (
+                    uid TEXT PRIMARY KEY,
+                    script TEXT,
+                    bot TEXT,
+                    context TEXT,
+                    updated REAL,
+                    version TEXT
+                )
+            """)
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(suspended_sessions)")]
+            if 'version' not in columns:
+                self.conn.execute("ALTER TABLE suspended_sessions ADD COLUMN version TEXT")
+
+    def save(self, uid, script, bot_name, context, version=None):
+        data = json.dumps(context.to_dict(), ensure_ascii=False, default=str)
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO suspended_sessions (uid, script, bot, context, updated, version) "
+                              "VALUES (?,?,?,?,?,?)", (str(uid), script, bot_name, data, time.time(), version))
+
+    def load(self, uid):
+        with self.lock:
+            row = self.conn.execute("SELECT script, bot, context, version FROM suspended_sessions WHERE uid = ?",
+                                    (str(uid),)).fetchone()
+        if row is None: return None
+        return row[0], row[1], Context.from_dict(json.loads(row[2])), row[3]
+
+    def exists(self, uid):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM suspended_sessions WHERE uid = ?", (str(uid),)).fetchone() is not None
+
+    def delete(self, uid):
+        with self.lock:
+            self.conn.execute("DELETE FROM suspended_sessions WHERE uid = ?", (str(uid),))
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM suspended_sessions")
+
+    def close(self):
+        self.conn.close()
+
+
+class SessionManager:
+    # Conversations are RuntimeEngine.session() generators parked at `listen`.
+    # An idle session holds no thread; a fixed pool advances whichever
+    # sessions have pending input, one step at a time per session.
+    def __init__(self, max_workers=8, store=None):
+        self.sessions = {}
+        self.store = store
+        self.executor = WorkerPool(max_workers, thread_name_prefix='bot-worker')
+        self._lock = threading.Lock()
+        self._reaper = None
+        self._reaper_stop = threading.Event()
+
+    def start(self, uid, engine, bot_name, context=None, script=None, version=None):
+        return self._register(Session(uid, engine, bot_name, context, script, version))
+
+    def _register(self, session):
+        uid = session.uid
+        with self._lock:
+            old = self.sessions.pop(uid, None)
+            self.sessions[uid] = session
+        if old: self._close(old)
+        self._schedule(session)
+        return session
+
+    def get(self, uid):
+        return self.sessions.get(uid)
+
+    def deliver(self, uid, text):
+        session = self.sessions.get(uid)
+        if session is None: return False
+        with session.lock:
+            if session.suspended: return False
+            session.last_active = time.monotonic()
+            session.inbox.append(text)
+        self._schedule(session)
+        return True
+
+    def stop(self, uid):
+        with self._lock:
+            session = self.sessions.pop(uid, None)
+        if session: self._close(session)
+        if self.store: self.store.delete(uid)
+
+    def stop_all(self):
+        with self._lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+        for session in sessions:
+            self._close(session)
+        if self.store: self.store.clear()
+
+    def shutdown(self, wait=True):
+        self.stop_reaper()
+        self.stop_all()
+        self.executor.shutdown(wait=wait)
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def pending_inputs(self):
+        return sum(len(s.inbox) for s in list(self.sessions.values()))
+
+    def queue_depth(self):
+        # Session steps submitted to the pool and not yet picked up.
+        return self.executor.queued
+
+    def suspend_idle(self, ttl):
+        # Parked sessions idle for `ttl` seconds are written to the store and
+        # dropped; finished ones are just dropped. Returns the evicted uids.
+        cutoff = time.monotonic() - ttl
+        with self._lock:
+            idle = [s for s in self.sessions.values() if s.last_active < cutoff]
+        evicted = []
+        for session in idle:
+            with session.lock:
+                if session.running or session.inbox: continue
+                if session.gen is not None:
+                    if self.store is None: continue
+                    self.store.save(session.uid, session.script, session.bot_name, session.context, session.version)
+                    session.gen.close()
+                    session.suspended = True
+                session.gen = None
+            with self._lock:
+                if self.sessions.get(session.uid) is session:
+                    del self.sessions[session.uid]
+            evicted.append(session.uid)
+        return evicted
+
+    def resume(self, uid, make_engine, script=None, version=None):
+        # Rehydrates a suspended session with make_engine(bot_name); returns
+        # None if nothing is stored for `uid` or it was suspended under a
+        # different script, or another version of it.
+        if self.store is None: return None
+        record = self.store.load(uid)
+        if record is None: return None
+        self.store.delete(uid)
+        saved_script, bot_name, context, saved_version = record
+        if saved_script != script or saved_version != version: return None
+        session = Session(uid, make_engine(bot_name), bot_name, context, script, version)
+        session.resumed = True
+        return self._register(session)
+
+    def start_reaper(self, ttl, interval=60, on_evict=None):
+        def loop():
+            while not self._reaper_stop.wait(interval):
+                try:
+                    for uid in self.suspend_idle(ttl):
+                        if on_evict: on_evict(uid)
+                except Exception as e:
+                    print(f"[Reaper Error] {e}")
+
+        self._reaper_stop.clear()
+        self._reaper = threading.Thread(target=loop, name='session-reaper', daemon=True)
+        self._reaper.start()
+
+    def stop_reaper(self):
+        if self._reaper:
+            self._reaper_stop.set()
+            self._reaper.join()
+            self._reaper = None
+
+    def _schedule(self, session):
+        with session.lock:
+            if session.running: return
+            session.running = True
+        self.executor.submit(self._drain, session)
+
+    def _drain(self, session):
+        while True:
+            with session.lock:
+                if not session.inbox or session.gen is None:
+                    session.running = False
+                    return
+                gen = session.gen
+                val = session.inbox.popleft()
+            self._advance(session, gen, val)
+
+    def _advance(self, session, gen, val):
+        engine = session.engine
+        try:
+            if val is _START:
+                next(gen)
+            else:
+                gen.send(val)
+            # A resumed session's first step only re-parks it; the client
+            # already has input enabled for the message it is resumed for.
+            if val is not _START or not session.resumed:
+                engine.io.request_input()
+        except StopIteration:
+            self._finish(session)
+        except Exception as e:
+            print(f"Error: {e}")
+            engine.io.send(f"System Error: {e}")
+            self._finish(session)
+        session.last_active = time.monotonic()
+
+    def _finish(self, session):
+        # Finished sessions stay registered so their last messages can still
+        # be polled; the reaper drops them once idle.
+        with session.lock:
+            session.gen = None
+
+    def _close(self, session):
+        with session.lock:
+            gen, session.gen = session.gen, None
+            running = session.running
+            session.inbox.clear()
+        # A generator that is mid-step on a worker finishes that step and is
+        # then dropped by _drain; only a parked one can be closed here.
+        if gen is not None and not running:
+            gen.close()
+
+
+class SharedSessionManager:
+    # Multi-process runtime: conversations live in a session backend, not in
+    # this process. Whichever worker receives an input queues it and tries to
+    # take the chat's lease; the lease holder rebuilds the generator from the
+    # stored Context, feeds it the queued inputs one by one and writes back
+    # the new Context and the bot's messages. make_engine(adapter, bot_name,
+    # script, version) returns None for a script version it cannot run.
+    def __init__(self, backend, make_engine, max_workers=8, lease=60):
+        self.backend = backend
+        self.make_engine = make_engine
+        self.lease = lease
+        self.executor = WorkerPool(max_workers, thread_name_prefix='bot-worker')
+        self._prefix = f"{os.getpid()}:"
+        self._reaper = None
+        self._reaper_stop = threading.Event()
+
+    def start(self, uid, bot_name, script, context=None, version=None):
+        self.backend.create(uid, script, bot_name, context if context is not None else Context(), version)
+        self.backend.push_input(uid, None)
+        self.schedule(uid)
+
+    def deliver(self, uid, text):
+        record = self.backend.load(uid)
+        if record is None or record[3]: return False
+        self.backend.push_input(uid, text)
+        self.schedule(uid)
+        return True
+
+    def messages(self, uid, wait=0, interval=0.1):
+        # Pending bot messages, waiting up to `wait` seconds for the first.
+        # None once the conversation is gone.
+        deadline = time.monotonic() + wait
+        rescheduled = False
+        while True:
+            msgs = self.backend.pop_outputs(uid)
+            if msgs: return msgs
+            if not self.backend.exists(uid): return None
+            # Inputs left behind by a crashed worker are picked up here, once
+            # per poll; a chat whose lease is live is already being drained.
+            if not rescheduled and self.backend.orphaned_input(uid):
+                self.schedule(uid)
+                rescheduled = True
+            if time.monotonic() >= deadline: return []
+            time.sleep(interval)
+
+    def stop(self, uid):
+        self.backend.delete(uid)
+
+    def stop_all(self):
+        self.backend.clear()
+
+    def queue_depth(self):
+        return self.executor.queued
+
+    def shutdown(self, wait=True):
+        self.stop_reaper()
+        self.executor.shutdown(wait=wait)
+
+    def start_reaper(self, ttl, interval=60):
+        def loop():
+            while not self._reaper_stop.wait(interval):
+                try:
+                    self.backend.purge(ttl)
+                except Exception as e:
+                    print(f"[Reaper Error] {e}")
+
+        self._reaper_stop.clear()
+        self._reaper = threading.Thread(target=loop, name='session-reaper', daemon=True)
+        self._reaper.start()
+
+    def stop_reaper(self):
+        if self._reaper:
+            self._reaper_stop.set()
+            self._reaper.join()
+            self._reaper = None
+
+    def schedule(self, uid):
+        self.executor.submit(self.drain, uid)
+
+    def drain(self, uid):
+        owner = self._prefix + uuid.uuid4().hex
+        while self.backend.claim(uid, owner, self.lease):
+            try:
+                while True:
+                    found, text = self.backend.pop_input(uid)
+                    if not found: break
+                    self.step(uid, text)
+                    # Lease lost (expired, or taken by another worker): that
+                    # worker now owns the chat and its remaining inputs.
+                    if not self.backend.claim(uid, owner, self.lease): return
+            except Exception as e:
+                print(f"[Session Error] {uid}: {e}")
+            finally:
+                self.backend.release(uid, owner)
+            # An input queued while the lease was being released would
+            # otherwise wait for the next request.
+            if not self.backend.has_input(uid): return
+
+    def step(self, uid, text):
+        record = self.backend.load(uid)
+        if record is None: return
+        script, bot_name, context, finished, version = record
+        if finished: return
+        adapter = BufferAdapter()
+        # The stored state/pc only make sense in the program they came from.
+        engine = self.make_engine(adapter, bot_name, script, version)
+        if engine is None:
+            # Started under a script, or a version of it, this deployment no
+            # longer serves.
+            self.backend.delete(uid)
+            return
+        gen = engine.session(bot_name, context)
+        try:
+            next(gen)
+            if text is not None: gen.send(text)
+            adapter.request_input()
+            finished = False
+        except StopIteration:
+            finished = True
+        except Exception as e:
+            print(f"Error: {e}")
+            adapter.send(f"System Error: {e}")
+            finished = True
+        finally:
+            gen.close()
+        self.backend.commit_step(uid, context, finished, adapter.messages)
@@ -0,0 +1,332 @@
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from time import perf_counter
+from src.functions import CALL_ERROR
+from src.interpreter import Context, RuntimeEngine
+
+# Trace events are short lists, in the order they happened:
+#   ["s", state]                          a state visit
+#   ["i", text]                           a user input (including "EXIT")
+#   ["o", text]                           a bot message
+#   ["q", sql, params, result]            a SQL statement and its row/rowcount
+#   ["n", input, candidates, intent, err] a detect_intent call
+#   ["c", func, args, result]             a `call` result
+TRACE_VERSION = 1
+OBSERVED = ('s', 'o')
+
+
+def _key(*parts):
+    return json.dumps(parts, ensure_ascii=False, default=str)
+
+
+class TraceWriter:
+    # Appends one JSON line per finished session to `path`.
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def write(self, trace):
+        line = json.dumps(trace, ensure_ascii=False, default=str, separators=(',', ':'))
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class Tracer:
+    # Records the sessions of one RuntimeEngine. The engine calls begin() and
+    # finish() around each session and wraps its DB, IO, LLM service and
+    # `call` functions with the recording proxies below.
+    def __init__(self, sink, script=None):
+        self.sink = sink
+        self.script = script
+        self.trace = None
+
+    def begin(self, bot_name, context):
+        self.trace = {"v": TRACE_VERSION, "script": self.script, "bot": bot_name, "started": time.time(),
+                      "context": context.to_dict(), "events": []}
+
+    def event(self, *event):
+        if self.trace is not None: self.trace["events"].append(list(event))
+
+    def state(self, name):
+        self.event('s', name)
+
+    def input(self, text):
+        self.event('i', text)
+
+    def query(self, sql, params, result):
+        self.event('q', sql, list(params or ()), result)
+
+    def finish(self, context):
+        trace, self.trace = self.trace, None
+        if trace is None: return
+        trace["elapsed"] = round(time.time() - trace["started"], 3)
+        trace["final"] = context.state
+        try:
+            self.sink.write(trace)
+        except Exception as e:
+            print(f"[Trace Error] {e}")
+
+    def wrap_db(self, db):
+        return TracingDB(db, self)
+
+    def wrap_io(self, io):
+        return TracingIO(io, self)
+
+    def wrap_llm(self, service):
+        return TracingLLM(service, self)
+
+    def wrap_function(self, func):
+        return TracingFunction(func, self)
+
+
+class TracingDB:
+    def __init__(self, db, tracer):
+        self.db = db
+        self.tracer = tracer
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+    # Reads are recorded by RuntimeEngine._fetch_row, above the SQL cache.
+    def execute(self, sql, params=None):
+        res = self.db.execute(sql, params)
+        self.tracer.query(sql, params, res)
+        return res
+
+
+class TracingIO:
+    def __init__(self, io, tracer):
+        self.io = io
+        self.tracer = tracer
+
+    def __getattr__(self, name):
+        return getattr(self.io, name)
+
+    def send(self, text):
+        self.tracer.event('o', text)
+        self.io.send(text)
+
+
+class TracingLLM:
+    def __init__(self, service, tracer):
+        self.service = service
+        self.tracer = tracer
+
+    def __getattr__(self, name):
+        return getattr(self.service, name)
+
+    def detect_intent(self, user_input, candidates):
+        try:
+            intent = self.service.detect_intent(user_input, candidates)
+        except Exception as e:
+            self.tracer.event('n', user_input, list(candidates), None, str(e))
+            raise
+        self.tracer.event('n', user_input, list(candidates), intent, None)
+        return intent
+
+
+class TracingFunction:
+    def __init__(self, func, tracer):
+        self.func = func
+        self.tracer = tracer
+
+    def __getattr__(self, name):
+        return getattr(self.func, name)
+
+    def call(self, args):
+        res = self.func.call(args)
+        self.tracer.event('c', self.func.name, list(args), res)
+        return res
+
+    def start(self, args):
+        return args, self.func.start(args)
+
+    def wait(self, pending):
+        args, future = pending
+        res = self.func.wait(future)
+        self.tracer.event('c', self.func.name, list(args), res)
+        return res
+
+
+def load_traces(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip(): yield json.loads(line)
+
+
+class ReplayError(Exception):
+    # Raised by replayed detect_intent calls that failed when recorded.
+    pass
+
+
+class Recorded:
+    # Answers one kind of external effect from a trace, keyed by its
+    # arguments, in recorded order. The last answer for a key is reused (a
+    # cached read, a retried call); unknown keys are counted as misses.
+    def __init__(self):
+        self._answers = {}
+        self.misses = []
+
+    def add(self, key, answer):
+        self._answers.setdefault(key, deque()).append(answer)
+
+    def get(self, key, default=None):
+        answers = self._answers.get(key)
+        if not answers:
+            self.misses.append(key)
+            return default
+        return answers.popleft() if len(answers) > 1 else answers[0]
+
+
+class ReplayDB:
+    def __init__(self, trace):
+        self.results = Recorded()
+        for e in trace["events"]:
+            if e[0] == 'q': self.results.add(_key(e[1], e[2]), e[3])
+
+    def fetch_row(self, sql, params=None):
+        row = self.results.get(_key(sql, list(params or ())))
+        return tuple(row) if isinstance(row, list) else None
+
+    def execute(self, sql, params=None):
+        res = self.results.get(_key(sql, list(params or ())), -1)
+        return res if isinstance(res, int) else -1
+
+    @contextmanager
+    def transaction(self):
+        yield self
+
+
+class ReplayLLM:
+    def __init__(self, trace):
+        self.intents = Recorded()
+        self.by_input = {}
+        for e in trace["events"]:
+            if e[0] == 'n':
+                self.intents.add(_key(e[1], sorted(e[2])), (e[3], e[4]))
+                self.by_input.setdefault(e[1], (e[3], e[4]))
+
+    def detect_intent(self, user_input, candidates):
+        answer = self.intents.get(_key(user_input, sorted(candidates)))
+        if answer is None:
+            # The new flow asks about this input with other candidates (or
+            # asks the LLM where the old one matched a keyword): reuse the
+            # recorded decision if it is still one of the options.
+            intent, _ = self.by_input.get(user_input, (None, None))
+            return intent if intent in candidates else "UNKNOWN"
+        intent, err = answer
+        if err is not None: raise ReplayError(err)
+        return intent
+
+
+class ReplayFunction:
+    def __init__(self, name, calls):
+        self.name = name
+        self.calls = calls
+
+    def call(self, args):
+        return self.calls.get(_key(self.name, list(args)), CALL_ERROR)
+
+    def start(self, args):
+        return args
+
+    def wait(self, args):
+        return self.call(args)
+
+
+class ReplayIO:
+    def __init__(self):
+        self.outputs = []
+
+    def send(self, text):
+        self.outputs.append(text)
+
+    def request_input(self):
+        pass
+
+
+class MemorySink:
+    # Sink that holds on to the last trace instead of writing it.
+    def __init__(self):
+        self.trace = None
+
+    def write(self, trace):
+        self.trace = trace
+
+
+def observed(events):
+    return [(e[0], e[1]) for e in events if e[0] in OBSERVED]
+
+
+def replay(flows, programs, trace):
+    # Runs `trace` against (flows, programs) with every effect served from
+    # the trace. Returns the observed events of the new run, per-turn times,
+    # unserved effects and the first point where the run diverges.
+    sink = MemorySink()
+    tracer = Tracer(sink)
+    calls = Recorded()
+    names = set()
+    for e in trace["events"]:
+        if e[0] == 'c':
+            calls.add(_key(e[1], e[2]), e[3])
+            names.add(e[1])
+    db = ReplayDB(trace)
+    llm = ReplayLLM(trace)
+    engine = RuntimeEngine(flows, db_manager=db, io_adapter=ReplayIO(), programs=programs, tracer=tracer)
+    engine.set_llm_service(llm)
+    for name in names:
+        engine.external_functions[name] = ReplayFunction(name, calls)
+
+    inputs = [e[1] for e in trace["events"] if e[0] == 'i']
+    turns = []
+    extra_inputs = 0
+    gen = engine.session(trace["bot"], Context.from_dict(trace["context"]))
+    started = perf_counter()
+    try:
+        next(gen)
+        turns.append(perf_counter() - started)
+        while True:
+            if inputs:
+                val = inputs.pop(0)
+            else:
+                # The new flow wants more input than was recorded.
+                extra_inputs += 1
+                val = "EXIT"
+            started = perf_counter()
+            try:
+                gen.send(val)
+            finally:
+                turns.append(perf_counter() - started)
+    except StopIteration:
+        pass
+    finally:
+        gen.close()
+
+    new = sink.trace
+    expected, got = observed(trace["events"]), observed(new["events"])
+    divergence = None
+    for i in range(max(len(expected), len(got))):
+        a = expected[i] if i < len(expected) else None
+        b = got[i] if i < len(got) else None
+        if a != b:
+            divergence = {"index": i, "expected": a, "got": b}
+            break
+    if divergence is None and extra_inputs:
+        divergence = {"index": len(got), "expected": None, "got": ["i", "EXIT"]}
+    return {
+        "ok": divergence is None and new["final"] == trace.get("final", new["final"]),
+        "divergence": divergence,
+        "final": new["final"],
+        "unused_inputs": len(inputs),
+        "misses": len(db.results.misses) + len(llm.intents.misses) + len(calls.misses),
+        "turns": turns,
+    }
@@ -0,0 +1,106 @@
+import json
+from lark import Transformer
+from src.compiler import Template, compile_sql
+
+
+def _string_value(token):
+    # Keyword and pattern literals honour JSON escapes ("\\d+" is the regex \d+).
+    try:
+        return json.loads(token.value)
+    except ValueError:
+        return token.value[1:-1]
+
+
+class BotInterpreter(Transformer):
+    def __init__(self):
+        super().__init__()
+        self.flows = {}
+
+    def bot_def(self, items):
+        self.flows[str(items[0])] = {k: v for k, v in items[1:]}
+        return str(items[0])
+
+    def state_def(self, items):
+        return (str(items[0]), list(items[1:]))
+
+    def instruction(self, items):
+        return items[0]
+
+    def say_cmd(self, items):
+        raw = items[0].value[1:-1] if hasattr(items[0], 'value') else str(items[0]).strip('"')
+        return {'type': 'say', 'content': raw, 'template': Template(raw)}
+
+    def listen_cmd(self, items):
+        var = str(items[0]) if items else None
+        return {'type': 'listen', 'var': var}
+
+    def goto_cmd(self, items):
+        return {'type': 'goto', 'target': str(items[0])}
+
+    def exit_cmd(self, items):
+        return {'type': 'exit'}
+
+    def set_cmd(self, items):
+        return {'type': 'set', 'var': str(items[0]), 'value': items[1]}
+
+    def call_cmd(self, items):
+        func = str(items[0])
+        res = str(items[-1])
+        args = items[1:-1]
+        return {'type': 'call', 'func': func, 'args': args, 'result': res}
+
+    def if_cmd(self, items):
+        return {'type': 'if', 'left': items[0], 'op': str(items[1]), 'right': items[2], 'target': str(items[3])}
+
+    def sql_cmd(self, items):
+        q = items[0].value[1:-1]
+        res = str(items[1]) if len(items) > 1 else None
+        sql, params, read = compile_sql(q)
+        return {'type': 'sql', 'query': q, 'sql': sql, 'params': params, 'read': read, 'result': res}
+
+    def process_cmd(self, items):
+        cases = {}
+        default = None
+        keywords = {}
+        patterns = {}
+        for item in items:
+            if item['type'] == 'case':
+                cases[item['intent']] = item['action']
+                if item['keywords']: keywords[item['intent']] = item['keywords']
+                if item['patterns']: patterns[item['intent']] = item['patterns']
+            elif item['type'] == 'default':
+                default = item['action']
+        cmd = {'type': 'process', 'cases': cases, 'default': default}
+        if keywords or patterns:
+            cmd['keywords'] = keywords
+            cmd['patterns'] = patterns
+        return cmd
+
+    def case_rule(self, items):
+        rule = {'type': 'case', 'intent': str(items[0]).strip('"'), 'action': items[-1],
+                'keywords': [], 'patterns': []}
+        for hint in items[1:-1]:
+            rule[hint['type']].extend(hint['values'])
+        return rule
+
+    def keywords_hint(self, items):
+        return {'type': 'keywords', 'values': [_string_value(t) for t in items]}
+
+    def patterns_hint(self, items):
+        return {'type': 'patterns', 'values': [_string_value(t) for t in items]}
+
+    def default_rule(self, items):
+        return {'type': 'default', 'action': items[0]}
+
+    def action(self, items):
+        return items[0]
+
+    def value(self, items):
+        token = items[0]
+        if token.type == 'STRING':
+            return token.value[1:-1]
+        elif token.type == 'INT':
+            return int(token.value)
+        elif token.type == 'VAR_NAME':
+            return {'type': 'var_ref', 'name': token.value}
+        return token.value
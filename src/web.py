@@ -9,14 +9,42 @@ class WebAdapter:
         self.output_queue.put({"type": "bot", "content": text})
 
     def receive(self):
-        self.output_queue.put({"type": "system", "action": "wait_input"})
+        self.request_input()
         return self.input_queue.get()
 
+    def request_input(self):
+        self.output_queue.put({"type": "system", "action": "wait_input"})
+
     def push_user_input(self, text):
         self.input_queue.put(text)
 
+    def close(self):
+        # Wakes a long-poll still waiting on this adapter after its chat was
+        # replaced, so the client polls again and finds the new one.
+        self.output_queue.put({"type": "system", "action": "closed"})
+
+    def wait_messages(self, timeout):
+        try:
+            first = self.output_queue.get(timeout=timeout)
+        except queue.Empty:
+            return []
+        return [first] + self.get_pending_messages()
+
     def get_pending_messages(self):
         messages = []
         while not self.output_queue.empty():
             messages.append(self.output_queue.get())
-        return messages
\ No newline at end of file
+        return messages
+
+
+class BufferAdapter:
+    # Collects the messages of one step so they can be stored in a shared
+    # outbox; input arrives through the session backend, not receive().
+    def __init__(self):
+        self.messages = []
+
+    def send(self, text):
+        self.messages.append({"type": "bot", "content": text})
+
+    def request_input(self):
+        self.messages.append({"type": "system", "action": "wait_input"})
@@ -0,0 +1,125 @@
+import unittest
+import os
+import sys
+import tempfile
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(TEST_DIR, '..'))
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from src import loader
+from src.analyzer import ERROR, WARNING, FlowError, analyze
+from tests.test_compiler import parse_flows
+
+
+def issues(script):
+    return sorted((i.level, i.state, i.message) for i in analyze(parse_flows(script)))
+
+
+class TestAnalyzer(unittest.TestCase):
+
+    def test_clean_scripts(self):
+        for name in ('customer_server.bot', 'profile_manager.bot'):
+            with open(os.path.join(PROJECT_ROOT, 'examples', name), encoding='utf-8') as f:
+                self.assertEqual(analyze(parse_flows(f.read())), [], name)
+
+    def test_undefined_target_and_unreachable_state(self):
+        found = issues("""bot b {
+            state Start {
+                listen $x
+                if $x == "a" goto Missing
+                process {
+                    user_intent "x" => goto Nowhere
+                    default => exit
+                }
+            }
+            state Orphan { exit }
+        }""")
+        self.assertEqual(found, [
+            (ERROR, 'Start', "goto undefined state 'Missing'"),
+            (ERROR, 'Start', "goto undefined state 'Nowhere'"),
+            (WARNING, 'Orphan', "unreachable from Start"),
+        ])
+
+    def test_goto_exit_ends_the_session(self):
+        self.assertEqual(issues("""bot b {
+            state Start {
+                listen $x
+                if $x == "q" goto Exit
+                process {
+                    user_intent "bye" => goto Exit
+                    default => goto Start
+                }
+            }
+            state Done { goto Exit }
+        }"""), [(WARNING, 'Done', "unreachable from Start")])
+
+    def test_loops_without_listen(self):
+        found = issues("""bot b {
+            state Start {
+                set $n = 1
+                goto A
+            }
+            state A {
+                if $n == 1 goto B
+                listen $x
+                goto A
+            }
+            state B {
+                say "hi"
+                goto A
+            }
+            state Spin {
+                if $n == 2 goto Start
+                say "again"
+            }
+        }""")
+        self.assertEqual([m for level, _, m in found if level == ERROR],
+                         ["loop without listen: A -> B -> A", "loop without listen: Spin -> Spin"])
+
+    def test_loops_through_listen_are_fine(self):
+        self.assertEqual(issues("""bot b {
+            state Start {
+                say "menu"
+                listen $x
+                if $x == "again" goto Start
+                process {
+                    user_intent "a" => say "a"
+                }
+            }
+        }"""), [])
+
+
+class TestLoaderVerification(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        loader._loaded.clear()
+
+    def tearDown(self):
+        loader._loaded.clear()
+        self.tmp.cleanup()
+
+    def write(self, script):
+        path = os.path.join(self.tmp.name, 'bot.bot')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(script)
+        return path
+
+    def test_bad_script_is_rejected(self):
+        path = self.write('bot b { state Start { goto Start } }')
+        with self.assertRaises(FlowError) as cm:
+            loader.load_script(path, cache_dir=self.tmp.name)
+        self.assertIn("loop without listen", str(cm.exception))
+        self.assertFalse([f for f in os.listdir(self.tmp.name) if f.endswith('.flows')])
+
+    def test_loaded_programs_are_verified(self):
+        path = self.write('bot b { state Start { listen $x goto Start } }')
+        _, programs = loader.load_script(path, cache_dir=self.tmp.name)
+        self.assertTrue(programs['b'].verified)
+
+
+if __name__ == '__main__':
+    unittest.main()
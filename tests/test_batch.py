@@ -0,0 +1,77 @@
+import unittest
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import redirect_stderr, redirect_stdout
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(TEST_DIR, '..'))
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from bench import batch
+
+FIXTURE = """
+CREATE TABLE users (phone TEXT PRIMARY KEY, name TEXT, balance REAL, data_left REAL, package_name TEXT,
+                    broadband_status INT, id_card TEXT, email TEXT, address TEXT, city TEXT);
+INSERT INTO users VALUES ('13900139000', '测试2', 5.00, 0.0, '4G基础套餐', 0, '8821', 'test2@test.com', '上海', '上海');
+INSERT INTO users VALUES ('13600136000', '测试4', 10.00, 2.0, '学生校园卡', 0, '6666', 'test4@campus.edu', '武汉', '武汉');
+"""
+
+CONVERSATIONS = [
+    # Both top up the same fixture user: each must start from a fresh copy.
+    {"id": "topup", "script": "customer_server.bot", "inputs": ["13900139000", "充值", "100", "没有了"],
+     "expect": {"outputs": ["充值成功！您当前的余额为：105.0 元"], "states": ["TopUpFlow", "AskContinue"],
+                "final": "Exit"}},
+    {"id": "topup-again", "script": "customer_server.bot", "inputs": ["13900139000", "充值", "100", "没有了"],
+     "expect": {"outputs": ["105.0 元"]}},
+    {"id": "exact-balance", "script": "customer_server.bot", "inputs": ["13600136000", "办理流量包", "没有了"],
+     "expect": {"outputs": ["办理成功"], "not_outputs": ["余额不足"]}},
+    {"id": "override", "script": "customer_server.bot", "inputs": ["13600136000", "随便", "没有了"],
+     "intents": {"随便": "人工服务"}, "expect": {"states": ["HumanAgent"]}},
+    {"id": "wrong", "script": "customer_server.bot", "inputs": ["13600136000", "没有了"],
+     "expect": {"outputs": ["身份验证通过", "办理成功"], "final": "MainMenu"}},
+]
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.fixture = os.path.join(self.tmp, 'fixture.sql')
+        self.conversations = os.path.join(self.tmp, 'conversations.jsonl')
+        with open(self.fixture, 'w', encoding='utf-8') as f:
+            f.write(FIXTURE)
+        with open(self.conversations, 'w', encoding='utf-8') as f:
+            for conv in CONVERSATIONS:
+                f.write(json.dumps(conv, ensure_ascii=False) + '\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_check(self):
+        outputs = ["a1", "b2", "c3"]
+        self.assertEqual(batch.check({"outputs": ["a", "c"], "states": ["S"]}, outputs, ["S"], "Exit"), [])
+        self.assertEqual(batch.check({"outputs": ["c", "a"], "not_outputs": ["b"], "final": "X"}, outputs, [], "Exit"),
+                         ["missing output 'a'", "unexpected output 'b'", "ended in 'Exit', expected 'X'"])
+
+    def test_pool_run(self):
+        out = os.path.join(self.tmp, 'results.jsonl')
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()) as err:
+            status = batch.main([self.conversations, '--db', self.fixture, '-j', '2', '--chunksize', '1', '-o', out])
+        self.assertEqual(status, 1)
+        summary = json.loads(err.getvalue())["summary"]
+        self.assertEqual((summary["conversations"], summary["passed"]), (5, 4))
+        self.assertEqual(summary["failed_ids"], ["wrong"])
+        with open(out, encoding='utf-8') as f:
+            results = {r["id"]: r for r in map(json.loads, f)}
+        self.assertEqual(results["wrong"]["failures"],
+                         ["missing output '办理成功'", "ended in 'Exit', expected 'MainMenu'"])
+
+
+if __name__ == '__main__':
+    unittest.main()
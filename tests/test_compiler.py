@@ -0,0 +1,198 @@
+import unittest
+import io
+import os
+import sys
+from contextlib import redirect_stdout
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(TEST_DIR, '..'))
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from lark import Lark
+from src.interpreter import RuntimeEngine, Context
+from src.transformer import BotInterpreter
+from src.compiler import (
+    EXIT, OP_GOTO, OP_IF, OP_SQL, OP_SQL_ROW, OP_SQL_BATCH, UNSET, Template, compile_flow, compile_sql,
+)
+from src.db_manager import DBManager
+from tests import mocks
+
+
+def parse_flows(script):
+    with open(os.path.join(PROJECT_ROOT, 'src', 'dsl_parser', 'grammar.lark'), 'r', encoding='utf-8') as f:
+        grammar = f.read()
+    interpreter = BotInterpreter()
+    interpreter.transform(Lark(grammar, parser='lalr').parse(script))
+    return interpreter.flows
+
+
+SCRIPT = """
+bot demoBot {
+    state Start {
+        say "hi"
+        listen $n
+        if $n > 3 goto Big
+        goto Missing
+    }
+    state Big {
+        say "big $n"
+        exit
+    }
+}
+"""
+
+
+class TestCompiler(unittest.TestCase):
+
+    def test_targets_resolved_to_indices(self):
+        program = compile_flow('demoBot', parse_flows(SCRIPT)['demoBot'])
+        start = program.states[program.entry]
+        self.assertEqual(start[2].op, OP_IF)
+        self.assertEqual(start[2].target, program.index['Big'])
+        self.assertEqual(start[3].op, OP_GOTO)
+        self.assertEqual(start[3].target, EXIT)
+
+    def test_run_compiled_program(self):
+        flows = parse_flows(SCRIPT)
+        for inputs, expected in ((["5"], "big 5"), (["1"], "hi")):
+            adapter = mocks.TestAdapter(inputs)
+            engine = RuntimeEngine(flows, io_adapter=adapter)
+            engine.set_llm_service(mocks.MockLLMService())
+            engine.run('demoBot')
+            self.assertEqual(adapter.bot_outputs[-2], expected)
+            self.assertEqual(adapter.bot_outputs[-1], "Session Ended")
+
+    def test_sql_precompiled(self):
+        flows = parse_flows('bot b { state Start { sql "UPDATE users SET name = $new WHERE phone = $phone" exit } }')
+        cmd = flows['b']['Start'][0]
+        self.assertEqual(cmd['sql'], "UPDATE users SET name = ? WHERE phone = ?")
+        self.assertEqual(cmd['params'], ['$new', '$phone'])
+        self.assertFalse(cmd['read'])
+        program = compile_flow('b', flows['b'])
+        instr = program.states[0][0]
+        self.assertEqual(instr.op, OP_SQL)
+        self.assertEqual(tuple(program.variables[slot] for slot in instr.params), ('$new', '$phone'))
+        self.assertTrue(compile_sql("  select count(*) FROM users WHERE phone = $phone")[2])
+
+
+class TestSqlFusion(unittest.TestCase):
+
+    def compile_example(self):
+        with open(os.path.join(PROJECT_ROOT, 'examples', 'customer_server.bot'), 'r', encoding='utf-8') as f:
+            return compile_flow('custBot', parse_flows(f.read())['custBot'])
+
+    def test_same_row_reads_and_writes_fused(self):
+        program = self.compile_example()
+        start = program.states[program.index['Start']]
+        row = [i for i in start if i.op == OP_SQL_ROW]
+        self.assertEqual(len(row), 1)
+        self.assertEqual(row[0].sql, "SELECT name, package_name FROM users WHERE phone = ?")
+        self.assertEqual(tuple(program.variables[slot] for slot in row[0].results), ('$name', '$pkg'))
+
+        ops = [i.op for i in program.states[program.index['BuyDataFlow']]]
+        self.assertEqual(ops[:4], [OP_SQL, OP_IF, OP_SQL_BATCH, OP_SQL_ROW])
+
+    def test_dependent_reads_not_fused(self):
+        script = """bot b { state Start {
+            sql "SELECT id FROM t WHERE k = $k" as $k
+            sql "SELECT v FROM t WHERE k = $k" as $v
+            sql "SELECT count(*) FROM t WHERE k = $k" as $n
+            exit } }"""
+        ops = [i.op for i in compile_flow('b', parse_flows(script)['b']).states[0]]
+        self.assertEqual(ops[:3], [OP_SQL, OP_SQL, OP_SQL])
+
+    def test_batch_is_atomic(self):
+        script = """bot b { state Start {
+            sql "UPDATE t SET v = v - 10 WHERE k = $k" as $a
+            sql "UPDATE missing SET v = 1 WHERE k = $k" as $b
+            say "$a $b"
+            exit } }"""
+        db = DBManager(':memory:')
+        db.execute("CREATE TABLE t (k TEXT, v INT)")
+        db.execute("INSERT INTO t VALUES ('x', 100)")
+        adapter = mocks.TestAdapter([])
+        engine = RuntimeEngine(parse_flows(script), db_manager=db, io_adapter=adapter)
+        for _ in engine.session('b', Context.from_dict({'state': 'Start', 'variables': {'$k': 'x'}})):
+            pass
+        self.assertEqual(adapter.bot_outputs[0], "-1 -1")
+        self.assertEqual(db.fetch_one("SELECT v FROM t"), 100)
+
+
+class TestTemplate(unittest.TestCase):
+
+    def test_variable_prefix_does_not_collide(self):
+        ctx = Context()
+        ctx.set_var('$new_bal', 10)
+        ctx.set_var('$new_bal_x', 20)
+        self.assertEqual(Template("$new_bal/$new_bal_x元").render(ctx.variables), "10/20元")
+        self.assertEqual(ctx.format_string("$new_bal_x"), "20")
+
+    def test_unset_variable_kept_literally(self):
+        self.assertEqual(Template("余额 $bal 元").render({}), "余额 $bal 元")
+        self.assertEqual(Template("$a$a").render({'$a': '$a!'}), "$a!$a!")
+
+
+
+class TestContextSlots(unittest.TestCase):
+
+    def test_variables_get_fixed_slots(self):
+        program = compile_flow('demoBot', parse_flows(SCRIPT)['demoBot'])
+        self.assertEqual(program.slots, {'$n': 0})
+        ctx = Context(layout=program.slots)
+        self.assertEqual((ctx.values, ctx.get_var('$n'), ctx.variables), ([UNSET], "", {}))
+        ctx.set_var('$n', 4)
+        self.assertEqual(ctx.values, [4])
+
+    def test_bind_moves_values_into_slots(self):
+        ctx = Context.from_dict({'state': 'Big', 'variables': {'$n': '7', '$other': 1}, 'history': ['7']})
+        flows = parse_flows(SCRIPT)
+        adapter = mocks.TestAdapter([])
+        for _ in RuntimeEngine(flows, io_adapter=adapter).session('demoBot', ctx):
+            pass
+        self.assertEqual(adapter.bot_outputs[0], "big 7")
+        self.assertEqual(ctx.values, ['7'])
+        self.assertEqual(ctx.to_dict()['variables'], {'$n': '7', '$other': 1})
+
+    def test_unset_variable_copies_as_empty(self):
+        script = 'bot b { state Start { set $a = $b say "a=[$a] b=[$b]" exit } }'
+        adapter = mocks.TestAdapter([])
+        RuntimeEngine(parse_flows(script), io_adapter=adapter).run('b')
+        self.assertEqual(adapter.bot_outputs[0], "a=[] b=[$b]")
+
+    def test_goto_exit_ends_session_despite_exit_state(self):
+        script = 'bot b { state Start { say "start" goto Exit } state Exit { say "exit state" exit } }'
+        adapter = mocks.TestAdapter([])
+        RuntimeEngine(parse_flows(script), io_adapter=adapter).run('b')
+        self.assertEqual(adapter.bot_outputs[:2], ["start", "Session Ended"])
+
+    def test_resumed_session_is_not_announced_again(self):
+        script = 'bot b { state Start { say "hi" listen $x say "got $x" listen $y exit } }'
+        engine = RuntimeEngine(parse_flows(script), io_adapter=mocks.TestAdapter([]))
+        ctx = Context()
+        out = io.StringIO()
+        with redirect_stdout(out):
+            gen = engine.session('b', ctx)
+            next(gen)
+            gen.close()
+            gen = engine.session('b', Context.from_dict(ctx.to_dict()))
+            next(gen)
+            gen.send("a")
+        self.assertEqual(out.getvalue().count("--- Bot b Started ---"), 1)
+        self.assertEqual(engine.io.bot_outputs, ["hi", "got a"])
+
+    def test_history_is_bounded(self):
+        script = 'bot b { state Start { listen $x say "got $x" goto Start } }'
+        ctx = Context(history_depth=2)
+        adapter = mocks.TestAdapter([])
+        gen = RuntimeEngine(parse_flows(script), io_adapter=adapter).session('b', ctx)
+        next(gen)
+        for text in ("a", "b", "c"):
+            gen.send(text)
+        self.assertEqual(list(ctx.history), ["b", "c"])
+        self.assertEqual(adapter.bot_outputs, ["got a", "got b", "got c"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,197 @@
+import unittest
+import os
+import sys
+import tempfile
+import threading
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(TEST_DIR, '..'))
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from src.db_manager import DBManager, ConnectionPool, QueryCache
+from src.interpreter import RuntimeEngine
+from src.metrics import Metrics
+from tests.test_compiler import parse_flows
+from tests import mocks
+
+
+class TestPooledDB(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'pool.db')
+        self.pool = ConnectionPool(self.path, size=4)
+        self.db = DBManager(self.path, pool=self.pool)
+        self.db.execute("CREATE TABLE users (phone TEXT PRIMARY KEY, balance REAL)")
+        self.db.execute("INSERT INTO users VALUES (?, ?)", ("1", 0))
+
+    def tearDown(self):
+        self.pool.close()
+        self.tmp.cleanup()
+
+    def test_wal_mode(self):
+        self.assertEqual(self.db.fetch_one("PRAGMA journal_mode"), "wal")
+
+    def test_concurrent_writers_do_not_fail(self):
+        results = []
+
+        def worker():
+            for _ in range(100):
+                results.append(self.db.execute("UPDATE users SET balance = balance + 1 WHERE phone = ?", ("1",)))
+                self.db.fetch_one("SELECT balance FROM users WHERE phone = ?", ("1",))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+
+        self.assertNotIn(-1, results)
+        self.assertEqual(self.db.fetch_one("SELECT balance FROM users WHERE phone = ?", ("1",)), 800)
+
+    def test_transaction_rolls_back_on_error(self):
+        with self.assertRaises(Exception):
+            with self.db.transaction():
+                self.db.execute("UPDATE users SET balance = 10 WHERE phone = ?", ("1",))
+                self.db.execute("UPDATE missing_table SET x = 1")
+        self.assertEqual(self.db.fetch_one("SELECT balance FROM users WHERE phone = ?", ("1",)), 0)
+
+        with self.db.transaction():
+            self.db.execute("UPDATE users SET balance = 10 WHERE phone = ?", ("1",))
+        self.assertEqual(self.db.fetch_row("SELECT phone, balance FROM users"), ("1", 10))
+
+
+class TestQueryCache(unittest.TestCase):
+
+    def test_lru_and_table_invalidation(self):
+        cache = QueryCache(maxsize=2)
+        cache.put(('a', ()), (1,), frozenset(['users']))
+        cache.put(('b', ()), (2,), frozenset(['plans']))
+        self.assertEqual(cache.get(('a', ())), (1,))
+        cache.put(('c', ()), (3,), frozenset(['users']))
+        self.assertIs(cache.get(('b', ())), QueryCache.MISS)
+
+        cache.invalidate(frozenset(['users']))
+        self.assertIs(cache.get(('a', ())), QueryCache.MISS)
+        self.assertEqual(cache.stats()["size"], 0)
+
+        stale = cache.generation
+        cache.invalidate(frozenset(['plans']))
+        cache.put(('d', ()), (4,), frozenset(['plans']), stale)
+        self.assertIs(cache.get(('d', ())), QueryCache.MISS)
+
+    def test_engine_reads_through_cache(self):
+        script = """bot b {
+            state Start {
+                listen $phone
+                goto Show
+            }
+            state Show {
+                sql "SELECT balance FROM users WHERE phone = $phone" as $bal
+                say "bal $bal"
+                listen $cmd
+                if $cmd == "again" goto Show
+                if $cmd == "topup" goto TopUp
+                exit
+            }
+            state TopUp {
+                sql "UPDATE users SET balance = balance + 5 WHERE phone = $phone"
+                goto Show
+            }
+        }"""
+        flows = parse_flows(script)
+        db = DBManager(':memory:')
+        db.execute("CREATE TABLE users (phone TEXT, balance INT)")
+        db.execute("INSERT INTO users VALUES ('1', 10)")
+        cache = QueryCache()
+        outputs = []
+        for inputs in (["1", "again", "topup", "done"], ["1", "done"]):
+            adapter = mocks.TestAdapter(inputs)
+            RuntimeEngine(flows, db_manager=db, io_adapter=adapter, sql_cache=cache).run('b')
+            outputs += [o for o in adapter.bot_outputs if o.startswith("bal")]
+
+        self.assertEqual(outputs, ["bal 10", "bal 10", "bal 15", "bal 15"])
+        self.assertEqual((cache.stats()["hits"], cache.stats()["misses"]), (2, 2))
+
+    def test_writes_invalidate_cache_without_cached_reads(self):
+        reader = parse_flows("""
+        bot r {
+            state Start {
+                sql "SELECT balance FROM users WHERE phone = '1'" as $bal
+                say "bal $bal"
+                exit
+            }
+        }""")
+        writer = parse_flows("""
+        bot w {
+            state Start {
+                sql "UPDATE users SET balance = 99 WHERE phone = '1'"
+                exit
+            }
+        }""")
+        db = DBManager(':memory:')
+        db.execute("CREATE TABLE users (phone TEXT, balance INT)")
+        db.execute("INSERT INTO users VALUES ('1', 10)")
+        cache = QueryCache()
+        outputs = []
+        for flows, bot, reads in ((reader, 'r', True), (writer, 'w', False), (reader, 'r', True)):
+            adapter = mocks.TestAdapter([])
+            RuntimeEngine(flows, db_manager=db, io_adapter=adapter, sql_cache=cache, cache_reads=reads).run(bot)
+            outputs += [o for o in adapter.bot_outputs if o.startswith("bal")]
+
+        self.assertEqual(outputs, ["bal 10", "bal 99"])
+        self.assertEqual(cache.stats()["hits"], 0)
+
+
+
+class LegacyDB:
+    # A manager with only the baseline interface: no fetch_row(), no transaction().
+    def __init__(self, db):
+        self.db = db
+
+    def fetch_one(self, sql, params=None):
+        return self.db.fetch_one(sql, params)
+
+    def execute(self, sql, params=None):
+        return self.db.execute(sql, params)
+
+
+class TestLegacyManager(unittest.TestCase):
+    SCRIPT = """bot b {
+        state Start {
+            sql "SELECT balance FROM users WHERE phone = '1'" as $bal
+            sql "UPDATE users SET balance = balance + 1 WHERE phone = '1'" as $a
+            sql "UPDATE users SET balance = balance + 1 WHERE phone = '1'" as $b
+            say "$bal $a $b"
+            exit
+        }
+    }"""
+
+    def setUp(self):
+        self.db = DBManager(':memory:')
+        self.db.execute("CREATE TABLE users (phone TEXT, balance INT)")
+        self.db.execute("INSERT INTO users VALUES ('1', 10)")
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_engine_falls_back_to_fetch_one(self):
+        for metrics, expected in ((None, "10 1 1"), (Metrics(), "12 1 1")):
+            adapter = mocks.TestAdapter([])
+            RuntimeEngine(parse_flows(self.SCRIPT), db_manager=LegacyDB(self.db), io_adapter=adapter,
+                          metrics=metrics).run('b')
+            self.assertEqual(adapter.bot_outputs[0], expected)
+        self.assertEqual(self.db.fetch_one("SELECT balance FROM users"), 14)
+
+    def test_interface_errors_are_not_read_as_zero(self):
+        class NoReads:
+            def execute(self, sql, params=None):
+                return 1
+        engine = RuntimeEngine(parse_flows(self.SCRIPT), db_manager=NoReads(), io_adapter=mocks.TestAdapter([]))
+        with self.assertRaises(AttributeError):
+            for _ in engine.session('b'):
+                pass
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import asyncio
+import os
+import sys
+import threading
+import time
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(TEST_DIR, '..'))
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from src.compiler import OP_CALL, OP_CALL_GROUP, compile_flow
+from src.functions import ExternalFunction, CALL_ERROR, CALL_TIMEOUT
+from src.interpreter import RuntimeEngine
+from tests.test_compiler import parse_flows
+from tests import mocks
+
+SCRIPT = """bot b {
+    state Start {
+        call slow("a") as $a
+        call slow("b") as $b
+        call join($a, $b) as $c
+        say "$a $b $c"
+        exit
+    }
+}"""
+
+
+def slow(x):
+    time.sleep(0.3)
+    return x.upper()
+
+
+class TestExternalFunction(unittest.TestCase):
+
+    def test_errors_and_timeouts(self):
+        def boom(): raise RuntimeError("down")
+        self.assertEqual(ExternalFunction('boom', boom).call([]), CALL_ERROR)
+        self.assertEqual(ExternalFunction('slow', slow, timeout=0.05).call(["x"]), CALL_TIMEOUT)
+        self.assertEqual(ExternalFunction('slow', slow, timeout=1).call(["x"]), "X")
+
+    def test_async_function(self):
+        async def fetch(x):
+            await asyncio.sleep(0.01)
+            return x * 2
+        self.assertEqual(ExternalFunction('fetch', fetch).call([21]), 42)
+
+        async def hang():
+            await asyncio.sleep(5)
+        self.assertEqual(ExternalFunction('hang', hang, timeout=0.05).call([]), CALL_TIMEOUT)
+
+    def test_concurrency_limit(self):
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def work():
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            time.sleep(0.05)
+            with lock:
+                active.pop()
+
+        func = ExternalFunction('work', work, max_concurrency=2, threaded=True)
+        for future in [func.start([]) for _ in range(6)]:
+            func.wait(future)
+        self.assertEqual(max(peak), 2)
+
+
+class TestCallPrefetch(unittest.TestCase):
+
+    def run_bot(self, prefetch):
+        adapter = mocks.TestAdapter([])
+        engine = RuntimeEngine(parse_flows(SCRIPT), io_adapter=adapter, prefetch_calls=prefetch)
+        engine.register_function('slow', slow)
+        engine.register_function('join', lambda a, b: a + b)
+        started = time.monotonic()
+        engine.run('b')
+        return adapter.bot_outputs[0], time.monotonic() - started
+
+    def test_independent_calls_are_grouped(self):
+        program = compile_flow('b', parse_flows(SCRIPT)['b'])
+        ops = [instr.op for instr in program.states[0]]
+        self.assertEqual(ops[:2], [OP_CALL_GROUP, OP_CALL])
+        self.assertEqual(len(program.states[0][0].calls), 2)
+
+    def test_prefetch_runs_group_concurrently(self):
+        sequential, slow_time = self.run_bot(False)
+        concurrent, fast_time = self.run_bot(True)
+        self.assertEqual(sequential, "A B AB")
+        self.assertEqual(concurrent, sequential)
+        self.assertGreater(slow_time, 0.55)
+        self.assertLess(fast_time, 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+import io
+import os
+import sys
+from contextlib import redirect_stdout
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(TEST_DIR, '..'))
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from src.db_manager import DBManager
+from src.index_advisor import advise, create_indexes, index_columns
+from tests.test_compiler import parse_flows
+
+SCRIPT = """
+bot shopBot {
+    state Start {
+        listen $phone
+        sql "SELECT balance FROM users WHERE phone = $phone" as $bal
+        sql "UPDATE users SET balance = balance - 1 WHERE phone = $phone"
+        goto Orders
+    }
+    state Orders {
+        sql "SELECT count(*) FROM orders WHERE phone = $phone OR email = $phone" as $n
+        sql "SELECT balance FROM users WHERE phone = $phone" as $bal
+        exit
+    }
+}
+"""
+
+
+class TestIndexAdvisor(unittest.TestCase):
+
+    def setUp(self):
+        self.db = DBManager(':memory:')
+        self.db.execute("CREATE TABLE users (phone TEXT, balance REAL)")
+        self.db.execute("CREATE TABLE orders (phone TEXT, email TEXT)")
+        self.flows = parse_flows(SCRIPT)
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_reports_scans_and_proposes_verified_index(self):
+        report = advise(self.db, self.flows)
+        self.assertEqual(report["scans"], 3)
+        self.assertEqual([i["name"] for i in report["indexes"]], ["idx_users_phone"])
+        index = report["indexes"][0]
+        self.assertTrue(index["verified"])
+        self.assertEqual(index["statements"], 2)
+        select = report["statements"][0]
+        self.assertEqual(select["used_by"], ["shopBot.Start", "shopBot.Orders"])
+        # An OR needs more than one index; it is reported but left alone.
+        orders = report["statements"][2]
+        self.assertEqual(orders["scans"], ["orders"])
+        self.assertIsNone(orders["index"])
+
+    def test_create_indexes_removes_scans(self):
+        self.assertEqual(create_indexes(self.db, advise(self.db, self.flows)), ["idx_users_phone"])
+        report = advise(self.db, self.flows)
+        self.assertEqual(report["scans"], 1)
+        self.assertEqual(report["indexes"], [])
+
+    def test_create_indexes_skips_failed_ddl(self):
+        report = advise(self.db, self.flows)
+        self.db.execute("DROP TABLE users")
+        out = io.StringIO()
+        with redirect_stdout(out):
+            self.assertEqual(create_indexes(self.db, report), [])
+        self.assertIn("[Index Advisor] idx_users_phone: no such table", out.getvalue())
+        self.assertFalse(report["indexes"][0]["created"])
+
+    def test_primary_key_lookups_are_not_scans(self):
+        db = DBManager(':memory:')
+        db.execute("CREATE TABLE users (phone TEXT PRIMARY KEY, balance REAL)")
+        report = advise(db, {'b': {'Start': self.flows['shopBot']['Start']}})
+        db.close()
+        self.assertEqual((report["scans"], report["errors"]), (0, 0))
+
+    def test_missing_table_is_an_error(self):
+        db = DBManager(':memory:')
+        report = advise(db, self.flows)
+        db.close()
+        self.assertEqual(report["errors"], 3)
+        self.assertIn("no such table", report["statements"][0]["error"])
+
+    def test_index_columns_put_equality_before_range(self):
+        self.assertEqual(index_columns("SELECT * FROM t WHERE created > ? AND T.Phone = ? AND city = 'x'"),
+                         ('phone', 'city', 'created'))
+        self.assertEqual(index_columns("SELECT * FROM t"), ())
+
+
+if __name__ == '__main__':
+    unittest.main()
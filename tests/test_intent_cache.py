@@ -0,0 +1,71 @@
+import unittest
+import os
+import sys
+import tempfile
+from unittest import mock
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(TEST_DIR, '..'))
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from src.intent_cache import CachedIntentService, normalize_input
+from tests import mocks
+
+
+class CountingLLMService(mocks.MockLLMService):
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def detect_intent(self, user_input, candidates):
+        self.calls += 1
+        return super().detect_intent(user_input, candidates)
+
+
+class TestIntentCache(unittest.TestCase):
+
+    def test_repeated_inputs_hit_cache(self):
+        llm = CountingLLMService()
+        cache = CachedIntentService(llm, maxsize=10)
+        cands = ["确认", "拒绝"]
+        self.assertEqual(cache.detect_intent("是", cands), "确认")
+        self.assertEqual(cache.detect_intent(" 是！", cands), "确认")
+        self.assertEqual(cache.detect_intent("是", list(reversed(cands))), "确认")
+        self.assertEqual(cache.detect_intent("是", ["确认"]), "确认")
+        self.assertEqual(llm.calls, 2)
+        self.assertEqual(cache.stats()["hits"], 2)
+
+    def test_size_and_ttl_eviction(self):
+        llm = CountingLLMService()
+        cache = CachedIntentService(llm, maxsize=2, ttl=60)
+        for text in ("是", "否", "没有了"):
+            cache.detect_intent(text, ["确认", "拒绝", "没有了"])
+        self.assertEqual(cache.stats()["size"], 2)
+        cache.detect_intent("是", ["确认", "拒绝", "没有了"])
+        self.assertEqual(llm.calls, 4)
+
+        with mock.patch('src.intent_cache.time.time', return_value=10 ** 12):
+            cache.detect_intent("是", ["确认", "拒绝", "没有了"])
+        self.assertEqual(llm.calls, 5)
+
+    def test_persisted_across_instances(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'cache.db')
+            first = CachedIntentService(CountingLLMService(), db_path=path)
+            first.detect_intent("我要查话费", ["查询话费", "充值缴费"])
+            first.close()
+
+            llm = CountingLLMService()
+            second = CachedIntentService(llm, db_path=path)
+            self.assertEqual(second.detect_intent("我要查话费", ["充值缴费", "查询话费"]), "查询话费")
+            self.assertEqual(llm.calls, 0)
+            second.close()
+
+    def test_normalize_input(self):
+        self.assertEqual(normalize_input("  Yes  please!! "), "yes please")
+
+
+if __name__ == '__main__':
+    unittest.main()
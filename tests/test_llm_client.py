@@ -0,0 +1,166 @@
+import unittest
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(TEST_DIR, '..'))
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from src.llm_client import LLMService, IntentUnavailable, early_intent
+from src.interpreter import RuntimeEngine
+from tests.test_compiler import parse_flows
+from tests import mocks
+
+
+class FakeCompletions(BaseHTTPRequestHandler):
+    # Answers every chat completion with server.answer after the next delay
+    # in server.delays (0 once they run out). Streaming requests get
+    # server.chunks, server.chunk_delay apart.
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        server = self.server
+        server.requests.append(request)
+        if request.get('stream'):
+            return self.stream_chunks()
+        with server.lock:
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+            delay = server.delays.pop(0) if server.delays else 0
+        time.sleep(delay)
+        body = json.dumps({
+            "id": "1", "created": 0, "model": "fake", "object": "chat.completion",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": server.answer}}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }).encode()
+        with server.lock:
+            server.active -= 1
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:
+            pass
+
+    def stream_chunks(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        try:
+            for piece in self.server.chunks:
+                chunk = {"id": "1", "created": 0, "model": "fake",
+                         "choices": [{"index": 0, "delta": {"role": "assistant", "content": piece}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+                time.sleep(self.server.chunk_delay)
+            self.wfile.write(b"data: [DONE]\n\n")
+        except OSError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class TestLLMService(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeCompletions)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.delays = []
+        self.server.active = self.server.peak = 0
+        self.server.answer = '"充值缴费"'
+        self.server.requests = []
+        self.server.chunks = []
+        self.server.chunk_delay = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v4"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def service(self, **kwargs):
+        return LLMService(api_key="id.secret", base_url=self.base_url, **kwargs)
+
+    def test_detect_intent(self):
+        self.assertEqual(self.service().detect_intent("我要充值", ["查询话费", "充值缴费"]), "充值缴费")
+        self.assertEqual(self.server.requests[0]["max_tokens"], 2 * len("UNKNOWN") + 8)
+
+    def test_stream_stops_at_unique_prefix(self):
+        self.server.chunks = ['"', '充', '值', '缴', '费', '"']
+        self.server.chunk_delay = 0.5
+        llm = self.service(stream=True)
+        started = time.monotonic()
+        self.assertEqual(llm.detect_intent("我要充值", ["查询话费", "充值缴费"]), "充值缴费")
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertEqual(llm.stats()["early_stops"], 1)
+
+        self.server.chunks = ['查询', '流量']
+        self.server.chunk_delay = 0
+        self.assertEqual(llm.detect_intent("流量", ["查询", "查询流量"]), "查询流量")
+
+    def test_early_intent(self):
+        candidates = ["查询", "查询流量", "充值缴费"]
+        self.assertIsNone(early_intent(' "', candidates))
+        self.assertEqual(early_intent('"充', candidates), "充值缴费")
+        self.assertIsNone(early_intent('查询', candidates))
+        self.assertIsNone(early_intent('查询流', candidates))
+        self.assertEqual(early_intent('UNK', candidates), "UNKNOWN")
+        self.assertIsNone(early_intent('The intent', candidates))
+
+    def test_deadline_raises_and_engine_takes_default(self):
+        self.server.delays = [2, 2]
+        llm = self.service(deadline=0.3)
+        started = time.monotonic()
+        with self.assertRaises(IntentUnavailable):
+            llm.detect_intent("我要充值", ["充值缴费"])
+        self.assertLess(time.monotonic() - started, 1.5)
+
+        script = """bot b {
+            state Start {
+                listen $x
+                process {
+                    user_intent "充值缴费" => say "topup"
+                    default => say "fallback"
+                }
+                exit
+            }
+        }"""
+        self.server.delays = [2, 2]
+        adapter = mocks.TestAdapter(["充值"])
+        engine = RuntimeEngine(parse_flows(script), io_adapter=adapter)
+        engine.set_llm_service(llm)
+        engine.run('b')
+        self.assertIn("fallback", adapter.bot_outputs)
+
+    def test_in_flight_limit(self):
+        self.server.delays = [0.2] * 8
+        llm = self.service(max_in_flight=2)
+        threads = [threading.Thread(target=llm.detect_intent, args=("充值", ["充值缴费"])) for _ in range(8)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        self.assertEqual(self.server.peak, 2)
+        self.assertEqual(llm.stats()["requests"], 8)
+
+    def test_hedged_request_beats_slow_one(self):
+        llm = self.service(hedge=True, deadline=5)
+        for _ in range(20):
+            llm.detect_intent("充值", ["充值缴费"])
+        self.server.delays = [3]
+        started = time.monotonic()
+        self.assertEqual(llm.detect_intent("充值", ["充值缴费"]), "充值缴费")
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(llm.stats()["hedged"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
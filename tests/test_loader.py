@@ -0,0 +1,63 @@
+import unittest
+import os
+import sys
+import subprocess
+import tempfile
+from unittest import mock
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(TEST_DIR, '..'))
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from src import loader
+
+SCRIPT_FILE = os.path.join(PROJECT_ROOT, 'examples', 'customer_server.bot')
+
+
+class TestLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        loader._loaded.clear()
+
+    def tearDown(self):
+        loader._loaded.clear()
+        self.tmp.cleanup()
+
+    def test_disk_cache_skips_parsing(self):
+        flows, programs = loader.load_script(SCRIPT_FILE, cache_dir=self.tmp.name)
+        self.assertIn('custBot', flows)
+        self.assertIn('custBot', programs)
+        self.assertEqual(len([f for f in os.listdir(self.tmp.name) if f.endswith('.flows')]), 1)
+
+        loader._loaded.clear()
+        with mock.patch.object(loader, 'parse_script', side_effect=AssertionError("parsed again")):
+            cached_flows, cached_programs = loader.load_script(SCRIPT_FILE, cache_dir=self.tmp.name)
+        self.assertEqual(list(cached_flows['custBot']), list(flows['custBot']))
+        self.assertEqual(cached_programs['custBot'].names, programs['custBot'].names)
+
+    def test_changed_script_misses_cache(self):
+        script_path = os.path.join(self.tmp.name, 'a.bot')
+        with open(script_path, 'w', encoding='utf-8') as f:
+            f.write('bot aBot { state Start { say "a" exit } }')
+        first, _ = loader.load_script(script_path, cache_dir=self.tmp.name)
+        with open(script_path, 'w', encoding='utf-8') as f:
+            f.write('bot bBot { state Start { say "b" exit } }')
+        second, _ = loader.load_script(script_path, cache_dir=self.tmp.name)
+        self.assertEqual(list(first), ['aBot'])
+        self.assertEqual(list(second), ['bBot'])
+        # Only the latest version of a script stays in memory.
+        self.assertEqual(len(loader._loaded), 1)
+
+    def test_cached_load_does_not_import_lark(self):
+        loader.load_script(SCRIPT_FILE, cache_dir=self.tmp.name)
+        code = ("import sys; from src import loader; "
+                f"loader.load_script({SCRIPT_FILE!r}, cache_dir={self.tmp.name!r}); print('lark' in sys.modules)")
+        out = subprocess.run([sys.executable, '-c', code], cwd=PROJECT_ROOT, capture_output=True, text=True)
+        self.assertEqual(out.stdout.strip(), 'False', out.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+import io
+import os
+import sys
+from contextlib import redirect_stdout
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(TEST_DIR, '..'))
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from bench import loadtest
+
+
+class TestLoadTest(unittest.TestCase):
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual([loadtest.percentile(values, p) for p in (50, 95, 99)], [50, 95, 99])
+        self.assertEqual(loadtest.percentile([], 50), 0.0)
+
+    def test_in_process_run(self):
+        for runtime in ('coroutine', 'thread'):
+            with redirect_stdout(io.StringIO()):
+                report = loadtest.main(['-n', '6', '-c', '3', '--runtime', runtime, '--llm-latency', '1'])
+            self.assertEqual(report["errors"], 0, report["error_samples"])
+            self.assertEqual(report["turns"], 6 * 9)
+            self.assertGreaterEqual(report["latency_ms"]["p99"], report["latency_ms"]["p50"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+import os
+import sys
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(TEST_DIR, '..'))
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from src.matcher import KeywordMatcher
+from src.interpreter import RuntimeEngine
+from tests.test_compiler import parse_flows
+from tests import mocks
+
+
+class CountingLLM(mocks.MockLLMService):
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def detect_intent(self, user_input, candidates):
+        self.calls.append(user_input)
+        return super().detect_intent(user_input, candidates)
+
+
+class TestKeywordMatcher(unittest.TestCase):
+
+    def test_overlapping_keywords(self):
+        matcher = KeywordMatcher({'a': ['he', 'she', 'hers'], 'b': ['his']})
+        spans = sorted((s, e) for s, e, _ in matcher.find('ushers'))
+        self.assertEqual(spans, [(1, 4), (2, 4), (2, 6)])
+        self.assertEqual(matcher.match('this'), 'b')
+
+    def test_nested_match_defers_to_longer(self):
+        matcher = KeywordMatcher({'查询流量': ['流量'], '办理流量包': ['买流量']})
+        self.assertEqual(matcher.match('我想买流量'), '办理流量包')
+        self.assertEqual(matcher.match('流量还剩多少'), '查询流量')
+
+    def test_ambiguous_or_missing_is_none(self):
+        matcher = KeywordMatcher({'yes': ['yes'], 'no': ['no']}, {'number': [r'\d{11}']})
+        self.assertIsNone(matcher.match('yes and no'))
+        self.assertIsNone(matcher.match('maybe'))
+        self.assertEqual(matcher.match('call 13800138000'), 'number')
+        self.assertEqual(matcher.match('YES'), 'yes')
+
+
+class TestProcessFastPath(unittest.TestCase):
+
+    SCRIPT = r"""bot b {
+        state Start {
+            listen $x
+            process {
+                user_intent "充值缴费" keywords ["充值", "缴费"] => say "topup"
+                user_intent "人工服务" keywords ["人工"] patterns ["^\\d+$"] => say "agent"
+                default => say "other"
+            }
+        }
+    }"""
+
+    def run_bot(self, inputs, llm):
+        adapter = mocks.TestAdapter(inputs + ["EXIT"])
+        engine = RuntimeEngine(parse_flows(self.SCRIPT), io_adapter=adapter)
+        if llm: engine.set_llm_service(llm)
+        engine.run('b')
+        return [o for o in adapter.bot_outputs if o in ("topup", "agent", "other")]
+
+    def test_llm_only_on_miss(self):
+        llm = CountingLLM()
+        self.assertEqual(self.run_bot(["我要充值", "0", "转人工", "查话费"], llm),
+                         ["topup", "agent", "agent", "other"])
+        self.assertEqual(llm.calls, ["查话费"])
+
+    def test_matches_without_llm(self):
+        self.assertEqual(self.run_bot(["缴费"], None), ["topup"])
+
+
+if __name__ == '__main__':
+    unittest.main()
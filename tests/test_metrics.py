@@ -0,0 +1,83 @@
+import unittest
+import os
+import sys
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(TEST_DIR, '..'))
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from src.db_manager import DBManager
+from src.interpreter import RuntimeEngine
+from src.loader import load_script
+from src.metrics import Histogram, Metrics
+from tests.mocks import MockLLMService
+from tests import mocks
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_buckets(self):
+        hist = Histogram(buckets=(0.1, 1.0))
+        for v in (0.05, 0.1, 0.5, 3.0):
+            hist.observe(v)
+        counts, total = hist.snapshot()
+        self.assertEqual(counts, [2, 1, 1])
+        self.assertAlmostEqual(total, 3.65)
+
+    def test_render(self):
+        metrics = Metrics(buckets=(0.1, 1.0))
+        metrics.histogram('dslbot_sql_seconds', statement='SELECT "x"').observe(0.5)
+        metrics.gauge('dslbot_active_sessions', "Sessions.", lambda: 3)
+        metrics.gauge('dslbot_missing', "Skipped.", lambda: None)
+        text = metrics.render()
+        self.assertIn('# TYPE dslbot_sql_seconds histogram', text)
+        self.assertIn('dslbot_sql_seconds_bucket{statement="SELECT \\"x\\"",le="0.1"} 0', text)
+        self.assertIn('dslbot_sql_seconds_bucket{statement="SELECT \\"x\\"",le="+Inf"} 1', text)
+        self.assertIn('dslbot_sql_seconds_count{statement="SELECT \\"x\\""} 1', text)
+        self.assertIn('dslbot_active_sessions 3', text)
+        self.assertNotIn('dslbot_missing', text)
+
+
+class TestEngineHooks(unittest.TestCase):
+
+    def setUp(self):
+        self.flows, self.programs = load_script(os.path.join(PROJECT_ROOT, 'examples', 'customer_server.bot'))
+        self.db = DBManager(':memory:')
+        self.db.execute("CREATE TABLE users (phone TEXT PRIMARY KEY, name TEXT, balance REAL, data_left REAL, "
+                        "package_name TEXT, broadband_status INT)")
+        self.db.execute("INSERT INTO users VALUES ('13800138000', '测试', 100, 5, '5G', 0)")
+
+    def tearDown(self):
+        self.db.close()
+
+    def run_bot(self, metrics):
+        adapter = mocks.TestAdapter(["13800138000", "流量", "没有了"])
+        engine = RuntimeEngine(self.flows, db_manager=self.db, io_adapter=adapter, programs=self.programs,
+                               metrics=metrics)
+        engine.set_llm_service(MockLLMService())
+        engine.run('custBot')
+        return engine, adapter
+
+    def test_hooks_record_every_layer(self):
+        metrics = Metrics()
+        _, adapter = self.run_bot(metrics)
+        self.assertIn("剩余通用流量：5.0 GB", adapter.get_all_output())
+        text = metrics.render()
+        self.assertIn('dslbot_instruction_seconds_count{bot="custBot",op="say"}', text)
+        self.assertIn('dslbot_instruction_seconds_count{bot="custBot",op="sql_row"} 1', text)
+        self.assertIn('dslbot_state_seconds_count{bot="custBot",state="MainMenu"} 1', text)
+        self.assertIn('dslbot_sql_seconds_count{statement="SELECT data_left FROM users WHERE phone = ?"} 1', text)
+        # "流量" misses the DSL keywords and goes to the LLM; "没有了" does not.
+        self.assertIn('dslbot_intent_seconds_count{outcome="ok"} 1', text)
+
+    def test_disabled_hooks_leave_engine_untouched(self):
+        engine, adapter = self.run_bot(None)
+        self.assertIs(engine.db, self.db)
+        self.assertIsInstance(engine.llm_service, MockLLMService)
+        self.assertIn("Session Ended", adapter.get_all_output())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+import io
+import json
+import os
+import sys
+import tempfile
+from contextlib import redirect_stdout
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(TEST_DIR, '..'))
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from bench import microbench
+
+
+def report(**best_us):
+    return {"benchmarks": {name: {"best_us": us} for name, us in best_us.items()}}
+
+
+class TestMicrobench(unittest.TestCase):
+
+    def test_compare_flags_regressions(self):
+        rows = microbench.compare(report(parse=100.0, transform=100.0, compile=100.0),
+                                  report(parse=125.0, transform=105.0, compile=50.0, new=1.0), threshold=0.2)
+        self.assertEqual({r["name"]: r["status"] for r in rows},
+                         {"parse": "REGRESSION", "transform": "ok", "compile": "faster"})
+
+    def test_run_saves_and_compares(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            out = os.path.join(tmp, 'bench.json')
+            with redirect_stdout(io.StringIO()):
+                status = microbench.main(['run', 'engine_steps', 'execute_sql_sqlite', 'web_adapter_roundtrip',
+                                          '--rounds', '1', '--scale', '0.01', '-o', out])
+                self.assertEqual(status, 0)
+                with open(out, encoding='utf-8') as f:
+                    results = json.load(f)["benchmarks"]
+                self.assertEqual(set(results), {'engine_steps', 'execute_sql_sqlite', 'web_adapter_roundtrip'})
+                self.assertGreater(results['engine_steps']['ops_per_s'], 0)
+
+                baseline = json.loads(json.dumps({"benchmarks": results}))
+                for r in baseline["benchmarks"].values():
+                    r["best_us"] /= 4
+                fast = os.path.join(tmp, 'fast.json')
+                with open(fast, 'w', encoding='utf-8') as f:
+                    json.dump(baseline, f)
+                self.assertEqual(microbench.main(['compare', fast, out]), 1)
+                self.assertEqual(microbench.main(['compare', out, out]), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+import unittest
+import io
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(TEST_DIR, '..'))
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from src.interpreter import RuntimeEngine, Context
+from src.session_backend import SQLiteSessionBackend, get_backend
+from src.sessions import SharedSessionManager
+from tests.test_compiler import parse_flows
+from tests.test_sessions import SCRIPT
+
+FLOWS = parse_flows(SCRIPT)
+
+
+def make_engine(adapter, bot_name, script, version):
+    if script != 'echo.bot' or version is not None: return None
+    return RuntimeEngine(FLOWS, io_adapter=adapter)
+
+
+def bot_text(msgs):
+    return [m["content"] for m in msgs if m["type"] == "bot"]
+
+
+def worker_process(db_path, uid, text):
+    # A separate web worker: advances a chat it has never seen in memory.
+    manager = SharedSessionManager(SQLiteSessionBackend(db_path), make_engine, max_workers=1)
+    manager.deliver(uid, text)
+    manager.shutdown()
+
+
+class TestSharedSessions(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'sessions.db')
+        self.workers = [SharedSessionManager(get_backend('sqlite', db_path=self.path), make_engine)
+                        for _ in range(2)]
+
+    def tearDown(self):
+        for worker in self.workers:
+            worker.shutdown()
+            worker.backend.close()
+        self.tmp.cleanup()
+
+    def wait_for(self, worker, uid, count):
+        msgs = []
+        deadline = time.monotonic() + 5
+        while len(bot_text(msgs)) < count and time.monotonic() < deadline:
+            msgs += worker.messages(uid, wait=1, interval=0.01) or []
+        return bot_text(msgs)
+
+    def test_any_worker_advances_any_chat(self):
+        a, b = self.workers
+        a.start('u1', 'echoBot', 'echo.bot')
+        self.assertEqual(self.wait_for(b, 'u1', 1), ["ready"])
+        self.assertTrue(b.deliver('u1', "hi"))
+        self.assertEqual(self.wait_for(a, 'u1', 2), ["echo hi", "ready"])
+
+        for text in ("x", "y", "z"):
+            (a if text == "y" else b).deliver('u1', text)
+        self.assertEqual(self.wait_for(a, 'u1', 6), ["echo x", "ready", "echo y", "ready", "echo z", "ready"])
+
+        _, _, context, finished, _ = a.backend.load('u1')
+        self.assertEqual((context.state, context.get_var("$msg"), finished), ('Start', "z", False))
+
+        b.deliver('u1', "bye")
+        self.assertEqual(self.wait_for(a, 'u1', 2), ["bye", "Session Ended"])
+        self.assertFalse(a.deliver('u1', "again"))
+
+    def test_chat_advanced_by_another_process(self):
+        a = self.workers[0]
+        a.start('u2', 'echoBot', 'echo.bot')
+        self.assertEqual(self.wait_for(a, 'u2', 1), ["ready"])
+        child = multiprocessing.get_context('spawn').Process(target=worker_process, args=(self.path, 'u2', "ping"))
+        child.start()
+        child.join(30)
+        self.assertEqual(child.exitcode, 0)
+        self.assertEqual(self.wait_for(a, 'u2', 2), ["echo ping", "ready"])
+
+    def test_bot_announced_once_across_steps(self):
+        a = self.workers[0]
+        out = io.StringIO()
+        with redirect_stdout(out):
+            a.start('u6', 'echoBot', 'echo.bot')
+            self.wait_for(a, 'u6', 1)
+            a.deliver('u6', "hi")
+            self.wait_for(a, 'u6', 2)
+        self.assertEqual(out.getvalue().count("--- Bot echoBot Started ---"), 1)
+
+    def test_drain_stops_when_lease_is_lost(self):
+        a = self.workers[0]
+        a.backend.create('u5', 'echo.bot', 'echoBot', Context())
+        for text in (None, "one", "two"):
+            a.backend.push_input('u5', text)
+        steps = []
+        step = a.step
+
+        def stolen(uid, text):
+            step(uid, text)
+            steps.append(text)
+            a.backend.claim(uid, 'other-worker', 60)
+        a.step = stolen
+        # Our lease expires at once, so the other worker can take the chat.
+        a.lease = -1
+        a.drain('u5')
+        self.assertEqual(steps, [None])
+        self.assertTrue(a.backend.has_input('u5'))
+
+    def test_poll_reschedules_only_orphaned_input(self):
+        a = self.workers[0]
+        a.backend.create('u9', 'echo.bot', 'echoBot', Context())
+        a.backend.push_input('u9', None)
+        scheduled = []
+        a.schedule = scheduled.append
+        self.assertTrue(a.backend.claim('u9', 'slow-worker', 60))
+        self.assertEqual(a.messages('u9', wait=0.2, interval=0.01), [])
+        self.assertEqual(scheduled, [])
+        # The slow worker died: its lease runs out and one poll takes over.
+        self.assertTrue(a.backend.claim('u9', 'slow-worker', -1))
+        self.assertEqual(a.messages('u9', wait=0.2, interval=0.01), [])
+        self.assertEqual(scheduled, ['u9'])
+
+    def test_lease_and_unknown_script(self):
+        backend = self.workers[0].backend
+        self.workers[0].start('u3', 'echoBot', 'other.bot')
+        self.assertIsNone(self.workers[0].messages('u3', wait=2, interval=0.01))
+
+        # Its saved pc belongs to another compiled version of the script.
+        self.workers[0].start('u7', 'echoBot', 'echo.bot', version='edited')
+        self.assertIsNone(self.workers[0].messages('u7', wait=2, interval=0.01))
+
+        backend.create('u4', 'echo.bot', 'echoBot', Context())
+        self.assertTrue(backend.claim('u4', 'w1', 60))
+        self.assertFalse(backend.claim('u4', 'w2', 60))
+        backend.release('u4', 'w1')
+        self.assertTrue(backend.claim('u4', 'w2', -1))
+        self.assertTrue(backend.claim('u4', 'w1', 60))
+
+    def test_backend_adds_version_column_to_old_table(self):
+        path = os.path.join(self.tmp.name, 'old.db')
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE chat_sessions (uid TEXT PRIMARY KEY, script TEXT, bot TEXT, context TEXT, "
+                     "finished INTEGER DEFAULT 0, owner TEXT, lease_until REAL DEFAULT 0, updated REAL)")
+        conn.close()
+        backend = SQLiteSessionBackend(path)
+        backend.create('u8', 'echo.bot', 'echoBot', Context(), 'v1')
+        self.assertEqual(backend.load('u8')[4], 'v1')
+        backend.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
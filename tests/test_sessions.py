@@ -0,0 +1,196 @@
+import unittest
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(TEST_DIR, '..'))
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from src.interpreter import RuntimeEngine, Context
+from src.web import WebAdapter
+from src.sessions import SessionManager, SessionStore, WorkerPool
+from tests.test_compiler import parse_flows
+
+SCRIPT = """
+bot echoBot {
+    state Start {
+        say "ready"
+        listen $msg
+        if $msg == "bye" goto End
+        say "echo $msg"
+        goto Start
+    }
+    state End {
+        say "bye"
+        exit
+    }
+}
+"""
+
+
+def bot_messages(adapter):
+    return [m["content"] for m in adapter.get_pending_messages() if m["type"] == "bot"]
+
+
+class TestSessionManager(unittest.TestCase):
+
+    def setUp(self):
+        self.flows = parse_flows(SCRIPT)
+        self.manager = SessionManager(max_workers=4)
+
+    def tearDown(self):
+        self.manager.shutdown()
+
+    def test_generator_suspends_at_listen(self):
+        adapter = WebAdapter()
+        ctx = Context()
+        gen = RuntimeEngine(self.flows, io_adapter=adapter).session('echoBot', ctx)
+        next(gen)
+        self.assertEqual((ctx.state, ctx.pc), ('Start', 1))
+        gen.send("hi")
+        self.assertEqual(bot_messages(adapter), ["ready", "echo hi", "ready"])
+
+        resumed = RuntimeEngine(self.flows, io_adapter=adapter).session('echoBot', ctx)
+        next(resumed)
+        with self.assertRaises(StopIteration):
+            resumed.send("bye")
+        self.assertEqual(bot_messages(adapter), ["bye", "Session Ended"])
+
+    def test_many_idle_sessions_share_pool(self):
+        threads_before = threading.active_count()
+        adapters = {}
+        for i in range(500):
+            adapters[i] = WebAdapter()
+            self.manager.start(i, RuntimeEngine(self.flows, io_adapter=adapters[i]), 'echoBot')
+        for i in range(500):
+            self.manager.deliver(i, f"m{i}")
+            self.manager.deliver(i, "bye")
+        self.assertLessEqual(threading.active_count(), threads_before + 4)
+        self.manager.executor.shutdown(wait=True)
+
+        self.assertEqual(self.manager.suspend_idle(0), list(range(500)))
+        self.assertEqual(len(self.manager), 0)
+        for i, adapter in adapters.items():
+            self.assertEqual(bot_messages(adapter), ["ready", f"echo m{i}", "ready", "bye", "Session Ended"])
+
+
+class TestSuspendResume(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = SessionStore(os.path.join(self.tmp.name, 'sessions.db'))
+        self.manager = SessionManager(max_workers=2, store=self.store)
+        self.flows = parse_flows(SCRIPT)
+
+    def tearDown(self):
+        self.manager.shutdown()
+        self.store.close()
+        self.tmp.cleanup()
+
+    def wait_parked(self, uid):
+        for _ in range(200):
+            session = self.manager.get(uid)
+            if session and not session.running and not session.inbox:
+                return
+            time.sleep(0.01)
+
+    def test_idle_session_round_trips_through_store(self):
+        first = WebAdapter()
+        self.manager.start('u1', RuntimeEngine(self.flows, io_adapter=first), 'echoBot', script='echo.bot')
+        self.manager.deliver('u1', "one")
+        self.wait_parked('u1')
+        self.assertEqual(self.manager.suspend_idle(3600), [])
+        self.assertEqual(self.manager.suspend_idle(0), ['u1'])
+        self.assertIsNone(self.manager.get('u1'))
+        self.assertFalse(self.manager.deliver('u1', "lost"))
+        self.assertTrue(self.store.exists('u1'))
+
+        second = WebAdapter()
+        session = self.manager.resume('u1', lambda bot: RuntimeEngine(self.flows, io_adapter=second), script='echo.bot')
+        self.assertEqual((session.context.state, session.context.pc), ('Start', 1))
+        self.assertEqual(session.context.variables['$msg'], "one")
+        self.manager.deliver('u1', "two")
+        self.wait_parked('u1')
+        # Input is re-enabled once, after the delivered message is handled.
+        self.assertEqual([m.get("content", m.get("action")) for m in second.get_pending_messages()],
+                         ["echo two", "ready", "wait_input"])
+        self.assertFalse(self.store.exists('u1'))
+
+    def test_resume_rejects_other_script(self):
+        self.store.save('u2', 'old.bot', 'echoBot', Context())
+        make_engine = lambda bot: RuntimeEngine(self.flows, io_adapter=WebAdapter())
+        self.assertIsNone(self.manager.resume('u2', make_engine, script='echo.bot'))
+        self.assertFalse(self.store.exists('u2'))
+
+    def test_resume_rejects_edited_script(self):
+        self.store.save('u3', 'echo.bot', 'echoBot', Context(), version='v1')
+        make_engine = lambda bot: RuntimeEngine(self.flows, io_adapter=WebAdapter())
+        self.assertIsNone(self.manager.resume('u3', make_engine, script='echo.bot', version='v2'))
+        self.assertFalse(self.store.exists('u3'))
+        self.store.save('u3', 'echo.bot', 'echoBot', Context(), version='v2')
+        self.assertIsNotNone(self.manager.resume('u3', make_engine, script='echo.bot', version='v2'))
+
+    def test_store_adds_version_column_to_old_table(self):
+        path = os.path.join(self.tmp.name, 'old.db')
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE suspended_sessions (uid TEXT PRIMARY KEY, script TEXT, bot TEXT, context TEXT, "
+                     "updated REAL)")
+        conn.close()
+        store = SessionStore(path)
+        store.save('u4', 'echo.bot', 'echoBot', Context(), version='v1')
+        self.assertEqual(store.load('u4')[3], 'v1')
+        store.close()
+
+
+class TestWorkerPool(unittest.TestCase):
+
+    def test_counts_tasks_waiting_for_a_worker(self):
+        pool = WorkerPool(1)
+        started, release = threading.Event(), threading.Event()
+
+        def block():
+            started.set()
+            release.wait(5)
+        futures = [pool.submit(block)]
+        started.wait(5)
+        futures += [pool.submit(time.sleep, 0) for _ in range(2)]
+        self.assertEqual(pool.queued, 2)
+        release.set()
+        for f in futures:
+            f.result(5)
+        self.assertEqual(pool.queued, 0)
+        pool.shutdown()
+
+
+class TestWebAdapterLongPoll(unittest.TestCase):
+
+    def test_wait_returns_on_send(self):
+        adapter = WebAdapter()
+        timer = threading.Timer(0.05, adapter.send, args=("hello",))
+        timer.start()
+        started = time.monotonic()
+        msgs = adapter.wait_messages(5)
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(msgs, [{"type": "bot", "content": "hello"}])
+
+    def test_close_wakes_waiting_poll(self):
+        adapter = WebAdapter()
+        timer = threading.Timer(0.05, adapter.close)
+        timer.start()
+        started = time.monotonic()
+        msgs = adapter.wait_messages(5)
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(msgs, [{"type": "system", "action": "closed"}])
+
+    def test_wait_times_out_empty(self):
+        self.assertEqual(WebAdapter().wait_messages(0.01), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
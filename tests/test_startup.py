@@ -0,0 +1,48 @@
+import unittest
+import os
+import subprocess
+import sys
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(TEST_DIR, '..'))
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from src.llm_client import LazyLLMService
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_import_main_skips_heavy_modules(self):
+        code = "import sys, main; print(sorted(m for m in ('flask', 'lark', 'zai') if m in sys.modules))"
+        out = subprocess.run([sys.executable, '-c', code], cwd=PROJECT_ROOT, capture_output=True, text=True)
+        self.assertEqual(out.stdout.strip(), '[]', out.stderr)
+
+    def test_lazy_llm_service_builds_on_first_intent(self):
+        built = []
+
+        class Service:
+            def detect_intent(self, user_input, candidates):
+                return candidates[0]
+
+        def factory():
+            built.append(1)
+            return Service()
+
+        lazy = LazyLLMService(factory)
+        self.assertEqual(built, [])
+        self.assertEqual(lazy.detect_intent("hi", ["greet"]), "greet")
+        self.assertEqual(built, [1])
+
+    def test_import_self_times_by_package(self):
+        import main
+        stderr = ("import time: self [us] | cumulative | imported package\n"
+                  "import time:       120 |        120 |     flask.json\n"
+                  "import time:        80 |        200 |   flask\n"
+                  "import time:        50 |         50 | src.loader\n")
+        self.assertEqual(main._import_self_times(stderr), {'flask': 200, 'src': 50})
+
+
+if __name__ == '__main__':
+    unittest.main()
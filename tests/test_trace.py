@@ -0,0 +1,110 @@
+import unittest
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import redirect_stdout
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(TEST_DIR, '..'))
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from bench import replay as replay_cli
+from src.db_manager import DBManager, QueryCache
+from src.interpreter import RuntimeEngine
+from src.loader import load_script
+from src.trace import TraceWriter, Tracer, load_traces, replay
+from tests.mocks import MockLLMService
+from tests import mocks
+
+SCRIPT = os.path.join(PROJECT_ROOT, 'examples', 'customer_server.bot')
+
+
+class TestTrace(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.traces = os.path.join(self.tmp, 'traces.jsonl')
+        self.flows, self.programs = load_script(SCRIPT)
+        self.db = DBManager(':memory:')
+        self.db.execute("CREATE TABLE users (phone TEXT PRIMARY KEY, name TEXT, balance REAL, data_left REAL, "
+                        "package_name TEXT, broadband_status INT)")
+        self.db.execute("INSERT INTO users VALUES ('13800138000', '测试', 100, 5, '5G', 0)")
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def record(self, *conversations, sql_cache=None):
+        writer = TraceWriter(self.traces)
+        for inputs in conversations:
+            engine = RuntimeEngine(self.flows, db_manager=self.db, io_adapter=mocks.TestAdapter(list(inputs)),
+                                   programs=self.programs, tracer=Tracer(writer, 'customer_server.bot'),
+                                   sql_cache=sql_cache)
+            engine.set_llm_service(MockLLMService())
+            engine.register_function('double', lambda x: x * 2)
+            with redirect_stdout(io.StringIO()):
+                engine.run('custBot')
+        writer.close()
+        return list(load_traces(self.traces))
+
+    def test_trace_contents(self):
+        trace, = self.record(["13800138000", "流量", "还有", "充值", "50", "没有了"])
+        kinds = {e[0] for e in trace["events"]}
+        self.assertEqual(kinds, {'s', 'i', 'o', 'q', 'n'})
+        self.assertIn(['n', '流量', ["查询话费", "充值缴费", "查询流量", "办理流量包", "宽带故障", "人工服务"],
+                       "查询流量", None], trace["events"])
+        self.assertEqual(trace["final"], 'Exit')
+        self.assertEqual([e[1] for e in trace["events"] if e[0] == 'i'],
+                         ["13800138000", "流量", "还有", "充值", "50", "没有了"])
+
+    def test_replay_matches_without_effects(self):
+        trace, = self.record(["13800138000", "查话费", "还有", "充值", "50", "没有了"])
+        self.db.execute("DELETE FROM users")
+        with redirect_stdout(io.StringIO()):
+            result = replay(self.flows, self.programs, trace)
+        self.assertTrue(result["ok"], result["divergence"])
+        self.assertEqual(result["misses"], 0)
+        self.assertEqual(len(result["turns"]), 7)
+
+    def test_cached_reads_are_recorded(self):
+        inputs = ["13800138000", "查话费", "没有了"]
+        _, second = self.record(inputs, inputs, sql_cache=QueryCache())
+        self.assertTrue(any(e[0] == 'q' for e in second["events"]))
+        with redirect_stdout(io.StringIO()):
+            result = replay(self.flows, self.programs, second)
+        self.assertTrue(result["ok"], result["divergence"])
+        self.assertEqual(result["misses"], 0)
+
+    def test_replay_detects_changed_flow(self):
+        trace, = self.record(["13800138000", "查话费", "没有了"])
+        changed = os.path.join(self.tmp, 'changed.bot')
+        with open(SCRIPT, encoding='utf-8') as f:
+            script = f.read()
+        with open(changed, 'w', encoding='utf-8') as f:
+            f.write(script.replace("您当前的账户余额为：$bal 元。", "余额：$bal 元。"))
+        flows, programs = load_script(changed)
+        with redirect_stdout(io.StringIO()):
+            result = replay(flows, programs, trace)
+        self.assertFalse(result["ok"])
+        self.assertEqual(result["divergence"]["got"], ('o', "余额：100.0 元。"))
+
+    def test_cli_replays_across_processes(self):
+        self.record(*[["13800138000", "查话费", "还有", "流量", "没有了"]] * 6)
+        out = os.path.join(self.tmp, 'report.json')
+        with redirect_stdout(io.StringIO()):
+            status = replay_cli.main([self.traces, '--script', SCRIPT, '--baseline', SCRIPT, '-j', '2',
+                                      '--chunksize', '2', '--threshold', '100', '--json', out])
+        self.assertEqual(status, 0)
+        with open(out, encoding='utf-8') as f:
+            report = json.load(f)
+        self.assertEqual((report["traces"], report["matched"]), (6, 6))
+        self.assertIn("baseline_turn_latency_us", report)
+
+
+if __name__ == '__main__':
+    unittest.main()